@@ -0,0 +1,50 @@
+# Fixed integer action space of the Engine.
+# Every action the search can take is one int, laid out in ranges by kind. The engine
+# decodes it against whatever state it is applied to, so actions carry no game objects,
+# hash and compare as ints, and travel between processes for free. Action.from_code
+# turns one back into an Action that can be played on the real Board.
+
+from state import NUM_RESOURCES, NUM_VERTICES, NUM_EDGES
+
+END_TURN = 0
+BUY_D_CARD = 1
+# + edge
+PLACE_ROAD = 2
+# + vertex
+PLACE_SETTLEMENT = PLACE_ROAD + NUM_EDGES
+# + vertex
+PLACE_CITY = PLACE_SETTLEMENT + NUM_VERTICES
+# + given * NUM_RESOURCES + received, a 4:1 trade with the bank
+EXCHANGE = PLACE_CITY + NUM_VERTICES
+# + resource
+MONOPOLY = EXCHANGE + NUM_RESOURCES * NUM_RESOURCES
+# + resource1 * NUM_RESOURCES + resource2, with resource1 <= resource2
+YEAR_OF_PLENTY = MONOPOLY + NUM_RESOURCES
+# + first * NUM_EDGES + second
+ROAD_BUILDER = YEAR_OF_PLENTY + NUM_RESOURCES * NUM_RESOURCES
+NUM_ACTIONS = ROAD_BUILDER + NUM_EDGES * NUM_EDGES
+
+# Exchange rate of EXCHANGE actions (ports are disabled in the engine)
+EXCHANGE_RATE = 4
+
+def decode(code):
+    """
+    Split an action into its kind (one of the range starts above) and its arguments.
+    """
+    if code == END_TURN or code == BUY_D_CARD:
+        return code, ()
+    if code < PLACE_SETTLEMENT:
+        return PLACE_ROAD, (code - PLACE_ROAD,)
+    if code < PLACE_CITY:
+        return PLACE_SETTLEMENT, (code - PLACE_SETTLEMENT,)
+    if code < EXCHANGE:
+        return PLACE_CITY, (code - PLACE_CITY,)
+    if code < MONOPOLY:
+        return EXCHANGE, divmod(code - EXCHANGE, NUM_RESOURCES)
+    if code < YEAR_OF_PLENTY:
+        return MONOPOLY, (code - MONOPOLY,)
+    if code < ROAD_BUILDER:
+        return YEAR_OF_PLENTY, divmod(code - YEAR_OF_PLENTY, NUM_RESOURCES)
+    if code < NUM_ACTIONS:
+        return ROAD_BUILDER, divmod(code - ROAD_BUILDER, NUM_EDGES)
+    raise ValueError(f"Action {code} is outside the action space.")
@@ -1,66 +1,126 @@
-from copy import deepcopy
 from typing import List
+import actions
 import consts
-from dice import Dice
+from engine import Action, Engine
 from player import Player, Road, Settlement
-import itertools
+from production import DICE_ODDS
+from state import GameState, NUM_PLAYERS, LONGEST_ROAD
+from rollout import RandomPolicy
+from rng import Streams, BlockRandom
+from metrics import SearchMetrics, SELECT, EXPAND_ACTIONS, EXPAND_TRANSITION, CHANCE, SIMULATE, BACKPROPAGATE
+from transposition import Stats, TranspositionTable
 import random
+import time
+from multiprocessing import Pool
 
-from draw import print_screen
-import pygame
 import math
-import sys
 import utils
 
 MCTS_ITERS = 10
+# Wall-clock budget per decision in milliseconds, None to only count iterations
+MCTS_TIME_BUDGET = None
+# Parallel search: 'root' has every worker build its own tree within the budget,
+# 'tree' grows one tree within the budget with rollouts spread over the workers
+MCTS_WORKERS = 1
+MCTS_PARALLEL = 'root'
+# Value taken off every node on a path while its rollout is in flight (tree parallelism)
+VIRTUAL_LOSS = 2.0
+# Rollouts every worker plays per wave of a tree-parallel search. They go to it as one
+# job, a rollout alone costs less than the round trip to the pool.
+WAVE_ROLLOUTS = 8
+# Seconds between two on_progress calls of a search
+PROGRESS_INTERVAL = 0.1
 SIMULATE_DEPTH = 2
-NEXT_PLAYER_SIM_ITERS = 2
+# Progressive widening of the other players' turns: a chance node visited n times keeps up
+# to WIDENING_C * n ** WIDENING_ALPHA distinct sampled outcomes, and replays those otherwise
+WIDENING_C = 1.0
+WIDENING_ALPHA = 0.5
+
+# Chance node kinds: the card drawn by buy_dcard, the other players' turns after our
+# end_turn, and the dice roll that starts our next turn
+CARD = 1
+OPPONENTS = 2
+DICE = 3
 
 # Note some of the MCTS related code was inspired by https://ai-boson.github.io/mcts/ (mostly once we had an initial version and then had to fix hideous insects)
 
 class Node():
     """A lightweight tree node used only by Agent.mcts()."""
-    __slots__ = ("board", "players", "player_turn",
-                "parent", "action_taken",
-                "children", "visits", "value", "untried_actions") # Use __slots__ to save on memory
+    __slots__ = ("parent", "action_taken", "chance", "outcomes", "terminal",
+                "children", "stats", "table", "key", "untried_actions") # Use __slots__ to save on memory
 
     
-    def __init__(self, board, players, parent=None, action_taken=None):
-        self.board = board
-        self.players: List[Player] = players #make sure passed in player is deep copied
+    def __init__(self, engine, parent=None, action_taken=None, table=None, chance=None):
+        """
+        Nodes do not store a game state. The search walks one Engine down the tree and
+        back up again, and `engine` must currently hold the state this node stands for.
+        The root is given the search's TranspositionTable, the other nodes use their parent's.
+
+        A chance node (chance is CARD, OPPONENTS or DICE) stands for the state right before
+        a random outcome, its children are the outcomes drawn so far (with no action_taken).
+        """
         self.parent: Node = parent # Parent node 
-        self.action_taken: Action = action_taken # action taken to get to this node
+        self.action_taken: int = action_taken # action taken to get to this node (see actions.py)
+        self.chance = chance
+        # Chance nodes: outcome -> [child, weight, outcome], the weight being the outcome's
+        # probability (cards, dice) or how often it was sampled (the other players' turns)
+        self.outcomes = {} if chance else None
         self.children: List[Node] = []
-        self.visits = 0
-        self.value  = 0.0          # Cumulative reward
+        self.table = table if parent is None else parent.table
+        if chance:
+            # Same state as the parent, so a chance node keeps statistics of its own
+            self.key = None
+            self.stats = Stats()
+        else:
+            # Visits and cumulative reward, shared with every node that reaches the same state
+            self.key = engine.hash
+            self.stats = self.table.lookup(self.key)
 
-        self.untried_actions = self.players[0].getPossibleActions(
-                                        self.board, self.players)
+        self.terminal = engine.state.winner() is not None
+        # Generated on the first expansion, most nodes are leaves that never get there
+        self.untried_actions = None
 
     def __str__(self):
-        return f"Node(board={self.board}, players={self.players}, action_taken={self.action_taken}, visits={self.visits}, value={self.value}, untried_actions={self.untried_actions}, children={len(self.children)})"
+        return f"Node(action_taken={self.action_taken}, chance={self.chance}, visits={self.stats.visits}, value={self.stats.value}, untried_actions={self.untried_actions}, children={len(self.children)})"
     
     def __repr__(self):
         return self.__str__()
 
     def is_terminal(self) -> bool:
-        return utils.get_winner(self.players) is not None
+        return self.terminal
     
     def is_fully_expanded(self) -> bool:
         """
         Check if all possible actions have been tried from this node.
+        (a node that was never expanded has at least end_turn left)
         """
-        return len(self.untried_actions) == 0
+        return self.untried_actions is not None and len(self.untried_actions) == 0
     
+    def mean(self) -> float:
+        """
+        Value estimate of the node: its mean reward, or for a chance node the mean of its
+        visited outcomes weighted by their probabilities.
+        """
+        if self.chance:
+            total = weights = 0.0
+            for child, weight, _ in self.outcomes.values():
+                if child.stats.visits:
+                    total += weight * child.mean()
+                    weights += weight
+            if weights:
+                return total / weights
+        return self.stats.value / self.stats.visits
+
     def calculate_ucb(self, c: float) -> float:
         """
         Selection criteria for selecting next node. selects next node based on Upper-Confidence Bound
-        (parent.visits is always ≥ this node's visits)
+        (the parent has been visited, but a shared child can have more visits than it)
         """
-        if self.visits == 0:
+        stats = self.stats
+        if stats.visits == 0:
             return float("inf")
-        return (self.value / self.visits) + \
-                c * math.sqrt(math.log(self.parent.visits) / self.visits)
+        return self.mean() + \
+                c * math.sqrt(math.log(self.parent.stats.visits) / stats.visits)
     
     def best_child(self, c: float = 1.0):
         """
@@ -77,82 +137,158 @@ class Node():
         
         return bestchild 
     
-    def expand(self):
+    def expand(self, engine, agent):
         """
-        Pop one untried action, build successor state, return new node 
+        Pop one untried action, apply it to the search state, return new node 
+        (a chance node for a random action, which is applied when an outcome is drawn)
         """
 
-        # Randomly select an action from the untried actions, remove it from the list
-        a = random.choice(self.untried_actions)
-        self.untried_actions.remove(a)
-
-        current_player: Agent = self.players[0]
-        next_board, next_player = current_player.stateActionTransition(deepcopy(self.board), deepcopy(current_player), deepcopy(self.players), a)
-
-        next_players = deepcopy(self.players)
-        next_players[0] = deepcopy(next_player)
+        metrics = agent.metrics
+        # The engine holds this node's state here, so its actions can be listed now
+        if self.untried_actions is None:
+            if metrics is not None:
+                since = time.perf_counter()
+            self.untried_actions = engine.legal_actions()
+            if metrics is not None:
+                metrics.add(EXPAND_ACTIONS, since)
 
-        child = Node(next_board, next_players, self, a)
+        # Randomly select an action from the untried actions, remove it from the list
+        untried = self.untried_actions
+        i = (agent.rng or random).randrange(len(untried))
+        a = untried[i]
+        untried[i] = untried[-1]
+        untried.pop()
+
+        if a == actions.END_TURN:
+            child = Node(engine, self, a, chance=OPPONENTS)
+        elif a == actions.BUY_D_CARD:
+            child = Node(engine, self, a, chance=CARD)
+        else:
+            if metrics is not None:
+                since = time.perf_counter()
+            engine.apply(a)
+            child = Node(engine, self, a)
+            if metrics is not None:
+                metrics.add(EXPAND_TRANSITION, since)
 
         self.children.append(child)
         return child 
+
+    def descend(self, engine, agent):
+        """
+        Draw an outcome of this chance node and apply it to the search state. Returns the
+        child for the outcome and whether it was just created.
+        """
+        if self.chance == OPPONENTS:
+            if len(self.outcomes) < math.ceil(WIDENING_C * (self.stats.visits + 1) ** WIDENING_ALPHA):
+                # Sample new turns of the other players, every sample is kept as an outcome
+                agent.rollout_policy.play_others(engine, roll=False)
+                entry = self.outcomes.get(engine.hash)
+                if entry is not None:
+                    entry[1] += 1
+                    return entry[0], False
+                if engine.state.winner() is not None:
+                    child = Node(engine, self)
+                else:
+                    child = Node(engine, self, chance=DICE)
+                self.outcomes[engine.hash] = [child, 1, engine.state.clone()]
+                self.children.append(child)
+                return child, True
+            # Replay one of the sampled turns, as often as it came up
+            entries = list(self.outcomes.values())
+            child, _, state = (agent.rng or random).choices(entries, weights=[entry[1] for entry in entries], k=1)[0]
+            engine.load(state)
+            return child, False
+
+        # Cards and dice are drawn with their exact probabilities
+        if self.chance == CARD:
+            deck = engine.state.deck
+            odds = [(card, count / sum(deck)) for card, count in enumerate(deck) if count]
+        else:
+            odds = DICE_ODDS
+        outcome, probability = (agent.rng or random).choices(odds, weights=[p for _, p in odds], k=1)[0]
+        if self.chance == CARD:
+            engine.buy_dcard(outcome)
+        else:
+            engine.roll(outcome)
+        entry = self.outcomes.get(outcome)
+        if entry is not None:
+            return entry[0], False
+        child = Node(engine, self)
+        self.outcomes[outcome] = [child, probability, outcome]
+        self.children.append(child)
+        return child, True
     
-    def simulate(self, depth: int = SIMULATE_DEPTH):
+    @staticmethod
+    def simulate(engine, agent, depth: int = SIMULATE_DEPTH):
         """
-        Simulate a random playout from this node to a terminal state or depth limit.
+        Simulate a random playout from the engine's state to a terminal state or depth limit.
+        The playout is undone afterwards, leaving the engine at the state it started from.
         """
-        board = deepcopy(self.board)
-        players = deepcopy(self.players)
-        player_turn = 0
-        while not utils.get_winner(players) and (depth := depth - 1) > 0:
+        start = engine.depth()
+        player_turn = agent.number - 1
+        while engine.state.winner() is None and (depth := depth - 1) > 0:
             # Randomly select an action from possible actions
-            actions = players[player_turn].getPossibleActions(board, players)
-            action = random.choice(actions)
+            action = (agent.rng or random).choice(engine.legal_actions())
 
-            # Simulate the action and get the new board and player state
-            board, player = players[player_turn].stateActionTransition(board, players[player_turn], players, action)
-            
-            # Update the player to the "new" player
-            players[player_turn] = player
+            # Simulate the action on the search state
+            agent.stateActionTransition(engine, action)
+
+        state = engine.state
 
         def calculate_player_points(num):
-            # Calculate the player's points
-            points = players[num].points
+            # Calculate the player's points, including their point cards
+            points = state.victory_points(num)
 
             # Check if the player has a longest road
-            if players[num].longest_road:
+            if state.flags[num] & LONGEST_ROAD:
                 points += 2
 
-            # Check if the player has any development cards
-            points += len([card for card in players[num].d_cards if card.label == 'Point'])
-
             return points
 
         # Calculate agent's points
         points = calculate_player_points(player_turn)
 
         # Calculate the best other player's points
-        max_other = max(calculate_player_points(i+1) for i in range(len(players[1:])))
+        max_other = max(calculate_player_points(i) for i in range(NUM_PLAYERS) if i != player_turn)
 
         # If agent wins, add 10 points
-        if utils.get_winner(players).number == 1:
+        if state.winner() == player_turn:
             points += 10
 
+        # Walk the search state back to this node
+        engine.undo_to(start)
+
         # Calculate the difference between the agent's points and the best other player's points
         # Positive value means agent is winning, negative value means agent is losing
         return points - max_other
 
-    def select(self):
+    def select(self, engine, agent):
         """
         Select a node from the tree using UCB.
         """
         # Traverse the tree until we reach a leaf node
+        metrics = agent.metrics
         current_node = self
         while not current_node.is_terminal():
-            if not current_node.is_fully_expanded():
-                return current_node.expand()
+            if current_node.chance:
+                # Draw an outcome, a new one is the leaf (a new chance node draws again first)
+                if metrics is not None:
+                    since = time.perf_counter()
+                current_node, new = current_node.descend(engine, agent)
+                if metrics is not None:
+                    metrics.add(CHANCE, since)
+                if new and not current_node.chance:
+                    return current_node
+            elif not current_node.is_fully_expanded():
+                current_node = current_node.expand(engine, agent)
+                if not current_node.chance:
+                    return current_node
             else:
                 current_node = current_node.best_child()
+                # Replay the child's action on the search state, a chance node applies its action with the outcome
+                if not current_node.chance:
+                    engine.apply(current_node.action_taken)
         return current_node
     
     def print_tree(self, depth=0):
@@ -168,82 +304,300 @@ class Node():
 # - [ ] Write function buildSuccessorState(board, player, action) to build out the next state based on the player, board and action given 
 # - [ ] Write function stateTransition_simulation(board, player) to simulate out one full turn after the ai player ends their turn to help with enumerating possible states to sample from  
 
-class Action():
-    """
-        Possible names: 
-        place_road 
-        place_settlement
-        place_city
-        buy_dcard 
-        play_yop 
-        # play_knight 
-        play_monopoly
-        play_roadbuilder 
-        make_exchange
-        end_turn 
-    """
-    def __init__(self, name, function=None, args={}):
-        self.name = name
-        self.function = function # function to call when action is taken
-        self.args = args # args as a dictionary of arguments to pass to the function
-
-    def do_action(self, player=None):
-        # If player is not None and not already set in args, set the player in the args
-        if player is not None and "player" not in self.args:
-            self.args["player"] = player
-
-        if self.function is not None:
-            return self.function(**self.args)
-        else:
-            raise ValueError("No function to call for action")
-        
-    def __str__(self):
-        return f"Action(name={self.name})"
-    
-    def __repr__(self):
-        return self.__str__()
-
 class Agent(Player):
+    def __init__(self, number, iterations=MCTS_ITERS, workers=MCTS_WORKERS, parallel=MCTS_PARALLEL,
+                 time_budget=MCTS_TIME_BUDGET, rng=None, on_search=None, early_stop=True):
+        super().__init__(number, rng)
+        # Search budget: iterations per tree and/or milliseconds per decision (None for no limit),
+        # and how many workers search in parallel ('root' or 'tree')
+        self.iterations = iterations
+        self.time_budget = time_budget
+        # Whether a search stops before its budget is spent once its leading move is settled
+        self.early_stop = early_stop
+        self.workers = workers
+        self.parallel = parallel
+        # Subtree of the action picked by the last search, reused when its state comes up again
+        self.tree = None
+        # Plays the other players' turns when the search samples what follows our end_turn
+        self.rollout_policy = RandomPolicy(rng)
+        # Called with the SearchMetrics of every decision (see metrics.py), None to not record
+        # any. self.metrics is the one being recorded while a search runs.
+        self.on_search = on_search
+        self.metrics = None
+        # Called as on_progress(iterations, best action code) while a search runs, every
+        # PROGRESS_INTERVAL seconds, and an Event that makes the search answer with its
+        # best move so far once set (None for either to go without)
+        self.on_progress = None
+        self.answer_now = None
+        # BackgroundSearch running our searches in a worker process (see background.py)
+        self.background = None
+
+    def __getstate__(self):
+        # Copies and worker processes record into self.metrics, only this agent reports it.
+        # The hooks belong to this process, and its Event and executor cannot be pickled.
+        # The reused subtree only serves this agent's next search, and would take its whole
+        # transposition table along into every copy.
+        state = self.__dict__.copy()
+        state['tree'] = None
+        state['on_search'] = None
+        state['on_progress'] = None
+        state['answer_now'] = None
+        state['background'] = None
+        return state
+
+    def set_rng(self, rng):
+        """
+        Search, play out and make random picks with `rng` from now on (a random.Random,
+        or None for the global random module).
+        """
+        self.rng = rng
+        self.rollout_policy.set_rng(rng)
+
     def backpropagate(self, result: float, node: Node):
         while node is not None:
-            node.visits += 1
-            node.value += result
+            node.stats.visits += 1
+            node.stats.value += result
             node = node.parent
 
-    def mcts(self, board, players):
-        root = Node(board, players)
-        leaf = root
-        
-        for _ in range(MCTS_ITERS):
+    def add_virtual_loss(self, node: Node, sign: int = 1):
+        # Count a visit that lost VIRTUAL_LOSS on the path to node, sign=-1 takes it back
+        while node is not None:
+            node.stats.visits += sign
+            node.stats.value -= sign * VIRTUAL_LOSS
+            node = node.parent
+
+    def mcts(self, board, players, time_budget=None, iterations=None):
+        """
+        Pick an action by searching within a budget of `time_budget` milliseconds and/or
+        `iterations` iterations (each adds at most one node), the agent's own budget where
+        not given. The search stops early once its leading move is settled, and returns the
+        best move found so far when the budget runs out.
+        """
+        time_budget = self.time_budget if time_budget is None else time_budget
+        iterations = self.iterations if iterations is None else iterations
+        if time_budget is None and iterations is None:
+            raise ValueError("MCTS needs a time budget or an iteration budget")
+        metrics = self.metrics = None if self.on_search is None else SearchMetrics(self.number)
+        deadline = None if time_budget is None else time.perf_counter() + time_budget / 1000.0
+        if self.workers > 1 and self.parallel == 'root':
+            self.tree = None
+            code = self.parallel_mcts(board, players, iterations, deadline)
+        else:
+            if self.workers > 1:
+                root = self.tree_parallel_search(board, players, iterations, deadline)
+            else:
+                root = self.search(board, players, iterations, deadline)
+            if metrics is not None:
+                metrics.measure(root)
+            # Select the best child of the root node, and keep only its subtree for the next search
+            best = root.best_child(0.0)
+            best.parent = None
+            self.tree = best
+            code = best.action_taken
+        if metrics is not None:
+            self.metrics = None
+            metrics.finish(code)
+            self.on_search(metrics)
+        return Action.from_code(code)
+
+    def reuse_tree(self, engine):
+        """
+        Take the node of the stored subtree that stands for the engine's state as the new
+        root, or None if the game went somewhere the tree did not. The rest of the stored
+        tree is dropped either way.
+        """
+        nodes = [self.tree] if self.tree is not None else []
+        self.tree = None
+        while nodes:
+            node = nodes.pop()
+            if node.key == engine.hash:
+                node.parent = None
+                return node
+            nodes.extend(node.children)
+        return None
+
+    def parallel_mcts(self, board, players, iterations, deadline):
+        """
+        Root-parallel search: every worker builds its own tree from this position with its
+        own seed until `deadline` (a time.perf_counter() time, None for no limit), and the
+        root children's visits and values are summed per action before the best action
+        (highest mean value) is picked. Returns its action code. The workers' trees are
+        not kept, so a root-parallel agent never reuses a subtree in its next search.
+        """
+        seeds = [(self.rng or random).getrandbits(32) for _ in range(self.workers)]
+        # The deadline is set before the jobs are sent, so sending them counts against the
+        # budget. perf_counter is a system-wide clock, the workers compare against it as is.
+        jobs = [(board, players, self.number, iterations, deadline, seed) for seed in seeds]
+        visits = {}
+        values = {}
+        for children, metrics in _pool(self.workers).map(_search_worker, jobs):
+            if metrics is not None:
+                self.metrics.merge(metrics)
+            for key, child_visits, child_value in children:
+                visits[key] = visits.get(key, 0) + child_visits
+                values[key] = values.get(key, 0.0) + child_value
+        return max(visits, key=lambda key: values[key] / visits[key])
+
+    def report_progress(self, root, done, reported):
+        """
+        Call on_progress if PROGRESS_INTERVAL has passed since `reported`, and return when
+        progress was last reported.
+        """
+        now = time.perf_counter()
+        if now - reported < PROGRESS_INTERVAL or not root.children:
+            return reported
+        self.on_progress(done, root.best_child(0.0).action_taken)
+        return now
+
+    def stop_search(self, root, done, iterations, deadline, start):
+        """
+        Whether a search that has run `done` iterations since `start` should stop: its
+        iterations or its time (until `deadline`) are spent, or no other root child can
+        overtake the leader in visits with the iterations left, the leader also having the
+        best mean value (unless early_stop is off), or answer_now is set. The first
+        iteration always runs, so there is a move to return.
+        """
+        if done == 0:
+            return False
+        if self.answer_now is not None and self.answer_now.is_set():
+            return True
+        remaining = float("inf") if iterations is None else iterations - done
+        if deadline is not None:
+            now = time.perf_counter()
+            if now >= deadline:
+                return True
+            # Iterations that still fit before the deadline at the rate so far
+            remaining = min(remaining, (deadline - now) * done / (now - start))
+        if remaining <= 0:
+            return True
+
+        # An untried action could still turn out best
+        if not self.early_stop or not root.is_fully_expanded():
+            return False
+        visits = sorted((child.stats.visits for child in root.children), reverse=True)
+        leader = root.best_child(0.0)
+        return leader.stats.visits == visits[0] and (len(visits) == 1 or visits[0] - visits[1] > remaining)
+
+    def search(self, board, players, iterations=None, deadline=None):
+        """
+        Search from the current position, on top of the previous search's tree if it
+        reached this position, until `iterations` iterations are done or the clock reaches
+        `deadline` (see stop_search), and return the root.
+        """
+        # The search walks one GameState down the tree and back up through the engine
+        engine = Engine(GameState.from_game(board, players, self.number - 1), self.rng)
+        root = self.reuse_tree(engine)
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.reuse(root)
+        root = root or Node(engine, table=TranspositionTable())
+
+        start = reported = time.perf_counter()
+        done = 0
+        while not self.stop_search(root, done, iterations, deadline, start):
+            if self.on_progress is not None:
+                reported = self.report_progress(root, done, reported)
+            if metrics is not None:
+                now = time.perf_counter()
             # leaf <-- select(tree)
             #     Note that this also expands the tree when it finds a node that is not fully expanded
-            leaf = leaf.select()
+            leaf = root.select(engine, self)
+            if metrics is not None:
+                now = metrics.add(SELECT, now)
             # result <-- simulate(child)
-            result = leaf.simulate()
+            result = leaf.simulate(engine, self)
+            if metrics is not None:
+                now = metrics.add(SIMULATE, now)
             # backpropagate(result, child)
             self.backpropagate(result, leaf)
+            # Undo the actions select applied to get back to the root state
+            engine.undo_to(0)
+            if metrics is not None:
+                metrics.add(BACKPROPAGATE, now)
+            done += 1
+
+        return root
 
-        # Select the best child of the root node
-        return root.best_child(0.0).action_taken
+    def tree_parallel_search(self, board, players, iterations=None, deadline=None):
+        """
+        Like search, but rollouts run in the worker pool. Selection and expansion stay
+        here: every wave selects WAVE_ROLLOUTS leaves per worker, putting a virtual loss
+        on each path so the next selection in the wave looks elsewhere, and once the
+        wave's rollouts are back the virtual losses are replaced by the real results.
+        """
+        engine = Engine(GameState.from_game(board, players, self.number - 1), self.rng)
+        root = self.reuse_tree(engine)
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.reuse(root)
+        root = root or Node(engine, table=TranspositionTable())
+        pool = _pool(self.workers)
+        # Rollout workers draw from streams batched like ours
+        batched = isinstance(self.rng, BlockRandom)
+
+        start = reported = time.perf_counter()
+        done = 0
+        while not self.stop_search(root, done, iterations, deadline, start):
+            if self.on_progress is not None:
+                reported = self.report_progress(root, done, reported)
+            leaves = []
+            states = []
+            wave = self.workers * WAVE_ROLLOUTS
+            for _ in range(wave if iterations is None else min(wave, iterations - done)):
+                if metrics is not None:
+                    now = time.perf_counter()
+                leaf = root.select(engine, self)
+                self.add_virtual_loss(leaf)
+                leaves.append(leaf)
+                states.append(engine.state.clone())
+                engine.undo_to(0)
+                if metrics is not None:
+                    metrics.add(SELECT, now)
+
+            # One job per worker: its share of the leaf states and a seed for their rollouts
+            jobs = [
+                    (self.number, states[i:i + WAVE_ROLLOUTS], (self.rng or random).getrandbits(32), batched)
+                    for i in range(0, len(states), WAVE_ROLLOUTS)
+            ]
+            if metrics is not None:
+                now = time.perf_counter()
+            results = [result for chunk in pool.map(_rollout_worker, jobs) for result in chunk]
+            if metrics is not None:
+                # The wave's wall time, its rollouts run side by side
+                now = metrics.add(SIMULATE, now, len(leaves))
+            for leaf, result in zip(leaves, results):
+                self.add_virtual_loss(leaf, -1)
+                self.backpropagate(result, leaf)
+            if metrics is not None:
+                metrics.add(BACKPROPAGATE, now, len(leaves))
+            done += len(leaves)
+
+        return root
     
-    def play_turn(self, board, players, simulate=False):
+    def play_turn(self, board, players, simulate=False, move_times=None, verbose=False):
         # Copy the board and players to avoid modifying the original state
         # board = deepcopy(board)
         # players = deepcopy(players)
 
         action = None
 
-        while action is None or action.name != "end_turn":
+        # Stop once the turn is over or our last action won the game
+        while (action is None or action.name != "end_turn") and utils.get_winner(players) is None:
             # Get the possible actions for the player
             possible_actions = self.getPossibleActions(board, players)
-            print("possible_actions", possible_actions) if len(possible_actions) > 1 else None
+            if verbose and len(possible_actions) > 1:
+                print("possible_actions", possible_actions)
 
-            # Pick an action from the possible actions
+            # Pick an action from the possible actions, timing the decision if asked to
+            picked = time.perf_counter()
             action = self.pick_option(possible_actions, board, players, simulate)
+            if move_times is not None:
+                move_times.append((self.number, time.perf_counter() - picked))
             # Perform the action
-            action.do_action(self)
+            action.do_action(self, board, players)
 
-            print("\taction", action) if len(possible_actions) > 1 else None
+            if verbose and len(possible_actions) > 1:
+                print("\taction", action)
 
             # Replace the player in the players list with the updated player
             players[self.number - 1] = self
@@ -253,13 +607,15 @@ class Agent(Player):
 
     def pick_option(self, options, board, players, simulate=False):
         if simulate:
-            return random.choice(options)
+            return (self.rng or random).choice(options)
 
         # If only one option, return that option (like end turn, etc.)
         if len(options) == 1:
             return options[0]
         
         # She Monte on my Carlo til I Tree Search 
+        if self.background is not None:
+            return self.background.mcts(board, players)
         action = self.mcts(board, players)
         return action
     
@@ -273,15 +629,16 @@ class Agent(Player):
     def place_settlement(self, board, first, position=None, player=None):
         player = self if player is None else player
         if position is None:
-            choices = [num for num,pos in consts.SettlementPositions.items() if player.can_place_settlement(board, num, first)]
-            choice = random.choice(choices)
+            choice = (self.rng or random).choice(player.settlement_choices(board, first))
         else:
-            # Find settlement position and ensure they can place settlement
-            choice = [num for num,pos in consts.SettlementPositions.items() if player.can_place_settlement(board, num, first) and pos == position][0]
+            # position is the settlement number, ensure they can place settlement
+            if not player.can_place_settlement(board, position, first):
+                raise ValueError(f"Cannot place a settlement at {position}.")
+            choice = position
 
         # Create settlement object and add to board
         settlement = Settlement(player, choice)
-        board.settlements.append(settlement)
+        board.add_settlement(settlement)
         player.settlements_left -= 1
         player.points += 1
         return settlement
@@ -289,27 +646,15 @@ class Agent(Player):
     def place_road(self, board, settlement=None, position=None, player=None):
         player = self if player is None else player
         if position is None:
-            choices = []
-            for num,pos in consts.RoadMidpoints.items():
-                if pos not in [(road.start, road.end) for road in board.roads ]:
-                        road = Road(player, num)
-                        if settlement:
-                            if road.start == settlement.position or road.end == settlement.position:
-                                choices.append(road)
-                        else:
-
-                            roads_owned = [r for r in board.roads if r.color == player.color]
-                            for test_r in roads_owned:
-                                if road.start == test_r.start or test_r.end == road.end or road.start == test_r.end or road.end == test_r.start:
-                                    choices.append(road)
-                                    break
+            choices = player.road_choices(board, settlement)
 
             # Randomly select a road from the available choices
-            road = random.choice(choices)
+            road = Road(player, (self.rng or random).choice(choices))
         else:
-            road = position
+            # position is the road number
+            road = Road(player, position)
 
-        board.roads.append(road)
+        board.add_road(road)
         player.roads_left -= 1
         if player.roads_left <= 15 - 5:
             board.check_longest_road(player)
@@ -319,12 +664,15 @@ class Agent(Player):
         if settlement is None:
             # Find a settlement to upgrade to a city
             choices = [settlement for settlement in board.settlements if settlement.player == player and settlement.city == False]
-            settlement = random.choice(choices)
-        settlement.make_city()
+            settlement = (self.rng or random).choice(choices)
+        else:
+            # settlement is the settlement number
+            settlement = [s for s in board.settlements if s.number == settlement][0]
+        board.make_city(settlement)
 
     def play_yop(self, board, resource1, resource2, card, player=None):
         player = self if player is None else player
-        player.play_d_card(card)
+        player.play_d_card(self.find_d_card(player, card))
 
         if resource1 in player.hand:
             player.hand[resource1] += 1
@@ -338,7 +686,7 @@ class Agent(Player):
     
     def play_monopoly(self, board, players, resourceType, card, player=None):
         p = self if player is None else player
-        p.play_d_card(card)
+        p.play_d_card(self.find_d_card(p, card))
 
         # Collect all resources of a type from other players 
         for player in players:
@@ -348,15 +696,19 @@ class Agent(Player):
                     p.hand[resourceType] += amount_to_take
                     player.hand[resourceType] = 0
         
-    def play_roadbuilder(self, board, card, settle1, settle2, pos1, pos2, player=None):
+    def play_roadbuilder(self, board, card, pos1, pos2, player=None):
         player = self if player is None else player
 
-        # Note that pos1 and pos2 are actual Roads, not positions
-        player.play_d_card(card)
+        # Note that pos1 and pos2 are road numbers
+        player.play_d_card(self.find_d_card(player, card))
 
         # Allows player to place two free roads 
-        player.place_road(board, settle1, pos1)
-        player.place_road(board, settle2, pos2)
+        self.place_road(board, None, pos1, player)
+        self.place_road(board, None, pos2, player)
+
+    # Find the card with the given label in the player's playable cards
+    def find_d_card(self, player, label):
+        return [card for card in player.d_cards if card.label == label][0]
             
     def end_turn(self, player=None):
         player = self if player is None else player
@@ -366,277 +718,59 @@ class Agent(Player):
 
     # List(Actions) 
     def getPossibleActions(self, board, players):
-        player = self
-        # empty list to collect all possible actions
-        list_of_actions = []
-
-        # Use get_possible_purchases to get an idea of what purchases are available (road, city, settlement, dcard)
-        possible_purchases = utils.get_possible_purchases(self, board, players, cancel=False)
-
-        for purchase in possible_purchases:
-            if purchase['label'] == 'city': # If we buy a city, upgrade the settlement
-                for boardSettlement in board.settlements:
-                    if boardSettlement.player == self and not boardSettlement.city:
-                        # player = deepcopy(self)
-                        list_of_actions.append(Action("place_city", args={"board": board, "settlement": boardSettlement}, function=player.place_city))
-            elif purchase['label'] == 'settlement': # If we buy a settlement, check if we can place a settlement
-                for settlementPos in consts.SettlementPositions:
-                    if self.can_place_settlement(board, settlementPos, False):
-                        # player = deepcopy(self)
-                        list_of_actions.append(Action("place_settlement", args={"board": board, "first": False, "position": settlementPos}, function=player.place_settlement))
-            elif purchase['label'] == 'road':
-
-                # TODO: need to figure out how to establish whether there is a spot to put a road. the get_possible_purchases call above already accounts for whether the player has the resources to build a road, but it does not account for whether there is a spot to put the road (Note: this is probably a very very rare condition where you get "boxed in" by other players roads)
-
-                roads = [(road.start, road.end) for road in board.roads ]
-                for num,pos in consts.RoadMidpoints.items():
-                    if pos not in roads:
-                        road = Road(self, num)
-                        roads_owned = [r for r in board.roads if r.color == self.color]
-                        for test_r in roads_owned:
-                            if road.start == test_r.start or test_r.end == road.end or road.start == test_r.end or road.end == test_r.start:
-                                # action: place a road Road(aiPlayer, num)
-                                # player = deepcopy(self)
-                                list_of_actions.append(Action("place_road", args={"board": board, "settlement": None, "position": road}, function=player.place_road))
-            elif purchase['label'] == 'd_card' and len(board.d_cards) > 0:
-                # player = deepcopy(self)
-                list_of_actions.append(Action("buy_dcard", args={"board": board}, function=player.pick_d_card))
-
-        # Get possible exchanges the player can make
-        exchanges = []
-        settlements = [settlement for settlement in board.settlements if settlement.player == player]
-        ports = [consts.Ports.get(settlement.number) for settlement in settlements if consts.Ports.get(settlement.number)]
-        for resource in player.hand:
-            if player.hand[resource] >= 2:
-                if player.has_port(ports, resource):
-                    exchanges.extend([Action("make_exchange", args={"r1": resource, "amt1": -2, "r2": r, "amt2": 1}, function=player.exchange) for r in player.hand])
-                    break
-            if player.hand[resource] >= 3:
-                if self.has_port(ports):
-                    exchanges.extend([Action("make_exchange", args={"r1": resource, "amt1": -3, "r2": r, "amt2": 1}, function=player.exchange) for r in player.hand])
-                    break
-            if player.hand[resource] >= 4:
-                    exchanges.extend([Action("make_exchange", args={"r1": resource, "amt1": -4, "r2": r, "amt2": 1}, function=player.exchange) for r in player.hand])
-        # if there are exchanges to make, add them to the list of actions
-        if len(exchanges) > 0:
-            list_of_actions.extend(exchanges)
-
-        # Get possible development cards the player has in their hand to play
-        # Note: cards in player.d_cards are valid cards to play (i.e. they were not bought on the current turn)
-        # cards in player.d_cards_queue are cards that were bought this turn so they cannot be played until next turn
-        # point cards cannot be played
-        unique_player_dcards = set([card for card in self.d_cards if card.label != 'Point'])
-                
-        card_actions = [] 
-        for card in unique_player_dcards:
-            # Monopoly cards let you take all resources of a certain kind from all players
-            if card.label == "Monopoly":
-                # possible Monopoly actions are to select one of the four resource types to take
-                for resource in consts.ResourceMap:
-                    # player = deepcopy(self)
-                    card_actions.append(Action("play_monopoly", args={"resourceType": resource, "card": card, "players": players}, function=player.play_monopoly))
-
-            elif card.label == "Road Builder":
-                # TODO: Possibly make this more efficient. I was lazy and did it naively
-                # temporary board and aiPlayer to simulate different first road placements
-                temp_board = deepcopy(board)
-                temp_player = deepcopy(self)
-                # simulate placing first of two roads
-                roads1 = [(road.start, road.end) for road in board.roads ]
-                for num,pos in consts.RoadMidpoints.items():
-                    if pos not in roads1:
-                        road1 = Road(self, num)
-                        roads_owned1 = [r for r in board.roads if r.color == self.color]
-                        for test_r1 in roads_owned1:
-                            if road1.start == test_r1.start or test_r1.end == road1.end or road1.start == test_r1.end or road1.end == test_r1.start:
-                                temp_player.place_road(temp_board, road1, road1)
-                                
-                                
-                                # Now from this point simulate placing a second road
-                                roads2 = [(road.start, road.end) for road in temp_board.roads ]
-                                for num,pos in consts.RoadMidpoints.items():
-                                    if pos not in roads2:
-                                        road2 = Road(temp_player, num)
-                                        roads_owned2 = [r for r in board.roads if r.color == temp_player.color]
-                                        for test_r2 in roads_owned2:
-                                            if road2.start == test_r2.start or test_r2.end == road2.end or road2.start == test_r2.end or road2.end == test_r2.start:    
-                                                # player = deepcopy(self)
-                                                card_actions.append(Action("play_roadbuilder", args={"card": card, "settle1": road1, "settle2": road2, "pos1": road1, "pos2": road2}, function=player.play_roadbuilder))
-
-
-            # Year Of Plenty card lets you get any 2 resources for free
-            elif card.label == "Year Of Plenty":
-                # get all possible unique combos of 2 resources
-                resource_combos = list(itertools.combinations_with_replacement(consts.ResourceMap, 2))
-                for combo in resource_combos:
-                    # player = deepcopy(self)
-                    card_actions.append(Action("play_yop", args={"resource1": combo[0], "resource2": combo[1], "card": card}, function=player.play_yop))
-
-        # if there are cards to play and the agent has not already played a card this round, add all possible card actions
-        if len(card_actions) > 0 and not self.played_d_card:
-            list_of_actions.extend(card_actions)
-
-        # Last possible action of every "turn" is to end the turn
-        # player = deepcopy(self)
-        list_of_actions.append(Action("end_turn", function=player.end_turn))
-
-        return list_of_actions
+        # The engine generates the actions from a compact copy of the game
+        return [Action.from_code(code) for code in Engine(GameState.from_game(board, players, self.number - 1)).legal_actions()]
     
-        
-    def buildSuccessorState(self, board, player, action: Action):
+    # State 
+    def stateActionTransition(self, engine, action: int):
         """
-        Take in the current board and player state, along with an action, and return the updated board/player state AFTER the action.
+        Apply an action to the search state held by engine, sampling its random outcome
+        (the card drawn, the other players' turns and our next roll). Playouts use this,
+        the tree draws outcomes in its chance nodes instead.
         """
-
-        # Copies of the current board and player state so we can modify them 
-        new_board = deepcopy(board)
-        new_player = deepcopy(player)
-
-        # Arguments associated with the action function 
-        action.args["board"] = new_board
-
-        # print(action.name) if action.name != "end_turn" else None
-
-        action.do_action(new_player)  # Will call the function associated with the action 
-
-        # Return board, player state AFTER the action 
-        return new_board, new_player
-    
-    def stateTransitionSimulation(self, board, player, players):
-        size = consts.SCREEN_SIZE
-        screen = pygame.display.set_mode(size)
-        new_board = deepcopy(board)
-        new_players = deepcopy(players)
-
-        new_players[0].end_turn()
-        player_turn = (player.number + 1) % 4
-        dice = Dice()
-        first_turn = False
-        winner = None
-        while winner is None and player_turn != 0:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    sys.exit()
-            comp_player = new_players[player_turn]
-            comp_player.start_turn()
-            def get_buttons(total = None):
-                buttons = [
-                        {
-                            'label': 'End Turn',
-                            'action': utils.end_turn,
-                        }
-                ]
-                possible_purchases = utils.get_possible_purchases(comp_player, new_board, deepcopy(new_players), screen)
-
-                def make_purchase():
-                    return possible_purchases, 'Buy:'
-
-                if len(possible_purchases) > 1:
-                    buttons.append({
-                        'label': 'Make Purchase',
-                        'action': make_purchase
-                    })
-                d_cards = [{'label': card.label, 'action': card.make_action(screen, new_board, new_players, comp_player)} for card in comp_player.d_cards if card.label != 'Point'] 
-                def play_d_card():
-                    return d_cards + [{'label': 'cancel', 'action': lambda: ([], None)}], 'Which Card: '
-
-                exchanges = comp_player.get_exchanges(screen, new_board, new_players)
-                def exchange():
-                    return exchanges + [{'label': 'cancel', 'action': lambda: ([], None)}], 'Exhange: '
-
-                if exchanges:
-                    buttons.append({
-                        'label': 'Exchange',
-                        'action': exchange,
-                    })
-
-                if d_cards and not comp_player.played_d_card:
-                    buttons.append({
-                        'label': 'Play D Card',
-                        'action': play_d_card
-                    })
-                if total:
-                    return buttons, 'Player ' + str(comp_player.number) + ', You Rolled: ' + str(total)
-                else:
-                    return buttons, 'Player ' + str(comp_player.number) + ': '
-
-            def roll_dice():
-                total = sum(dice.roll())
-                utils.give_resources(new_board, total)
-                return get_buttons(total)
-            buttons = [{
-                'label': 'Roll Dice',
-                'action': roll_dice
-            }]
-
-            label = 'Player %s\'s Turn' % comp_player.number
-            while buttons:
-                print_screen(screen, new_board, label, new_players, buttons)
-                option = comp_player.pick_option(buttons, board, players, True)
-                buttons, label = option['action']()
-                if not buttons and label != 'end':
-                    buttons, label = get_buttons()
-            comp_player.end_turn()
-            player_turn = (player_turn + 1) % 4
-            if player_turn == 0:
-                first_turn = False
-            winner = utils.get_winner(new_players)
-        
-        return new_board, new_players[0]
-
-
-    # State 
-    def stateActionTransition(self, board, player, players, action: Action):
-        
-        # If the Action is deterministic (building anything or playing a monopoly, year of plenty, or road builder dcard)
-        if (action.name in ["place_road", "place_city", "place_settlement", "play_monopoly", "play_yop", "play_roadbuilder", "make_exchange"]):
-            # Assuming that State is a combination of player (including recources and d_cards) and board objects,
-            # buildSuccessorState will take the action and update these two objects and return the resulting objects
-            board, player = self.buildSuccessorState(board, player, action)
-            return board, player
-        
-        elif (action.name == "buy_dcard"):
-            # get all cards in the dcard list for the board
-            available_dcards = board.d_cards
-
-            num_cards = {
-                # "Knight": 0,
-                "Point": 0,
-                "Monopoly": 0,
-                "Road Builder": 0,
-                "Year Of Plenty": 0
-            }
-
-            for card in available_dcards:
-                num_cards[card.label] += 1
-            
-            card_labels = list(num_cards.keys())
-            weights = list(num_cards.values())
-
-            sampled_label = random.choices(card_labels, weights=weights, k=1)[0]
-
-            # Find and remove the first matching card with that label
-            for i, card in enumerate(board.d_cards):
-                if card.label == sampled_label:
-                    sampled_card = board.d_cards.pop(i)  # remove and retrieve it
-                    break
-
-            player.d_card_queue.append(sampled_card)
-            return board, player
-
-        elif action.name == "end_turn":
-            # For end turn, we have to consider the next state stochastically because of the options of other players.
-            # We will handle next state by doing a "black box" sample from the environment's state transition function.
-            # This means we will have a function that will take in current state, and generate a possible the next state
-            # by simulating all the computer players action and stopping before our next dice roll
-
-            # empty list that will be populated with board states to sample from 
-            sample_space = []
-            for _ in range(NEXT_PLAYER_SIM_ITERS):
-                sample_space.append(self.stateTransitionSimulation(board, player, players))
-
-            # Return the sample
-            return random.choice(sample_space)
-        
+        if action == actions.END_TURN:
+            # The other players' turns and our next dice roll, played by the rollout policy
+            self.rollout_policy.play_others(engine)
         else:
-            raise ValueError(f"Action {action.name} does not have a defined state transition function.")
+            # Every other action (building anything, exchanges, playing a monopoly, year of plenty, or road builder dcard)
+            # is applied by the engine, which also samples the card drawn by buy_dcard from the remaining deck
+            engine.apply(action)
+
+# Worker pools for parallel search, one per worker count, kept for the whole process.
+# Pool workers are daemonic and cannot start pools of their own, so an Agent playing
+# inside selfplay's pool has to search with workers=1.
+_pools = {}
+
+def _pool(workers):
+    if workers not in _pools:
+        _pools[workers] = Pool(workers)
+    return _pools[workers]
+
+def _search_worker(job):
+    # Build one tree in a worker process, return (action key, visits, value) per root child,
+    # and the tree's SearchMetrics if the agent records them (None otherwise)
+    board, players, number, iterations, deadline, seed = job
+    agent = players[number - 1]
+    agent.set_rng(_worker_rng(agent, seed))
+    root = agent.search(board, players, iterations, deadline)
+    if agent.metrics is not None:
+        agent.metrics.measure(root)
+    return [(child.action_taken, child.stats.visits, child.stats.value) for child in root.children], agent.metrics
+
+# Agents playing tree-parallel rollouts in a worker process, by player number
+_rollout_agents = {}
+
+def _rollout_worker(job):
+    # Simulate from leaf states in a worker process, return the results to back up. A job
+    # only carries what the playouts need, the agent playing them is made once per worker
+    # and player instead of being pickled with its tree into every job.
+    number, states, seed, batched = job
+    agent = _rollout_agents.get(number)
+    if agent is None:
+        agent = _rollout_agents[number] = Agent(number, workers=1)
+    agent.set_rng(Streams(seed, batched=batched).stream('search'))
+    return [Node.simulate(Engine(state, agent.rng), agent) for state in states]
+
+def _worker_rng(agent, seed):
+    # A worker's own search stream, seeded by the agent's stream and batched like it
+    return Streams(seed, batched=isinstance(agent.rng, BlockRandom)).stream('search')
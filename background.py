@@ -0,0 +1,113 @@
+# Agent searches off the UI thread.
+# With a window open, a long search in Agent.pick_option would freeze it: no events are
+# handled and the OS marks it as not responding. A BackgroundSearch runs the agent's
+# searches in a worker process of a single-process executor. While one runs, the game
+# keeps pumping window events and shows how far the search is (iterations and current
+# best move). A key press or a click on the "Answer now" button makes the search answer
+# with its best move so far, and closing the window cancels it.
+
+import multiprocessing
+import queue
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+from engine import Action
+from view import print_screen
+
+# Times per second the window is updated while the agent thinks
+UI_FPS = 30
+
+# The worker process's own copy of the agent, set up by _start_worker
+_agent = None
+
+class BackgroundSearch(object):
+    """
+    Runs the searches of `agent` in a worker process while `screen` (a pygame window)
+    stays live. Set it as agent.background to have pick_option use it. The worker
+    searches with a copy of the agent made here, so set up the agent's budget first.
+    """
+
+    def __init__(self, agent, screen):
+        self.agent = agent
+        self.screen = screen
+        self.progress = multiprocessing.Queue()
+        self.answer_now = multiprocessing.Event()
+        # The worker searches with a stream of its own, seeded from the agent's like the
+        # parallel search workers
+        seed = (agent.rng or random).getrandbits(32)
+        self.executor = ProcessPoolExecutor(
+                1, initializer=_start_worker, initargs=(agent, seed, self.progress, self.answer_now)
+        )
+
+    def mcts(self, board, players):
+        """
+        Agent.mcts in the worker, keeping the window live until it answers. Returns the
+        action picked.
+        """
+        self.answer_now.clear()
+        future = self.executor.submit(_search, board, players, self.agent.on_search is not None)
+        done, best = 0, None
+        # Drawn with the progress, the button's position is set when it is first drawn
+        buttons = [{'label': 'Answer now'}]
+        shown = None
+        while True:
+            try:
+                action, metrics = future.result(timeout=1.0 / UI_FPS)
+                break
+            except TimeoutError:
+                pass
+            # Only the latest progress report counts
+            while True:
+                try:
+                    done, best = self.progress.get_nowait()
+                except queue.Empty:
+                    break
+            text = 'Player %d is thinking: %d iterations' % (self.agent.number, done)
+            if best is not None:
+                text += ', best ' + Action.from_code(best).name
+            if text != shown:
+                print_screen(self.screen, board, text, players, buttons)
+                shown = text
+            self.handle_events(buttons)
+
+        if metrics is not None:
+            self.agent.on_search(metrics)
+        return action
+
+    def handle_events(self, buttons):
+        # Window events while the worker searches: quit cancels, a key or the button answers
+        import pygame
+        from player import is_inside
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                self.cancel()
+                sys.exit()
+            elif event.type == pygame.KEYDOWN:
+                self.answer_now.set()
+            elif event.type == pygame.MOUSEBUTTONUP and any(is_inside(event.pos, button['pos']) for button in buttons):
+                self.answer_now.set()
+
+    def cancel(self):
+        """
+        Stop the running search and the worker, without waiting for them.
+        """
+        self.answer_now.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+def _start_worker(agent, seed, progress, answer_now):
+    # Keep the worker's copy of the agent, reporting progress and answering through the queue and event
+    from agent import _worker_rng
+    global _agent
+    _agent = agent
+    _agent.set_rng(_worker_rng(agent, seed))
+    _agent.on_progress = lambda done, best: progress.put((done, best))
+    _agent.answer_now = answer_now
+
+def _search(board, players, record):
+    # One decision of the worker's agent, the tree it keeps is reused by the next one.
+    # Returns the action and, if `record`, the decision's SearchMetrics.
+    metrics = []
+    _agent.on_search = metrics.append if record else None
+    action = _agent.mcts(board, players)
+    return action, metrics[0] if metrics else None
@@ -0,0 +1,370 @@
+# Vectorized batch simulator.
+# Plays B games in lockstep with every player following the rollout RandomPolicy. The
+# games are stored as struct-of-arrays NumPy tensors with the batch as the first axis.
+# Every step either rolls the dice or makes one menu decision in each unfinished game.
+# Longest road is the exception: each game keeps its own LongestRoad tracker, which is
+# only touched when a road or settlement is placed.
+#
+# It is meant for estimating win rates from a position with many random playouts at
+# once, e.g. BatchSimulator.from_state(state, 1024, rolled=True).run(200), where playing
+# them one by one through the Engine would be slow. The search does not use it yet;
+# bench.py compares its playouts per second with RandomPolicy's.
+#
+# Requires NumPy (the `batch` extra in pyproject.toml).
+
+import numpy as np
+import consts
+import topology
+from longest_road import LongestRoad
+from state import NUM_PLAYERS, NUM_RESOURCES, NUM_D_CARDS, LONGEST_ROAD, LARGEST_ARMY, PLAYED_D_CARD
+from topology import NUM_VERTICES, NUM_EDGES, NUM_TILES
+
+# Purchasable items in the order of consts.Costs, and their cost per resource
+ITEMS = tuple(consts.Costs)
+ROAD, SETTLEMENT, CITY, D_CARD = (ITEMS.index(item) for item in ('road', 'settlement', 'city', 'd_card'))
+COSTS = np.array([[consts.Costs[item].get(r, 0) for r in range(NUM_RESOURCES)] for item in ITEMS], dtype=np.int32)
+
+# Incidence matrices built from topology (float32 so that products go through BLAS)
+TILE_VERTEX = np.zeros((NUM_TILES, NUM_VERTICES), dtype=np.float32)
+for _tile, _vertices in enumerate(topology.TileVertices):
+    TILE_VERTEX[_tile, list(_vertices)] = 1
+EDGE_VERTEX = np.zeros((NUM_EDGES, NUM_VERTICES), dtype=np.float32)
+for _edge, _vertices in enumerate(topology.EdgeVertices):
+    EDGE_VERTEX[_edge, list(_vertices)] = 1
+EDGE_EDGE = np.zeros((NUM_EDGES, NUM_EDGES), dtype=np.float32)
+for _edge, _neighbors in enumerate(topology.EdgeNeighbors):
+    EDGE_EDGE[_edge, list(_neighbors)] = 1
+VERTEX_VERTEX = np.zeros((NUM_VERTICES, NUM_VERTICES), dtype=np.float32)
+for _vertex, _neighbors in enumerate(topology.VertexNeighbors):
+    VERTEX_VERTEX[_vertex, list(_neighbors)] = 1
+
+# Top level choices of a turn, in the order of RandomPolicy's menu
+_END_TURN, _PURCHASE, _EXCHANGE, _PLAY = range(4)
+
+class BatchSimulator(object):
+    """
+    B games advanced together. Players are referred to by index (player.number - 1) as in
+    GameState, so the arrays are indexed [game, player, ...].
+
+    Rules follow rollout.RandomPolicy: the dice are rolled, then the player picks
+    uniformly among End Turn, Make Purchase (if anything can be bought), Exchange (if
+    `exchanges` is set and a 4:1 trade is possible) and Play D Card (if a playable card is
+    held and none was played this turn), and every sub-choice is uniform as well. A road
+    needs a piece left and a free edge to go on, and is skipped otherwise, Road Builder
+    roads included.
+    """
+
+    def __init__(self, states, rolled=False, seed=None, exchanges=False):
+        """
+        Start one game from each GameState. If `rolled`, the player holding the turn has
+        already rolled the dice.
+        """
+        B = len(states)
+        self.size = B
+        self.rng = np.random.default_rng(seed)
+        self.exchanges = exchanges
+
+        # Board: resource (-1 for the desert) and chit (0 for the desert) of every tile
+        self.tile_resource = np.array([[-1 if r is None else r for r, _ in s.tiles] for s in states], dtype=np.int8)
+        self.tile_chit = np.array([[chit or 0 for _, chit in s.tiles] for s in states], dtype=np.int8)
+        self.robber = np.array([s.robber for s in states], dtype=np.int64)
+        self.vertex_owner = np.array([list(s.vertex_owner) for s in states], dtype=np.int8)
+        self.vertex_city = np.array([list(s.vertex_city) for s in states], dtype=bool)
+        self.edge_owner = np.array([list(s.edge_owner) for s in states], dtype=np.int8)
+
+        # Cards
+        self.hands = np.array([list(s.hands) for s in states], dtype=np.int32).reshape(B, NUM_PLAYERS, NUM_RESOURCES)
+        self.d_cards = np.array([list(s.d_cards) for s in states], dtype=np.int32).reshape(B, NUM_PLAYERS, NUM_D_CARDS)
+        self.d_card_queue = np.array([list(s.d_card_queue) for s in states], dtype=np.int32).reshape(B, NUM_PLAYERS, NUM_D_CARDS)
+        self.deck = np.array([list(s.deck) for s in states], dtype=np.int32)
+
+        # Per player counters and the holders of the awards (-1 if nobody)
+        self.points = np.array([list(s.points) for s in states], dtype=np.int32)
+        self.settlements_left = np.array([list(s.settlements_left) for s in states], dtype=np.int32)
+        self.roads_left = np.array([list(s.roads_left) for s in states], dtype=np.int32)
+        self.cities_left = np.array([list(s.cities_left) for s in states], dtype=np.int32)
+        self.knights = np.array([list(s.knights) for s in states], dtype=np.int32)
+        flags = np.array([list(s.flags) for s in states], dtype=np.int32)
+        self.played = (flags & PLAYED_D_CARD) > 0
+        self.longest_road = self._holder(flags & LONGEST_ROAD)
+        self.largest_army = self._holder(flags & LARGEST_ARMY)
+        self.roads = [LongestRoad.from_owners(s.vertex_owner, s.edge_owner, NUM_PLAYERS) for s in states]
+
+        # Turn progress
+        self.turn = np.array([s.turn for s in states], dtype=np.int64)
+        self.rolled = np.full(B, rolled, dtype=bool)
+        self.turns = np.zeros(B, dtype=np.int64)
+        self.winner = np.full(B, -1, dtype=np.int64)
+        self.done = np.zeros(B, dtype=bool)
+
+    @classmethod
+    def from_state(cls, state, batch, rolled=False, seed=None, exchanges=False):
+        """
+        `batch` copies of the same GameState, e.g. for rollouts from one search node.
+        """
+        return cls([state] * batch, rolled, seed, exchanges)
+
+    def victory_points(self):
+        """
+        Points per game and player, including held Point cards (like utils.get_winner).
+        """
+        return self.points + self.d_cards[:, :, consts.DCard.POINT]
+
+    def run(self, max_turns=None):
+        """
+        Step until every game has a winner, or has played max_turns turns. Returns the
+        winner index per game, -1 for games that were cut off.
+        """
+        while self.step():
+            if max_turns is not None:
+                self.done |= self.turns >= max_turns
+        return self.winner
+
+    def step(self):
+        """
+        Roll the dice or make one decision in every unfinished game. Returns False once
+        all games are finished.
+        """
+        active = np.flatnonzero(~self.done)
+        if not len(active):
+            return False
+        rolling = active[~self.rolled[active]]
+        deciding = active[self.rolled[active]]
+        self._roll(rolling)
+        self._decide(deciding)
+        return True
+
+    # --- Turn structure ---
+
+    def _roll(self, g):
+        n = len(g)
+        totals = self.rng.integers(1, 7, (n, 2)).sum(axis=1)
+        self._produce(g, totals)
+        self.rolled[g] = True
+        self.played[g, self.turn[g]] = False
+
+    def _produce(self, g, totals):
+        producing = (self.tile_chit[g] == totals[:, None]) & (self.tile_resource[g] >= 0)
+        robbed = self.robber[g] >= 0
+        producing[np.flatnonzero(robbed), self.robber[g][robbed]] = False
+        # (n, resource, tile) @ (tile, vertex), then (n, player, vertex) @ (n, vertex, resource)
+        tile_gain = (self.tile_resource[g][:, None, :] == np.arange(NUM_RESOURCES)[:, None]) & producing[:, None, :]
+        vertex_gain = tile_gain.astype(np.float32) @ TILE_VERTEX
+        owners = (self.vertex_owner[g][:, None, :] == np.arange(1, NUM_PLAYERS + 1)[:, None]).astype(np.float32)
+        owners *= (1 + self.vertex_city[g])[:, None, :]
+        self.hands[g] += (owners @ vertex_gain.transpose(0, 2, 1)).astype(np.int32)
+
+    def _decide(self, g):
+        if not len(g):
+            return
+        p = self.turn[g]
+        purchasable = self._purchasable(g, p)
+        playable = self.d_cards[g, p].copy()
+        playable[:, consts.DCard.POINT] = 0
+        can_play = (playable.sum(axis=1) > 0) & ~self.played[g, p]
+        exchangeable = (self.hands[g, p] >= 4) & self.exchanges
+        choice = self._sample(np.stack(
+                [np.ones(len(g), dtype=bool), purchasable.any(axis=1), exchangeable.any(axis=1), can_play], axis=1))
+
+        self._end_turn(g[choice == _END_TURN])
+
+        # Make Purchase: one button per purchasable item and a cancel button
+        buying = choice == _PURCHASE
+        item = self._sample(np.concatenate([purchasable[buying], np.ones((buying.sum(), 1), dtype=bool)], axis=1))
+        for k, buy in ((ROAD, self._buy_road), (SETTLEMENT, self._buy_settlement), (CITY, self._buy_city), (D_CARD, self._buy_d_card)):
+            games = g[buying][item == k]
+            if len(games):
+                self.hands[games, self.turn[games]] -= COSTS[k]
+                buy(games, self.turn[games])
+
+        # Exchange: one button per resource held 4 times and a cancel button, then a
+        # random resource in return
+        trading = choice == _EXCHANGE
+        given = self._sample(np.concatenate([exchangeable[trading], np.ones((trading.sum(), 1), dtype=bool)], axis=1))
+        trades = given < NUM_RESOURCES
+        games, given = g[trading][trades], given[trades]
+        if len(games):
+            p = self.turn[games]
+            self.hands[games, p, given] -= 4
+            self.hands[games, p, self.rng.integers(0, NUM_RESOURCES, len(games))] += 1
+
+        # Play D Card: one button per playable card held and a cancel button
+        playing = choice == _PLAY
+        card = self._sample(np.concatenate([playable[playing], np.ones((playing.sum(), 1), dtype=np.int32)], axis=1))
+        for c, play in (
+                (consts.DCard.KNIGHT, self._play_knight),
+                (consts.DCard.MONOPOLY, self._play_monopoly),
+                (consts.DCard.ROAD_BUILDER, self._play_roadbuilder),
+                (consts.DCard.YEAR_OF_PLENTY, self._play_yop),
+        ):
+            games = g[playing][card == c]
+            if len(games):
+                p = self.turn[games]
+                self.d_cards[games, p, c] -= 1
+                self.played[games, p] = True
+                play(games, p)
+
+    def _end_turn(self, g):
+        if not len(g):
+            return
+        p = self.turn[g]
+        self.d_cards[g, p] += self.d_card_queue[g, p]
+        self.d_card_queue[g, p] = 0
+        self.turns[g] += 1
+
+        # Like utils.get_winner, the first player with 10 points wins
+        won = self.points[g] + self.d_cards[g, :, consts.DCard.POINT] >= 10
+        has_winner = won.any(axis=1)
+        self.winner[g[has_winner]] = won[has_winner].argmax(axis=1)
+        self.done[g[has_winner]] = True
+
+        self.turn[g] = (p + 1) % NUM_PLAYERS
+        self.rolled[g] = False
+
+    # --- Purchases ---
+
+    def _purchasable(self, g, p):
+        # Items the player can afford and has a place for, like Player.can_buy
+        hands = self.hands[g, p]
+        afford = (hands[:, None, :] >= COSTS[None, :, :]).all(axis=2)
+        ok = np.empty_like(afford)
+        ok[:, ROAD] = (self.roads_left[g, p] > 0) & self._road_mask(g, p).any(axis=1)
+        ok[:, SETTLEMENT] = (self.settlements_left[g, p] > 0) & self._settlement_mask(g, p).any(axis=1)
+        ok[:, CITY] = (self.cities_left[g, p] > 0) & self._city_mask(g, p).any(axis=1)
+        ok[:, D_CARD] = self.deck[g].sum(axis=1) > 0
+        return afford & ok
+
+    def _road_mask(self, g, p):
+        # Free edges next to one of the player's roads
+        own = (self.edge_owner[g] == (p + 1)[:, None]).astype(np.float32)
+        return ((own @ EDGE_EDGE) > 0) & (self.edge_owner[g] == 0)
+
+    def _settlement_mask(self, g, p):
+        # Free vertices with no neighboring settlement, touching one of the player's roads
+        occupied = (self.vertex_owner[g] > 0).astype(np.float32)
+        free = (occupied == 0) & ((occupied @ VERTEX_VERTEX) == 0)
+        own = (self.edge_owner[g] == (p + 1)[:, None]).astype(np.float32)
+        return free & ((own @ EDGE_VERTEX) > 0)
+
+    def _city_mask(self, g, p):
+        return (self.vertex_owner[g] == (p + 1)[:, None]) & ~self.vertex_city[g]
+
+    def _buy_road(self, g, p):
+        self._place_road(g, p)
+
+    def _buy_settlement(self, g, p):
+        vertex = self._sample(self._settlement_mask(g, p))
+        self.vertex_owner[g, vertex] = p + 1
+        self.settlements_left[g, p] -= 1
+        self.points[g, p] += 1
+        for b, player, v in zip(g, p, vertex):
+            self.roads[b].add_settlement(player, v)
+        # Cutting an opponent's road can move the longest road award
+        self._update_longest_road(g)
+
+    def _buy_city(self, g, p):
+        # Like Settlement.make_city, upgrading only adds a point
+        vertex = self._sample(self._city_mask(g, p))
+        self.vertex_city[g, vertex] = True
+        self.points[g, p] += 1
+
+    def _buy_d_card(self, g, p):
+        card = self._sample(self.deck[g])
+        self.deck[g, card] -= 1
+        self.d_card_queue[g, p, card] += 1
+
+    def _place_road(self, g, p):
+        # A random free edge next to the player's roads, skipped if there is none or the
+        # player has no road left
+        mask = self._road_mask(g, p)
+        can_place = mask.any(axis=1) & (self.roads_left[g, p] > 0)
+        g, p, mask = g[can_place], p[can_place], mask[can_place]
+        edge = self._sample(mask)
+        self.edge_owner[g, edge] = p + 1
+        self.roads_left[g, p] -= 1
+        for b, player, e in zip(g, p, edge):
+            self.roads[b].add_road(player, e)
+        # Like Board.check_longest_road, only checked once the player has placed 5 roads
+        self._update_longest_road(g[self.roads_left[g, p] <= 15 - 5])
+
+    def _update_longest_road(self, g):
+        # Give the award to the only player with the longest road of at least 5, if any
+        for b in g:
+            leader = self.roads[b].leader()
+            holder = self.longest_road[b]
+            if leader is None or leader == holder:
+                continue
+            if holder >= 0:
+                self.points[b, holder] -= 2
+            self.longest_road[b] = leader
+            self.points[b, leader] += 2
+
+    # --- Development cards ---
+
+    def _play_knight(self, g, p):
+        n = len(g)
+        rows = np.arange(n)
+
+        # Move the robber to a random resource tile that is not blocked yet
+        candidates = self.tile_resource[g] >= 0
+        robbed = self.robber[g] >= 0
+        candidates[rows[robbed], self.robber[g][robbed]] = False
+        tile = self._sample(candidates)
+        self.robber[g] = tile
+
+        # Steal a random card from a random other player with a settlement on the tile
+        on_tile = TILE_VERTEX[tile] > 0
+        victims = ((self.vertex_owner[g][:, :, None] == np.arange(1, NUM_PLAYERS + 1)) & on_tile[:, :, None]).any(axis=1)
+        victims[rows, p] = False
+        has_victim = victims.any(axis=1)
+        thief = p[has_victim]
+        victim = self._sample(victims[has_victim])
+        robbed_games = g[has_victim]
+        hand = self.hands[robbed_games, victim]
+        has_cards = hand.sum(axis=1) > 0
+        robbed_games, thief, victim = robbed_games[has_cards], thief[has_cards], victim[has_cards]
+        resource = self._sample(hand[has_cards])
+        self.hands[robbed_games, victim, resource] -= 1
+        self.hands[robbed_games, thief, resource] += 1
+
+        # Largest army: at least 3 knights and more than anybody else
+        self.knights[g, p] += 1
+        knights = self.knights[g]
+        mine = knights[rows, p]
+        others = knights.copy()
+        others[rows, p] = -1
+        takes = (mine >= 3) & (self.largest_army[g] != p) & (mine > others.max(axis=1))
+        for b, player in zip(g[takes], p[takes]):
+            holder = self.largest_army[b]
+            if holder >= 0:
+                self.points[b, holder] -= 2
+            self.largest_army[b] = player
+            self.points[b, player] += 2
+
+    def _play_monopoly(self, g, p):
+        resource = self.rng.integers(0, NUM_RESOURCES, len(g))
+        players = np.arange(NUM_PLAYERS)[None, :]
+        total = self.hands[g[:, None], players, resource[:, None]].sum(axis=1)
+        self.hands[g[:, None], players, resource[:, None]] = 0
+        self.hands[g, p, resource] = total
+
+    def _play_roadbuilder(self, g, p):
+        self._place_road(g, p)
+        self._place_road(g, p)
+
+    def _play_yop(self, g, p):
+        for _ in range(2):
+            resource = self.rng.integers(0, NUM_RESOURCES, len(g))
+            self.hands[g, p, resource] += 1
+
+    # --- Helpers ---
+
+    def _holder(self, flag):
+        # Index of the player with the flag set in every game, -1 if nobody
+        return np.where(flag.any(axis=1), flag.argmax(axis=1), -1)
+
+    def _sample(self, weights):
+        # Index per row drawn with probability proportional to the row's weights (or mask)
+        cumulative = np.cumsum(weights, axis=1, dtype=np.float64)
+        r = self.rng.random(len(weights)) * cumulative[:, -1]
+        return (cumulative <= r[:, None]).sum(axis=1)
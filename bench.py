@@ -0,0 +1,322 @@
+# Headless benchmark suite.
+# Times the engine and agent hot paths on fixed seeds, so every run sees the same board
+# layouts and positions, and writes the results as JSON, optionally compared against a
+# stored baseline, e.g.
+#   python bench.py --out bench.json
+#   python bench.py --baseline bench.json --out new.json
+# Micro benchmarks report the time of one call (lower is better), macro benchmarks MCTS
+# iterations, random playouts and self-play turns per second (higher is better). The
+# playout benchmarks compare RandomPolicy playing games one by one on the Engine with the
+# NumPy batch simulator, which is skipped without NumPy. With a baseline, results
+# that got worse by more than --tolerance are flagged and the exit status is 1.
+
+import argparse
+import importlib.util
+import json
+import platform
+import subprocess
+import sys
+import time
+from copy import deepcopy
+
+import game
+import selfplay
+import utils
+from agent import Agent
+from board import Board
+from engine import Engine
+from player import ComputerPlayer
+from rng import Streams
+from rollout import RandomPolicy
+from state import GameState
+from topology import NUM_VERTICES
+
+SEED = 2024
+# Turns played after the draft to reach each position. They are multiples of 4, so it is
+# player 1's turn again, and no one has won yet at the last one with this seed.
+POSITIONS = {
+        'early': 0,
+        'mid': 40,
+        'late': 120,
+}
+# Cards of every resource player 1 holds at every position, so that it has purchases and
+# exchanges to pick from instead of only ending its turn
+HAND = 4
+# Iterations of one timed search in the MCTS benchmarks, all of them run (no early stop)
+SEARCH_ITERS = 200
+# Random playouts from the early position per timed run, by RandomPolicy and by the batch
+# simulator, and the turns after which a playout is cut off
+PLAYOUTS = {
+        'policy': 128,
+        'batch': 1024,
+}
+PLAYOUT_TURNS = 200
+# Games of the self-play benchmarks (seats, games, turn limit)
+SELFPLAY = {
+        'computer': ('CCCC', 8, 200),
+        'agent': ('ACCC', 2, 200),
+}
+
+_positions = {}
+
+def position(stage):
+    """
+    Board and players at one of POSITIONS, with player 1 to move after its roll, holding
+    HAND cards of every resource. Every random draw comes from Streams(SEED), so the
+    position is the same on every run. A fresh copy is returned, benchmarks are free to
+    change it.
+    """
+    if stage not in _positions:
+        streams = Streams(SEED)
+        board = Board(ports_enabled=True, rng=streams.board, deck_rng=streams.deck)
+        players = [ComputerPlayer(number, rng=streams.policy) for number in range(1, 5)]
+        game.pick_settlements(players, board)
+        if POSITIONS[stage]:
+            winner, _, _ = game.play_game(board, players, streams.dice, POSITIONS[stage])
+            if winner is not None:
+                raise RuntimeError(f"The {stage} position has a winner, pick other turns for SEED {SEED}.")
+        utils.give_resources(board, sum(streams.dice.roll()))
+        for resource in players[0].hand:
+            players[0].hand[resource] = HAND
+        _positions[stage] = (board, players)
+    return deepcopy(_positions[stage])
+
+def time_per_call(func, calls, repeat):
+    """
+    Best time in seconds of one call, over `repeat` runs of `calls` calls.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(calls):
+            func()
+        best = min(best, (time.perf_counter() - start) / calls)
+    return best
+
+def search_setup(stage):
+    """
+    A fresh position and the agent searching it, (agent, board, players).
+    """
+    board, players = position(stage)
+    return Agent(1, rng=Streams(SEED).search, early_stop=False), board, players
+
+def search_root(stage, iterations, setup=None):
+    """
+    Search the position for `iterations` iterations and return the root. `setup` is a
+    search_setup(stage) made beforehand, one is made here if not given.
+    """
+    agent, board, players = search_setup(stage) if setup is None else setup
+    root = agent.search(board, players, iterations)
+    # Each timed search must do the same work, not stop at a forced or settled move
+    if root.stats.visits != iterations or len(root.children) < 2:
+        raise RuntimeError(f"The {stage} search ran {root.stats.visits} of {iterations} iterations over "
+                           f"{len(root.children)} moves, pick another position.")
+    return root
+
+# --- Micro benchmarks, (name, setup) where setup returns (func, calls, items per call) ---
+
+def _get_possible_actions():
+    board, players = position('mid')
+    agent = Agent(1)
+    return lambda: agent.getPossibleActions(board, players), 200, 1
+
+def _can_place_settlement():
+    board, players = position('mid')
+    player = players[0]
+    def sweep():
+        for vertex in range(NUM_VERTICES):
+            player.can_place_settlement(board, vertex, False)
+    return sweep, 2000, NUM_VERTICES
+
+def _check_longest_road():
+    board, players = position('late')
+    return lambda: board.check_longest_road(players[0]), 20000, 1
+
+def _give_resources():
+    board, _ = position('mid')
+    totals = [total for total in range(2, 13) if total != 7]
+    def sweep():
+        for total in totals:
+            utils.give_resources(board, total)
+    return sweep, 2000, len(totals)
+
+def _get_possible_purchases():
+    board, players = position('late')
+    # A hand that can afford everything, so every can_buy check runs
+    for resource in players[0].hand:
+        players[0].hand[resource] = 5
+    return lambda: utils.get_possible_purchases(players[0], board, players), 5000, 1
+
+def _state_from_game():
+    board, players = position('mid')
+    return lambda: GameState.from_game(board, players), 2000, 1
+
+def _state_clone():
+    board, players = position('mid')
+    state = GameState.from_game(board, players)
+    return state.clone, 20000, 1
+
+def _deepcopy_game():
+    # Copying a whole position the old way, next to GameState above
+    game_copy = position('mid')
+    return lambda: deepcopy(game_copy), 200, 1
+
+def _best_child():
+    root = search_root('mid', SEARCH_ITERS)
+    return root.best_child, 20000, 1
+
+MICRO = (
+        ('get_possible_actions', _get_possible_actions),
+        ('can_place_settlement', _can_place_settlement),
+        ('check_longest_road', _check_longest_road),
+        ('give_resources', _give_resources),
+        ('get_possible_purchases', _get_possible_purchases),
+        ('state_from_game', _state_from_game),
+        ('state_clone', _state_clone),
+        ('deepcopy_game', _deepcopy_game),
+        ('best_child', _best_child),
+)
+
+def run_micro(setup, repeat):
+    func, calls, items = setup()
+    seconds = time_per_call(func, calls, repeat) / items
+    return {'value': seconds * 1e9, 'unit': 'ns/call', 'higher_is_better': False}
+
+# --- Macro benchmarks ---
+
+def run_search(stage, repeat):
+    best = 0.0
+    for _ in range(repeat):
+        # Copying the position is left out of the timing
+        setup = search_setup(stage)
+        start = time.perf_counter()
+        root = search_root(stage, SEARCH_ITERS, setup)
+        elapsed = time.perf_counter() - start
+        best = max(best, root.stats.visits / elapsed)
+    return {'value': best, 'unit': 'iterations/s', 'higher_is_better': True}
+
+def run_playouts_policy(repeat):
+    state = GameState.from_game(*position('early'))
+    best = 0.0
+    for _ in range(repeat):
+        policy = RandomPolicy(Streams(SEED).policy)
+        start = time.perf_counter()
+        for _ in range(PLAYOUTS['policy']):
+            engine = Engine(state.clone(), policy.rng)
+            turns = 0
+            while engine.state.winner() is None and turns < PLAYOUT_TURNS:
+                policy.play_turn(engine)
+                turns += 1
+        best = max(best, PLAYOUTS['policy'] / (time.perf_counter() - start))
+    return {'value': best, 'unit': 'playouts/s', 'higher_is_better': True}
+
+def run_playouts_batch(repeat):
+    from batch import BatchSimulator
+    state = GameState.from_game(*position('early'))
+    best = 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        BatchSimulator.from_state(state, PLAYOUTS['batch'], seed=SEED).run(PLAYOUT_TURNS)
+        best = max(best, PLAYOUTS['batch'] / (time.perf_counter() - start))
+    return {'value': best, 'unit': 'playouts/s', 'higher_is_better': True}
+
+def run_selfplay(seats, games, max_turns):
+    turns = 0
+    start = time.perf_counter()
+    for i in range(games):
+        turns += selfplay.play_one((i, SEED + i, seats, True, max_turns, False))['turns']
+    return {'value': turns / (time.perf_counter() - start), 'unit': 'turns/s', 'higher_is_better': True}
+
+def benchmarks(repeat):
+    """
+    (name, run) of every benchmark, where run() returns its result.
+    """
+    for name, setup in MICRO:
+        yield name, lambda setup=setup: run_micro(setup, repeat)
+    for stage in POSITIONS:
+        yield 'mcts_' + stage, lambda stage=stage: run_search(stage, repeat)
+    yield 'playouts_policy', lambda: run_playouts_policy(repeat)
+    if importlib.util.find_spec('numpy') is not None:
+        yield 'playouts_batch', lambda: run_playouts_batch(repeat)
+    for name, (seats, games, max_turns) in SELFPLAY.items():
+        yield 'selfplay_' + name, lambda seats=seats, games=games, max_turns=max_turns: run_selfplay(seats, games, max_turns)
+
+def run(only=None, repeat=5):
+    """
+    Run the benchmarks whose names contain one of `only` (all by default) and return
+    the report: the results by name and what they ran on.
+    """
+    results = {}
+    for name, bench in benchmarks(repeat):
+        if only and not any(part in name for part in only):
+            continue
+        results[name] = bench()
+        print('%-24s %14.1f %s' % (name, results[name]['value'], results[name]['unit']), file=sys.stderr)
+    return {'meta': meta(repeat), 'results': results}
+
+def meta(repeat):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+            'commit': commit,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'seed': SEED,
+            'repeat': repeat,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+def compare(report, baseline, tolerance):
+    """
+    Add to every result its baseline value and change, the change being positive when
+    the result got better. Returns the names of the results that got worse by more than
+    `tolerance` (a fraction).
+    """
+    regressions = []
+    for name, result in report['results'].items():
+        old = baseline['results'].get(name)
+        if old is None or old['unit'] != result['unit']:
+            continue
+        change = (result['value'] - old['value']) / old['value']
+        if not result['higher_is_better']:
+            change = -change
+        result['baseline'] = old['value']
+        result['change'] = change
+        if change < -tolerance:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Catan engine and agent benchmarks")
+    parser.add_argument('--out', default=None, help="Write the JSON report to this file instead of stdout")
+    parser.add_argument('--baseline', default=None, help="JSON report to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="Worst change against the baseline that is not a regression")
+    parser.add_argument('--only', nargs='*', default=None, help="Only run benchmarks whose names contain one of these")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs per benchmark, the best one counts")
+    args = parser.parse_args()
+
+    report = run(args.only, args.repeat)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for name, result in report['results'].items():
+            if 'change' in result:
+                flag = '  REGRESSION' if name in regressions else ''
+                print('%-24s %+7.1f%%%s' % (name, 100.0 * result['change'], flag), file=sys.stderr)
+        report['regressions'] = regressions
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
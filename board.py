@@ -2,8 +2,12 @@
 # Any modifications will be noted via comments and commits
 
 import consts
-from random import shuffle
-from draw import print_screen
+import topology
+from frontier import Frontiers
+from longest_road import LongestRoad
+from production import Production
+import random
+from view import print_screen
 import agent
 
 # Represents a resource tile (brick, wool, etc.)
@@ -37,15 +41,17 @@ class DesertTile(ResourceTile):
 
 # Main board logic
 class Board(object):
-    # Initialize the board
-    def __init__(self, ports_enabled=True):
+    # Initialize the board, shuffling the tiles with rng and the development cards with deck_rng
+    # (random.Random streams, see rng.py; None for the global random module)
+    def __init__(self, ports_enabled=True, rng=None, deck_rng=None):
+        self.deck_rng = deck_rng
         # Get the ports and resource tiles
         self.ports = self._get_ports() if ports_enabled else []
         self.ports_enabled = ports_enabled
         self.tiles = self._get_tiles()
 
         # Set the location of each resource tile
-        shuffle(self.tiles)
+        (rng or random).shuffle(self.tiles)
         for i, tile in enumerate(self.tiles):
             tile.set_location(i)
 
@@ -62,8 +68,11 @@ class Board(object):
         # Initialize lists for settlements, roads, and development cards (shuffled)
         self.settlements = []
         self.roads = []
+        self.longest_roads = LongestRoad()
+        self.production = Production(self._tile_chits(), self._robber())
+        self.frontiers = Frontiers()
         self.d_cards = self._get_d_cards()
-        shuffle(self.d_cards)
+        (deck_rng or random).shuffle(self.d_cards)
 
     # Return the static list of ports 
     def _get_ports(self):
@@ -101,101 +110,68 @@ class Board(object):
 
     # Return a of tile IDs adjacent to a given settlement
     def get_tiles(self, settlement):
-        return [
-                tile for tile in consts.TileSettlementMap
-                if settlement.number in consts.TileSettlementMap[tile]
-        ]
-
-    # Partition player's roads into sets of connected segments
-    def make_road_sets(self, player, owned_roads):
-        roads_left = [road for road in owned_roads]
-        sets = []
-        while len(roads_left):
-            seen = set()
-            road = roads_left.pop()
-            seen.add(road.number)
-            stack = [road.spots[0],road.spots[1]]
-            while len(stack) > 0:
-                settlement_num = stack.pop()
-                for r in owned_roads:
-                    if r in roads_left and r.number not in seen and settlement_num in r.spots:
-                        seen.add(r.number)
-                        roads_left.remove(r)
-                        seen.add(r.number)
-                        settlement_one = r.spots[0]
-                        settlement_two  = r.spots[1]
-                        stack += [settlement_one]
-                        stack += [settlement_two]
-            sets.append(seen)
-        return sets
-
-    # Depth-first search to find the longest contiguous road path
-    def dfs(self, road, s, discovered, next_settlement, length, maximum):
-        discovered.add(road)
-        connected = [
-                r for r in s
-                if consts.Roads[r][0] == next_settlement
-                or consts.Roads[r][1] == next_settlement
-        ]
-        for r in connected:
-            if r not in discovered:
-                discovered.add(r)
-                if consts.Roads[r][0] == next_settlement:
-                    n_settle = consts.Roads[r][1]
-                else:
-                    n_settle = consts.Roads[r][0]
-                l = self.dfs(r, s, discovered, n_settle, length + 1, maximum)
-                if l > maximum:
-                    maximum = l
-        return max(length, maximum)
-        
-    # Check road set for longest path length
-    def check(self, s):
-        edges = []
-        for road in s:
-            corners = [item for r in s if r != road for item in consts.Roads[r]]
-            if corners.count(consts.Roads[road][0]) > 0 and corners.count(consts.Roads[road][1]) > 0:
-                continue
-            else:
-                edges.append(road)
-        if not edges:
-            edges = [road]
-        scores = []
-        for e in edges:
-            corners = [item for r in s if r != e for item in consts.Roads[r]]
-            if corners.count(consts.Roads[road][0]) > 1:
-                next_settlement = consts.Roads[road][0]
-            else:
-                next_settlement = consts.Roads[road][1]
-            score = self.dfs(e, s, set(), next_settlement, 1, 0)
-            scores.append(score)
-        return max(scores)
-
-    # Return the length of the player's longest road, if they own more than 5 roads
+        return list(topology.VertexTiles[settlement.number])
+
+    # (resource, chit) of every tile, the static part of the production index
+    def _tile_chits(self):
+        return tuple((tile.resource, tile.chit) for tile in self.tiles)
+
+    # Index of the tile blocked by the robber, -1 if none
+    def _robber(self):
+        return next((i for i, tile in enumerate(self.tiles) if tile.blocked), -1)
+
+    # Rebuild the longest road, production and frontier indexes after the piece lists were replaced
+    def rebuild_indexes(self):
+        self.longest_roads = LongestRoad()
+        self.production = Production(self._tile_chits(), self._robber())
+        self.frontiers = Frontiers()
+        for settlement in self.settlements:
+            self.longest_roads.add_settlement(settlement.player.number - 1, settlement.number)
+            self.frontiers.add_settlement(settlement.player.number - 1, settlement.number)
+            self.production.add_settlement(settlement.player, settlement.number)
+            if settlement.city:
+                self.production.set_city(settlement.number)
+        for road in self.roads:
+            self.longest_roads.add_road(road.player.number - 1, road.number)
+            self.frontiers.add_road(road.player.number - 1, road.number)
+
+    # Add a settlement to the board and cut any opponent road running through it
+    def add_settlement(self, settlement):
+        self.settlements.append(settlement)
+        self.longest_roads.add_settlement(settlement.player.number - 1, settlement.number)
+        self.production.add_settlement(settlement.player, settlement.number)
+        self.frontiers.add_settlement(settlement.player.number - 1, settlement.number)
+        # A cut road can lose its owner the longest road award
+        self.check_longest_road(settlement.player)
+
+    # Upgrade a settlement on the board to a city
+    def make_city(self, settlement):
+        settlement.make_city()
+        self.production.set_city(settlement.number)
+
+    # Move the robber to the tile with the given index
+    def move_robber(self, num):
+        for i, tile in enumerate(self.tiles):
+            tile.blocked = i == num
+        self.production.move_robber(num)
+
+    # Add a road to the board and update its owner's longest road
+    def add_road(self, road):
+        self.roads.append(road)
+        self.longest_roads.add_road(road.player.number - 1, road.number)
+        self.frontiers.add_road(road.player.number - 1, road.number)
+
+    # Return the length of the player's longest road, kept up to date by add_road and add_settlement
     def check_road_length(self, player):
-        owned_roads = [road for road in self.roads if road.player == player]
-        if len(owned_roads) < 5:
-            return 0
-        else:
-            sets = self.make_road_sets(player, owned_roads)
-            to_check = [s for s in sets if len(s) >= 5]
-            if len(to_check):
-                to_return = max([self.check(s) for s in to_check])
-                return to_return
-            else:
-                return 0
+        return self.longest_roads.lengths[player.number - 1]
 
     # Determine if a player qualifies for the longest road VP
     def check_longest_road(self, placing_player):
-        players = set([road.player for road in self.roads])
-        player_scores = [self.check_road_length(player) for player in players]
-        best = max(player_scores)
-        if best < 5:
+        leader = self.longest_roads.leader()
+        if leader is None:
             return
-        best_players = [player for i,player in enumerate(players) if player_scores[i] == best]
-        if len(best_players) > 1:
-            return
-        best_player = best_players[0]
+        players = set([road.player for road in self.roads])
+        best_player = [player for player in players if player.number - 1 == leader][0]
         if best_player.longest_road:
             return
         else:
@@ -316,3 +292,7 @@ class YearOfPlenty(object):
                 player.hand[resource] += 1
             return [], None
         return action
+
+# One shared instance of each development card, indexed by consts.DCard
+# (the cards hold no state, the deck above already repeats the same instance)
+DCards = [Knight(), Point(), Monopoly(), RoadBuilder(), YearOfPlenty()]
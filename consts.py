@@ -31,6 +31,22 @@ ResourceMap = [
         'Wool',
 ]
 
+# Development card types, indexed the same way as the card labels in board.py
+class DCard(object):
+    KNIGHT = 0
+    POINT = 1
+    MONOPOLY = 2
+    ROAD_BUILDER = 3
+    YEAR_OF_PLENTY = 4
+
+DCardMap = [
+        'Knight',
+        'Point',
+        'Monopoly',
+        'Road Builder',
+        'Year Of Plenty',
+]
+
 ResourceColors = { # Changed resource colors to be less fugly  
         Resource.BRICK: (173,40,49),
         Resource.LUMBER: (95,145,74),
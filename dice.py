@@ -3,13 +3,15 @@
 
 import collections
 import itertools
-from random import randint
+import random
 
 class Dice(object):
 
-    def __init__(self, number=2, sides=6):
+    # rng is the random.Random to roll with, None for the global random module (see rng.py)
+    def __init__(self, number=2, sides=6, rng=None):
         self.number = number
         self.sides = sides
+        self.rng = rng
         self.odds = self.set_odds()
 
     def set_odds(self):
@@ -29,6 +31,7 @@ class Dice(object):
         return self.odds.get(number)
 
     def roll(self):
+        randint = (self.rng or random).randint
         return [randint(1,self.sides) for i in range(self.number)]
 
 
@@ -1,6 +1,12 @@
 # From https://github.com/damargulis/catan/
 # Any modifications will be noted via comments and commits
 
+# The tiles, chits and ports never change during a game, so they are drawn once per
+# board layout onto a cached surface that every frame starts from. Fonts and rendered
+# labels are cached too. print_screen remembers what each region of the window (board,
+# player panels, dialog) showed last, and only redraws and updates the regions that
+# changed since the previous frame.
+
 import consts
 import sys
 import pygame
@@ -12,30 +18,58 @@ PLAYER_POSITIONS = consts.PLAYER_POSITIONS
 black = consts.BLACK
 white = consts.WHITE
 
+# Corners of a hex tile around its center, computed once instead of per tile and frame
+_HEX_PI = 3.14
+HEX_OFFSETS = [
+        (
+            cos(i / 6 * 2 * _HEX_PI + _HEX_PI / 2) * RESOURCE_RADUIS,
+            sin(i / 6 * 2 * _HEX_PI + _HEX_PI / 2) * RESOURCE_RADUIS,
+        )
+        for i in range(6)
+]
+
+# Rendered labels kept by (text, color), emptied when it grows past this many
+LABEL_CACHE_SIZE = 2048
+
+_fonts = {}
+_labels = {}
+# Layout key and surface of the static layer of the last board drawn
+_static = (None, None)
+# The screen last drawn on and what each of its regions showed
+_drawn_screen = None
+_drawn = {}
+
+def get_font(size=consts.TEXT_SIZE):
+    font = _fonts.get(size)
+    if font is None:
+        font = _fonts[size] = pygame.font.SysFont("monospace", size)
+    return font
+
+def render_text(text, color=white):
+    label = _labels.get((text, color))
+    if label is None:
+        if len(_labels) >= LABEL_CACHE_SIZE:
+            _labels.clear()
+        label = _labels[(text, color)] = get_font().render(text, 1, color)
+    return label
+
 def draw_resource_tile(surface, tile):
-    pi = 3.14
-    n = 6
     position = tile.location
     pygame.draw.polygon(
-        surface, 
+        surface,
         tile.color,
-        [
-            (
-                cos(i / n * 2 * pi + pi / 2) * RESOURCE_RADUIS + position[0],
-                sin(i / n * 2 * pi + pi / 2) * RESOURCE_RADUIS + position[1]
-            )
-            for i in range(0,n)
-        ]
+        [(x + position[0], y + position[1]) for x, y in HEX_OFFSETS]
     )
     if tile.chit:
         print_text(surface, str(tile.chit), tile.location, black)
-    if tile.blocked:
-        pygame.draw.circle(
-                surface,
-                consts.ROBBER_COLOR,
-                tile.location,
-                consts.ROBBER_SIZE,
-        )
+
+def draw_robber(surface, tile):
+    pygame.draw.circle(
+            surface,
+            consts.ROBBER_COLOR,
+            tile.location,
+            consts.ROBBER_SIZE,
+    )
 
 def draw_settlement(surface, settlement):
     pygame.draw.circle(
@@ -67,36 +101,41 @@ def draw_port(screen, port):
             )
     )
 
+def static_layer(screen, board):
+    """
+    The tiles, chits and ports of the board on a black surface the size of the screen,
+    drawn again only when the layout differs from the last board's.
+    """
+    global _static
+    key = (board.ports_enabled, tuple((tile.location, tile.color, tile.chit) for tile in board.tiles))
+    if _static[0] != key:
+        layer = pygame.Surface(screen.get_size()).convert(screen)
+        layer.fill(black)
+        for tile in board.tiles:
+            draw_resource_tile(layer, tile)
+        if board.ports_enabled:
+            for port in consts.Ports:
+                draw_port(layer, port)
+        _static = (key, layer)
+    return _static[1]
+
 def print_board(screen, board):
+    screen.blit(static_layer(screen, board), (0, 0))
     for tile in board.tiles:
-        draw_resource_tile(screen, tile)
-    if board.ports_enabled:
-        for port in consts.Ports:
-            draw_port(screen, port)
+        if tile.blocked:
+            draw_robber(screen, tile)
     for settlement in board.settlements:
         draw_settlement(screen, settlement)
     for road in board.roads:
         draw_road(screen, road)
 
 def print_text(screen, text, position, color=white):
-    myfont = pygame.font.SysFont("monospace", consts.TEXT_SIZE)
-    label = myfont.render(text, 1, color)
+    label = render_text(text, color)
     screen.blit(label, position)
-    return myfont.size(text)
+    return label.get_size()
 
-def print_player(screen, player):
-    position = PLAYER_POSITIONS[player.number - 1]
-    pygame.draw.rect(screen, white, position, consts.LINE_WIDTH)
-    print_text(
-            screen, 
-            'Player ' + str(player.number), 
-            (
-                position[0] + consts.LINE_WIDTH* 6, 
-                position[1] + consts.LINE_WIDTH
-            ),
-            player.color, 
-    )
-    labels = [
+def player_labels(player):
+    return [
             'Points: ' + str(player.points),
             'Brick: ' + str(player.hand[consts.Resource.BRICK]),
             'Grain: ' + str(player.hand[consts.Resource.GRAIN]),
@@ -106,63 +145,129 @@ def print_player(screen, player):
             'Dev Cards: ' + str(len(player.d_cards) + len(player.d_card_queue)),
             'Knights: ' + str(player.knights),
     ]
+
+def print_player(screen, player, labels=None):
+    position = PLAYER_POSITIONS[player.number - 1]
+    pygame.draw.rect(screen, white, position, consts.LINE_WIDTH)
+    print_text(
+            screen,
+            'Player ' + str(player.number),
+            (
+                position[0] + consts.LINE_WIDTH* 6,
+                position[1] + consts.LINE_WIDTH
+            ),
+            player.color,
+    )
+    labels = player_labels(player) if labels is None else labels
     def print_player_stats(screen, label, position):
         print_text(screen, label, (position[0], position[1]))
         return (position[0], position[1] + consts.TEXT_SIZE)
     position = (
-            position[0] + consts.LINE_WIDTH* 2, 
+            position[0] + consts.LINE_WIDTH* 2,
             position[1] + consts.LINE_WIDTH + consts.TEXT_SIZE
     )
     for label in labels:
         position = print_player_stats(screen, label, position)
 
+def _bounds(points, radius):
+    xs = [point[0] for point in points]
+    ys = [point[1] for point in points]
+    left, top = int(min(xs) - radius) - 1, int(min(ys) - radius) - 1
+    return pygame.Rect(left, top, int(max(xs) + radius) + 2 - left, int(max(ys) + radius) + 2 - top)
+
+# Regions of the window: everything drawn for the board lies in BOARD_RECT, every player
+# panel in its PLAYER_POSITIONS rect and the dialog along the bottom
+BOARD_RECT = _bounds(consts.TilePositions.values(), RESOURCE_RADUIS).union(
+        _bounds(consts.SettlementPositions.values(), max(consts.PORT_RADIUS, consts.CITY_SIZE)))
+DIALOG_RECT = pygame.Rect(0, consts.HEIGHT - consts.DIALOG_HEIGHT, consts.WIDTH, consts.DIALOG_HEIGHT)
+
 def print_screen(screen, board, text, players, buttons=[]):
-    screen.fill(black)
-    print_board(screen, board)
+    global _drawn_screen
+    # What every region shows this frame, a region is redrawn when it changed
+    regions = {
+            'board': (
+                BOARD_RECT,
+                (
+                    static_layer(screen, board),
+                    tuple(tile.blocked for tile in board.tiles),
+                    tuple((s.position, s.color, s.city) for s in board.settlements),
+                    tuple((r.start, r.end, r.color) for r in board.roads),
+                ),
+            ),
+            'dialog': (DIALOG_RECT, (text, tuple(button['label'] for button in buttons))),
+    }
+    labels = {}
     for player in players:
-        print_player(screen, player)
-    print_dialog(screen, text, buttons)
+        labels[player.number] = player_labels(player)
+        rect = pygame.Rect(PLAYER_POSITIONS[player.number - 1])
+        regions[player.number] = (rect, (player.color, tuple(labels[player.number])))
+
+    if screen is not _drawn_screen:
+        # A new window is drawn whole
+        dirty = [screen.get_rect()]
+        _drawn_screen = screen
+    else:
+        dirty = [rect for name, (rect, shown) in regions.items() if _drawn.get(name) != shown]
+    for name, (rect, shown) in regions.items():
+        _drawn[name] = shown
+
+    # Panels overlap the board, so every dirty region is redrawn with all layers clipped to it
+    for rect in dirty:
+        screen.set_clip(rect)
+        screen.fill(black)
+        print_board(screen, board)
+        for player in players:
+            print_player(screen, player, labels[player.number])
+        print_dialog(screen, text, buttons)
+    screen.set_clip(None)
+    if dirty:
+        pygame.display.update(dirty)
+    else:
+        # The buttons' positions are needed to pick one, even when nothing was redrawn
+        place_buttons(buttons, dialog_text_width(text))
+
+def dialog_text_width(text):
+    return render_text(text).get_width() + consts.LINE_WIDTH * 2
 
 def print_dialog(screen, text, buttons):
     pygame.draw.rect(
-            screen, 
-            white, 
-            (
-                0,
-                consts.HEIGHT - consts.DIALOG_HEIGHT,
-                consts.WIDTH,
-                consts.DIALOG_HEIGHT,
-            ), 
+            screen,
+            white,
+            DIALOG_RECT,
             consts.LINE_WIDTH
     )
-    size = print_text(
-            screen, 
-            text, 
+    print_text(
+            screen,
+            text,
             (
                 consts.LINE_WIDTH * 2,
                 consts.HEIGHT - consts.DIALOG_HEIGHT + consts.LINE_WIDTH
             )
     )
-    far_x = size[0] + consts.LINE_WIDTH * 2
-    print_buttons(screen, buttons, far_x)
-    pygame.display.flip()
+    print_buttons(screen, buttons, dialog_text_width(text))
 
-def print_buttons(screen, buttons, start):
+def place_buttons(buttons, start):
+    """
+    Set every button's 'pos' (its clickable box) and return the boxes drawn around them.
+    """
     top = consts.HEIGHT - consts.DIALOG_HEIGHT + consts.LINE_WIDTH
+    boxes = []
     for button in buttons:
-        size = print_text(
-                screen, 
-                button['label'], 
-                (start + consts.LINE_WIDTH * 4, top)
-        )
+        size = render_text(button['label']).get_size()
         left = start + consts.LINE_WIDTH * 2
         width = size[0] + consts.LINE_WIDTH * 3
-        pygame.draw.rect(
-                screen, 
-                white, 
-                (left, top, width, consts.DIALOG_HEIGHT / 2),
-                2
-        )
+        boxes.append((start + consts.LINE_WIDTH * 4, (left, top, width, consts.DIALOG_HEIGHT / 2)))
         button['pos'] = (left, top, width, consts.TEXT_SIZE * 2)
         start += size[0] + consts.LINE_WIDTH * 5
+    return boxes
 
+def print_buttons(screen, buttons, start):
+    top = consts.HEIGHT - consts.DIALOG_HEIGHT + consts.LINE_WIDTH
+    for button, (text_left, box) in zip(buttons, place_buttons(buttons, start)):
+        print_text(screen, button['label'], (text_left, top))
+        pygame.draw.rect(
+                screen,
+                white,
+                box,
+                2
+        )
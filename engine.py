@@ -0,0 +1,633 @@
+# Apply/undo move engine used by the MCTS search.
+# Every action updates one GameState in place and pushes a small undo record, so the
+# search can walk a single state down the tree and back up again instead of copying it.
+
+import itertools
+import random
+import actions
+import consts
+import topology
+import zobrist
+from frontier import Frontiers
+from longest_road import LongestRoad
+from production import Production
+from state import (
+        NUM_PLAYERS, NUM_RESOURCES, NUM_D_CARDS, NUM_VERTICES, NUM_EDGES,
+        LONGEST_ROAD, LARGEST_ARMY, PLAYED_D_CARD,
+)
+
+# consts.Costs as (resource, amount) pairs
+_COSTS = {
+        item: tuple(cost.items())
+        for item, cost in consts.Costs.items()
+}
+
+# Undo record kinds, the first entry of every record on Engine.history
+_ROAD = 0
+_SETTLEMENT = 1
+_CITY = 2
+_D_CARD = 3
+_EXCHANGE = 4
+_MONOPOLY = 5
+_YOP = 6
+_ROAD_BUILDER = 7
+_END_TURN = 8
+_ROLL = 9
+_LOAD = 10
+_KNIGHT = 11
+
+class Action():
+    """
+        Possible names:
+        place_road
+        place_settlement
+        place_city
+        buy_dcard
+        play_yop
+        # play_knight
+        play_monopoly
+        play_roadbuilder
+        make_exchange
+        end_turn
+    """
+    # Agent method that carries out each action on a real Board and Player
+    methods = {
+        "place_road": "place_road",
+        "place_settlement": "place_settlement",
+        "place_city": "place_city",
+        "buy_dcard": "pick_d_card",
+        "make_exchange": "exchange",
+        "play_monopoly": "play_monopoly",
+        "play_yop": "play_yop",
+        "play_roadbuilder": "play_roadbuilder",
+        "end_turn": "end_turn",
+    }
+    # Item paid for by each building action
+    costs = {
+        "place_road": "road",
+        "place_settlement": "settlement",
+        "place_city": "city",
+        "buy_dcard": "d_card",
+    }
+
+    def __init__(self, name, args={}):
+        self.name = name
+        self.args = args # args as a dictionary of plain values (numbers, labels) to pass to the function
+
+    def do_action(self, player, board=None, players=None):
+        # The args never hold live game objects, so the same action can be applied to the real
+        # game or to the search's scratch copy. The caller supplies the objects to act on.
+        args = dict(self.args)
+        args["player"] = player
+        if board is not None and "board" in args:
+            args["board"] = board
+        if players is not None and "players" in args:
+            args["players"] = players
+
+        if self.name in Action.costs:
+            player.purchase(Action.costs[self.name], board)
+        return getattr(player, Action.methods[self.name])(**args)
+
+    @classmethod
+    def from_code(cls, code):
+        """
+        The Action for an action of the engine's integer action space (see actions.py).
+        """
+        kind, args = actions.decode(code)
+        if kind == actions.END_TURN:
+            return cls("end_turn", {})
+        if kind == actions.BUY_D_CARD:
+            return cls("buy_dcard", {"board": None})
+        if kind == actions.PLACE_ROAD:
+            return cls("place_road", {"board": None, "settlement": None, "position": args[0]})
+        if kind == actions.PLACE_SETTLEMENT:
+            return cls("place_settlement", {"board": None, "first": False, "position": args[0]})
+        if kind == actions.PLACE_CITY:
+            return cls("place_city", {"board": None, "settlement": args[0]})
+        if kind == actions.EXCHANGE:
+            return cls("make_exchange", {"board": None, "r1": args[0], "amt1": -actions.EXCHANGE_RATE, "r2": args[1], "amt2": 1})
+        if kind == actions.MONOPOLY:
+            return cls("play_monopoly", {"board": None, "resourceType": args[0], "card": 'Monopoly', "players": None})
+        if kind == actions.YEAR_OF_PLENTY:
+            return cls("play_yop", {"board": None, "resource1": args[0], "resource2": args[1], "card": 'Year Of Plenty'})
+        return cls("play_roadbuilder", {"board": None, "card": 'Road Builder', "pos1": args[0], "pos2": args[1]})
+
+    def __str__(self):
+        return f"Action(name={self.name})"
+
+    def __repr__(self):
+        return self.__str__()
+
+class Engine(object):
+    """
+    Applies actions to a GameState in place. Each call to one of the action methods (or
+    apply) pushes one record on self.history, and undo() reverts the most recent one, so
+    undoing everything restores the exact starting state. self.hash is the Zobrist hash
+    of the current state (see zobrist.py).
+
+    Actions are played by the player whose turn it is (state.turn). Cards bought without
+    saying which are drawn with `rng` (a random.Random, or the global random module).
+    """
+
+    def __init__(self, state, rng=None):
+        self.state = state
+        self.rng = rng
+        self.history = []
+        self._index(state)
+        # Zobrist hash of the current state, and the hash after every applied action
+        self.root_hash = self.hash = zobrist.hash_state(state)
+        self.hashes = []
+
+    def depth(self):
+        """
+        Number of applied actions that can still be undone.
+        """
+        return len(self.history)
+
+    def undo_to(self, depth):
+        """
+        Undo actions until only `depth` of them remain applied.
+        """
+        while len(self.history) > depth:
+            self.undo()
+
+    # --- Legal actions ---
+
+    def can_afford(self, p, item):
+        hands = self.state.hands
+        base = p * NUM_RESOURCES
+        for resource, amount in _COSTS[item]:
+            if hands[base + resource] < amount:
+                return False
+        return True
+
+    def can_place_road(self, p, edge):
+        """
+        An edge is free and touches one of the player's roads (same rule as Player.place_road).
+        """
+        return edge in self.frontiers.roads[p]
+
+    def can_place_settlement(self, p, vertex):
+        """
+        A vertex is empty, has no neighboring settlement and touches one of the player's roads.
+        """
+        return vertex in self.frontiers.settlements[p]
+
+    def legal_actions(self):
+        """
+        List every action available to the player whose turn it is, as ints of the
+        action space in actions.py.
+        """
+        state = self.state
+        p = state.turn
+        number = p + 1
+        list_of_actions = []
+
+        # Purchases: the player must afford the item and have a piece and a spot for it
+        if self.can_afford(p, 'city') and state.cities_left[p] > 0:
+            for vertex in range(NUM_VERTICES):
+                if state.vertex_owner[vertex] == number and not state.vertex_city[vertex]:
+                    list_of_actions.append(actions.PLACE_CITY + vertex)
+        if self.can_afford(p, 'settlement') and state.settlements_left[p] > 0:
+            for vertex in sorted(self.frontiers.settlements[p]):
+                list_of_actions.append(actions.PLACE_SETTLEMENT + vertex)
+        if self.can_afford(p, 'road') and state.roads_left[p] > 0:
+            for edge in self.road_frontier(p):
+                list_of_actions.append(actions.PLACE_ROAD + edge)
+        if self.can_afford(p, 'd_card') and any(state.deck):
+            list_of_actions.append(actions.BUY_D_CARD)
+
+        # 4:1 exchanges with the bank (ports are disabled, see Player.has_port)
+        base = p * NUM_RESOURCES
+        for resource in range(NUM_RESOURCES):
+            if state.hands[base + resource] >= actions.EXCHANGE_RATE:
+                for r in range(NUM_RESOURCES):
+                    list_of_actions.append(actions.EXCHANGE + resource * NUM_RESOURCES + r)
+
+        # Development cards bought before this turn, at most one per turn
+        row = p * NUM_D_CARDS
+        if not state.flags[p] & PLAYED_D_CARD:
+            if state.d_cards[row + consts.DCard.MONOPOLY]:
+                for resource in range(NUM_RESOURCES):
+                    list_of_actions.append(actions.MONOPOLY + resource)
+            if state.d_cards[row + consts.DCard.ROAD_BUILDER] and state.roads_left[p] >= 2:
+                for first, second in self.road_builder_pairs(p):
+                    list_of_actions.append(actions.ROAD_BUILDER + first * NUM_EDGES + second)
+            if state.d_cards[row + consts.DCard.YEAR_OF_PLENTY]:
+                for resource1, resource2 in itertools.combinations_with_replacement(range(NUM_RESOURCES), 2):
+                    list_of_actions.append(actions.YEAR_OF_PLENTY + resource1 * NUM_RESOURCES + resource2)
+
+        # Last possible action of every "turn" is to end the turn
+        list_of_actions.append(actions.END_TURN)
+        return list_of_actions
+
+    def road_frontier(self, p):
+        """
+        Edges where the player can place a road now.
+        """
+        return sorted(self.frontiers.roads[p])
+
+    def road_builder_pairs(self, p):
+        """
+        (first, second) road placements for a Road Builder card, one per resulting pair of
+        roads. Two edges of the road frontier come in one order only; an edge that is only
+        reachable through the first road joins the frontier with it and comes second.
+        """
+        edge_owner = self.state.edge_owner
+        frontier = self.road_frontier(p)
+        reachable = set(frontier)
+        pairs = []
+        for i, first in enumerate(frontier):
+            for second in frontier[i + 1:]:
+                pairs.append((first, second))
+            for second in topology.EdgeNeighbors[first]:
+                if not edge_owner[second] and second not in reachable:
+                    pairs.append((first, second))
+        return pairs
+
+    # --- Actions ---
+
+    def apply(self, action, outcome=None):
+        """
+        Apply an action (an int of the action space in actions.py) for the player whose
+        turn it is. Returns the random outcome of the action (the card drawn by buy_dcard),
+        pass it back in to replay the same outcome.
+        """
+        kind, args = actions.decode(action)
+        if kind == actions.PLACE_ROAD:
+            self.place_road(*args)
+        elif kind == actions.PLACE_SETTLEMENT:
+            self.place_settlement(*args)
+        elif kind == actions.PLACE_CITY:
+            self.place_city(*args)
+        elif kind == actions.BUY_D_CARD:
+            return self.buy_dcard(outcome)
+        elif kind == actions.EXCHANGE:
+            self.exchange(args[0], -actions.EXCHANGE_RATE, args[1], 1)
+        elif kind == actions.MONOPOLY:
+            self.play_monopoly(*args)
+        elif kind == actions.YEAR_OF_PLENTY:
+            self.play_yop(*args)
+        elif kind == actions.ROAD_BUILDER:
+            self.play_roadbuilder(*args)
+        else:
+            self.end_turn()
+        return None
+
+    def place_road(self, edge):
+        p = self.state.turn
+        self._pay(p, 'road')
+        award = self._add_road(p, edge)
+        self._push((_ROAD, p, edge, award))
+
+    def place_settlement(self, vertex):
+        state = self.state
+        p = state.turn
+        self._pay(p, 'settlement')
+        self._set(zobrist.VERTEX_OWNER, state.vertex_owner, vertex, p + 1)
+        self.roads.add_settlement(p, vertex)
+        self.production.add_settlement(p, vertex)
+        self.frontiers.add_settlement(p, vertex)
+        state.settlements_left[p] -= 1
+        self._set(zobrist.POINTS, state.points, p, state.points[p] + 1)
+        # Cutting an opponent's road can move the longest road award
+        award = self._update_longest_road()
+        self._push((_SETTLEMENT, p, vertex, award))
+
+    def place_city(self, vertex):
+        # Like Settlement.make_city, upgrading only adds a point
+        state = self.state
+        p = state.turn
+        self._pay(p, 'city')
+        self._set(zobrist.VERTEX_CITY, state.vertex_city, vertex, 1)
+        self.production.set_city(vertex)
+        self._set(zobrist.POINTS, state.points, p, state.points[p] + 1)
+        self._push((_CITY, p, vertex))
+
+    def buy_dcard(self, card=None):
+        """
+        Buy a development card. The card is drawn at random, weighted by the cards left
+        in the deck, unless it is given. Returns the card type.
+        """
+        state = self.state
+        p = state.turn
+        if card is None:
+            card = (self.rng or random).choices(range(NUM_D_CARDS), weights=state.deck, k=1)[0]
+        self._pay(p, 'd_card')
+        self._set(zobrist.DECK, state.deck, card, state.deck[card] - 1)
+        index = p * NUM_D_CARDS + card
+        self._set(zobrist.D_CARD_QUEUE, state.d_card_queue, index, state.d_card_queue[index] + 1)
+        self._push((_D_CARD, p, card))
+        return card
+
+    def exchange(self, r1, amt1, r2, amt2):
+        state = self.state
+        p = state.turn
+        base = p * NUM_RESOURCES
+        self._set(zobrist.HANDS, state.hands, base + r1, state.hands[base + r1] + amt1)
+        self._set(zobrist.HANDS, state.hands, base + r2, state.hands[base + r2] + amt2)
+        self._push((_EXCHANGE, p, r1, amt1, r2, amt2))
+
+    def play_monopoly(self, resource):
+        state = self.state
+        p = state.turn
+        flags = self._play_card(p, consts.DCard.MONOPOLY)
+        hands = state.hands
+        taken = []
+        for other in range(NUM_PLAYERS):
+            index = other * NUM_RESOURCES + resource
+            amount = hands[index] if other != p else 0
+            self._set(zobrist.HANDS, hands, index, hands[index] - amount)
+            taken.append(amount)
+        index = p * NUM_RESOURCES + resource
+        self._set(zobrist.HANDS, hands, index, hands[index] + sum(taken))
+        self._push((_MONOPOLY, p, resource, tuple(taken), flags))
+
+    def play_yop(self, resource1, resource2):
+        state = self.state
+        p = state.turn
+        flags = self._play_card(p, consts.DCard.YEAR_OF_PLENTY)
+        for resource in (resource1, resource2):
+            index = p * NUM_RESOURCES + resource
+            self._set(zobrist.HANDS, state.hands, index, state.hands[index] + 1)
+        self._push((_YOP, p, resource1, resource2, flags))
+
+    def play_roadbuilder(self, first, second):
+        """
+        Play a Road Builder card. A road may be None if there is no room for it (only
+        rollouts do that, the card is not a legal action then).
+        """
+        p = self.state.turn
+        flags = self._play_card(p, consts.DCard.ROAD_BUILDER)
+        award1 = None if first is None else self._add_road(p, first)
+        award2 = None if second is None else self._add_road(p, second)
+        self._push((_ROAD_BUILDER, p, first, award1, second, award2, flags))
+
+    def play_knight(self, tile, victim=None, resource=None):
+        """
+        Play a Knight card: move the robber to tile, take one resource from the victim
+        (None if nobody is robbed) and check the largest army. Knights are only played
+        by rollouts, they are not part of the action space.
+        """
+        state = self.state
+        p = state.turn
+        flags = self._play_card(p, consts.DCard.KNIGHT)
+        robber = state.robber
+        self.hash ^= zobrist.ROBBER[0][robber + 1] ^ zobrist.ROBBER[0][tile + 1]
+        state.robber = tile
+        self.production.move_robber(tile)
+        if victim is not None:
+            hands = state.hands
+            index = victim * NUM_RESOURCES + resource
+            self._set(zobrist.HANDS, hands, index, hands[index] - 1)
+            index = p * NUM_RESOURCES + resource
+            self._set(zobrist.HANDS, hands, index, hands[index] + 1)
+        self._set(zobrist.KNIGHTS, state.knights, p, state.knights[p] + 1)
+        previous = self._update_largest_army(p)
+        self._push((_KNIGHT, p, robber, victim, resource, previous, flags))
+
+    def end_turn(self):
+        """
+        Cards bought this turn become playable and the next player starts their turn.
+        """
+        state = self.state
+        p = state.turn
+        row = p * NUM_D_CARDS
+        queue = bytes(state.d_card_queue[row:row + NUM_D_CARDS])
+        for card in range(NUM_D_CARDS):
+            if queue[card]:
+                self._set(zobrist.D_CARDS, state.d_cards, row + card, state.d_cards[row + card] + queue[card])
+                self._set(zobrist.D_CARD_QUEUE, state.d_card_queue, row + card, 0)
+        state.turn = (p + 1) % NUM_PLAYERS
+        self.hash ^= zobrist.TURN[0][p] ^ zobrist.TURN[0][state.turn]
+        flags = state.flags[state.turn]
+        self._set(zobrist.FLAGS, state.flags, state.turn, flags & ~PLAYED_D_CARD)
+        self._push((_END_TURN, p, queue, flags))
+
+    def roll(self, total):
+        """
+        Hand out the resources produced by a dice total.
+        """
+        self._produce(total, 1)
+        self._push((_ROLL, total))
+
+    def load(self, state):
+        """
+        Replace the whole state with a copy of another one, e.g. an outcome sampled by a
+        simulation that does not go through the engine.
+        """
+        previous = (_LOAD, self.state, self.roads, self.production, self.frontiers)
+        self.state = state.clone()
+        self._index(self.state)
+        self.hash = zobrist.hash_state(self.state)
+        self._push(previous)
+
+    def undo(self):
+        """
+        Revert the most recently applied action.
+        """
+        record = self.history.pop()
+        self.hashes.pop()
+        kind = record[0]
+        state = self.state
+        if kind == _ROAD:
+            _, p, edge, award = record
+            self._remove_road(p, edge, award)
+            self._refund(p, 'road')
+        elif kind == _SETTLEMENT:
+            _, p, vertex, award = record
+            self._revert_longest_road(award)
+            state.vertex_owner[vertex] = 0
+            self.roads.remove_settlement(p, vertex)
+            self.production.remove_settlement(vertex)
+            self.frontiers.remove_settlement(p, vertex)
+            state.settlements_left[p] += 1
+            state.points[p] -= 1
+            self._refund(p, 'settlement')
+        elif kind == _CITY:
+            _, p, vertex = record
+            state.vertex_city[vertex] = 0
+            self.production.set_city(vertex, False)
+            state.points[p] -= 1
+            self._refund(p, 'city')
+        elif kind == _D_CARD:
+            _, p, card = record
+            state.deck[card] += 1
+            state.d_card_queue[p * NUM_D_CARDS + card] -= 1
+            self._refund(p, 'd_card')
+        elif kind == _EXCHANGE:
+            _, p, r1, amt1, r2, amt2 = record
+            base = p * NUM_RESOURCES
+            state.hands[base + r1] -= amt1
+            state.hands[base + r2] -= amt2
+        elif kind == _MONOPOLY:
+            _, p, resource, taken, flags = record
+            for other in range(NUM_PLAYERS):
+                state.hands[other * NUM_RESOURCES + resource] += taken[other]
+            state.hands[p * NUM_RESOURCES + resource] -= sum(taken)
+            self._unplay_card(p, consts.DCard.MONOPOLY, flags)
+        elif kind == _YOP:
+            _, p, resource1, resource2, flags = record
+            state.hands[p * NUM_RESOURCES + resource1] -= 1
+            state.hands[p * NUM_RESOURCES + resource2] -= 1
+            self._unplay_card(p, consts.DCard.YEAR_OF_PLENTY, flags)
+        elif kind == _ROAD_BUILDER:
+            _, p, first, award1, second, award2, flags = record
+            if second is not None:
+                self._remove_road(p, second, award2)
+            if first is not None:
+                self._remove_road(p, first, award1)
+            self._unplay_card(p, consts.DCard.ROAD_BUILDER, flags)
+        elif kind == _KNIGHT:
+            _, p, robber, victim, resource, previous, flags = record
+            if previous is not False:
+                state.flags[p] &= ~LARGEST_ARMY
+                state.points[p] -= 2
+                if previous is not None:
+                    state.flags[previous] |= LARGEST_ARMY
+                    state.points[previous] += 2
+            state.knights[p] -= 1
+            if victim is not None:
+                state.hands[p * NUM_RESOURCES + resource] -= 1
+                state.hands[victim * NUM_RESOURCES + resource] += 1
+            state.robber = robber
+            self.production.move_robber(robber)
+            self._unplay_card(p, consts.DCard.KNIGHT, flags)
+        elif kind == _END_TURN:
+            _, p, queue, flags = record
+            state.flags[state.turn] = flags
+            state.turn = p
+            row = p * NUM_D_CARDS
+            for card in range(NUM_D_CARDS):
+                state.d_cards[row + card] -= queue[card]
+                state.d_card_queue[row + card] = queue[card]
+        elif kind == _ROLL:
+            self._produce(record[1], -1)
+        elif kind == _LOAD:
+            _, self.state, self.roads, self.production, self.frontiers = record
+        # Set last, reverting a roll goes through _produce, which updates the hash
+        self.hash = self.hashes[-1] if self.hashes else self.root_hash
+
+    # --- Helpers ---
+
+    def _index(self, state):
+        # Longest road, dice production and build frontier indexes kept alongside the state
+        self.roads = LongestRoad.from_owners(state.vertex_owner, state.edge_owner, NUM_PLAYERS)
+        self.production = Production.from_owners(state.tiles, state.robber, state.vertex_owner, state.vertex_city)
+        self.frontiers = Frontiers.from_owners(state.vertex_owner, state.edge_owner, NUM_PLAYERS)
+
+    def _push(self, record):
+        # Every applied action pushes its undo record and the hash it led to
+        self.history.append(record)
+        self.hashes.append(self.hash)
+
+    def _set(self, table, cells, index, value):
+        # Store a value in one cell of the state and update the hash (undo restores the
+        # hash from self.hashes instead)
+        self.hash ^= table[index][cells[index] & zobrist.COUNT_MASK] ^ table[index][value & zobrist.COUNT_MASK]
+        cells[index] = value
+
+    def _pay(self, p, item):
+        hands = self.state.hands
+        base = p * NUM_RESOURCES
+        for resource, amount in _COSTS[item]:
+            self._set(zobrist.HANDS, hands, base + resource, hands[base + resource] - amount)
+
+    def _refund(self, p, item):
+        hands = self.state.hands
+        base = p * NUM_RESOURCES
+        for resource, amount in _COSTS[item]:
+            hands[base + resource] += amount
+
+    def _play_card(self, p, card):
+        # Returns the player's flags from before the card was played
+        state = self.state
+        flags = state.flags[p]
+        index = p * NUM_D_CARDS + card
+        self._set(zobrist.D_CARDS, state.d_cards, index, state.d_cards[index] - 1)
+        self._set(zobrist.FLAGS, state.flags, p, flags | PLAYED_D_CARD)
+        return flags
+
+    def _unplay_card(self, p, card, flags):
+        state = self.state
+        state.d_cards[p * NUM_D_CARDS + card] += 1
+        state.flags[p] = flags
+
+    def _add_road(self, p, edge):
+        # Returns the change of the longest road award this road caused, if any
+        state = self.state
+        self._set(zobrist.EDGE_OWNER, state.edge_owner, edge, p + 1)
+        self.roads.add_road(p, edge)
+        self.frontiers.add_road(p, edge)
+        state.roads_left[p] -= 1
+        if state.roads_left[p] <= 15 - 5:
+            return self._update_longest_road()
+        return None
+
+    def _remove_road(self, p, edge, award):
+        state = self.state
+        self._revert_longest_road(award)
+        state.edge_owner[edge] = 0
+        self.roads.remove_road(p, edge)
+        self.frontiers.remove_road(p, edge)
+        state.roads_left[p] += 1
+
+    def _update_longest_road(self):
+        # Same rule as Board.check_longest_road: a single player with the longest road of at
+        # least 5 takes the award. Returns (previous holder, new holder) if the award moved.
+        state = self.state
+        best_player = self.roads.leader()
+        if best_player is None or state.flags[best_player] & LONGEST_ROAD:
+            return None
+        previous = None
+        for p in range(NUM_PLAYERS):
+            if state.flags[p] & LONGEST_ROAD:
+                self._set(zobrist.FLAGS, state.flags, p, state.flags[p] & ~LONGEST_ROAD)
+                self._set(zobrist.POINTS, state.points, p, state.points[p] - 2)
+                previous = p
+        self._set(zobrist.FLAGS, state.flags, best_player, state.flags[best_player] | LONGEST_ROAD)
+        self._set(zobrist.POINTS, state.points, best_player, state.points[best_player] + 2)
+        return previous, best_player
+
+    def _revert_longest_road(self, award):
+        # Undo an award change returned by _update_longest_road
+        if award is None:
+            return
+        state = self.state
+        previous, holder = award
+        state.flags[holder] &= ~LONGEST_ROAD
+        state.points[holder] -= 2
+        if previous is not None:
+            state.flags[previous] |= LONGEST_ROAD
+            state.points[previous] += 2
+
+    def _update_largest_army(self, p):
+        # Same rule as Knight.make_action: at least 3 knights and more than everybody else
+        # takes the award. Returns the previous holder (None if nobody) if p took it, else False.
+        state = self.state
+        knights = state.knights[p]
+        if knights < 3 or state.flags[p] & LARGEST_ARMY:
+            return False
+        if any(state.knights[other] >= knights for other in range(NUM_PLAYERS) if other != p):
+            return False
+        previous = None
+        for other in range(NUM_PLAYERS):
+            if state.flags[other] & LARGEST_ARMY:
+                previous = other
+                self._set(zobrist.FLAGS, state.flags, other, state.flags[other] & ~LARGEST_ARMY)
+                self._set(zobrist.POINTS, state.points, other, state.points[other] - 2)
+        self._set(zobrist.FLAGS, state.flags, p, state.flags[p] | LARGEST_ARMY)
+        self._set(zobrist.POINTS, state.points, p, state.points[p] + 2)
+        return previous
+
+    def road_length(self, p):
+        """
+        Length of player p's longest road, not running through other players' settlements.
+        """
+        return self.roads.lengths[p]
+
+    def _produce(self, total, sign):
+        hands = self.state.hands
+        for p, resource, amount in self.production.yields(total):
+            index = p * NUM_RESOURCES + resource
+            self._set(zobrist.HANDS, hands, index, hands[index] + sign * amount)
@@ -0,0 +1,82 @@
+# Incremental build frontiers.
+# For every player the edges where a road can go (free and next to one of their roads)
+# and the vertices where a settlement can go after the draft (open and at the end of one
+# of their roads) are kept as sets. Placing or removing a piece only rechecks the edges
+# and vertices around it, so "can I build" and "where" are set lookups.
+
+import topology
+from topology import NUM_VERTICES, NUM_EDGES
+
+class Frontiers(object):
+    """
+    Legal road edges and settlement vertices per player index (player.number - 1),
+    updated as pieces are added and removed.
+    """
+
+    def __init__(self, num_players=4):
+        # Owners as player numbers, 0 if empty
+        self.vertex_owner = bytearray(NUM_VERTICES)
+        self.edge_owner = bytearray(NUM_EDGES)
+        # Empty vertices with no neighboring settlement (where draft settlements can go)
+        self.open_vertices = set(range(NUM_VERTICES))
+        self.roads = [set() for _ in range(num_players)]
+        self.settlements = [set() for _ in range(num_players)]
+
+    @classmethod
+    def from_owners(cls, vertex_owner, edge_owner, num_players=4):
+        """
+        Build the frontiers for a board given vertex and edge owners as player numbers.
+        """
+        frontiers = cls(num_players)
+        for vertex, owner in enumerate(vertex_owner):
+            if owner:
+                frontiers.add_settlement(owner - 1, vertex)
+        for edge, owner in enumerate(edge_owner):
+            if owner:
+                frontiers.add_road(owner - 1, edge)
+        return frontiers
+
+    def add_road(self, p, edge):
+        self.edge_owner[edge] = p + 1
+        self._update_around_edge(edge)
+
+    def remove_road(self, p, edge):
+        self.edge_owner[edge] = 0
+        self._update_around_edge(edge)
+
+    def add_settlement(self, p, vertex):
+        self.vertex_owner[vertex] = p + 1
+        self._update_vertices((vertex,) + topology.VertexNeighbors[vertex])
+
+    def remove_settlement(self, p, vertex):
+        self.vertex_owner[vertex] = 0
+        self._update_vertices((vertex,) + topology.VertexNeighbors[vertex])
+
+    def _update_around_edge(self, edge):
+        # A road changes who can build on the edge itself, the edges next to it and its ends
+        self._update_edges((edge,) + topology.EdgeNeighbors[edge])
+        self._update_vertices(topology.EdgeVertices[edge])
+
+    def _update_edges(self, edges):
+        edge_owner = self.edge_owner
+        for edge in edges:
+            for roads in self.roads:
+                roads.discard(edge)
+            if edge_owner[edge]:
+                continue
+            for other in topology.EdgeNeighbors[edge]:
+                if edge_owner[other]:
+                    self.roads[edge_owner[other] - 1].add(edge)
+
+    def _update_vertices(self, vertices):
+        vertex_owner = self.vertex_owner
+        for vertex in vertices:
+            self.open_vertices.discard(vertex)
+            for settlements in self.settlements:
+                settlements.discard(vertex)
+            if vertex_owner[vertex] or any(vertex_owner[neighbor] for neighbor in topology.VertexNeighbors[vertex]):
+                continue
+            self.open_vertices.add(vertex)
+            for edge in topology.VertexEdges[vertex]:
+                if self.edge_owner[edge]:
+                    self.settlements[self.edge_owner[edge] - 1].add(vertex)
@@ -2,14 +2,17 @@
 # Any modifications will be noted via comments and commits
 
 import consts
-import pygame
 import math
 from board import Board
-from draw import print_screen
+from view import print_screen, handle_events, wait_for_quit
 from dice import Dice
 from player import Player, ComputerPlayer
 from agent import Agent
-import sys
+from background import BackgroundSearch
+from metrics import JsonLines
+from viewer import Viewer, VIEWER_FPS
+from rng import Streams
+import time
 import argparse
 from typing import List
 from utils import get_possible_purchases, end_turn, give_resources, get_winner
@@ -17,11 +20,10 @@ from utils import get_possible_purchases, end_turn, give_resources, get_winner
 from copy import deepcopy
 
 
-pygame.init()
-
 size = consts.SCREEN_SIZE
 black = consts.BLACK
-screen = pygame.display.set_mode(size)
+# Window opened by main, stays None when the game runs headless
+screen = None
 
 def pick_settlements(players: List[Player], board: Board):
     def draft_round(players, board, second):
@@ -44,28 +46,27 @@ def pick_settlements(players: List[Player], board: Board):
     draft_round(players, board, True)
     players.reverse()
 
-def main():
-    parser = argparse.ArgumentParser(description="Catan Game")
-    parser.add_argument('--disable-ports', action='store_true', help="Disable ports in the game")
-    args = parser.parse_args()
-
-    ports_enabled = not args.disable_ports
-
-    board = Board(ports_enabled=ports_enabled)  # Pass the flag to the Board class
-    dice = Dice()
-    players = [ Agent(1) ] + [ ComputerPlayer(i) for i in range(2,5) ]
+def play_game(board, players, dice=None, max_turns=None, move_times=None, verbose=False):
+    """
+    Play turns after the draft until a player wins or max_turns turns have been played.
+    Returns the winner (None if the game was cut off), the number of turns played and
+    the time every turn took as (player number, seconds). Given a `move_times` list, the
+    time of every decision (every pick_option) is added to it the same way. With
+    `verbose`, every turn and the agent's options and picks are printed.
+    """
+    dice = Dice() if dice is None else dice
     player_turn = 0
-    pick_settlements(players, board)
     first_turn = True
     winner = None
+    turn_times = []
     i = 0
-    while winner is None:
-        print(f"turn {i}")
+    while winner is None and (max_turns is None or i < max_turns):
+        if verbose:
+            print(f"turn {i}")
         i += 1
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                sys.exit()
+        handle_events(screen)
         player = players[player_turn]
+        start = time.perf_counter()
         player.start_turn()
         def get_buttons(total = None):
             buttons = [
@@ -109,13 +110,13 @@ def main():
                 return buttons, 'Player ' + str(player.number) + ': '
 
         # If agent, use the MCTS agent to pick the best action
-        if player_turn == 0:
+        if isinstance(player, Agent):
             # Roll the dice to get the resources and start the turn
             total = sum(dice.roll())
             give_resources(board, total)
 
             # Now, actually use the MCTS agent to play their turn
-            board, players = player.play_turn(board, players, False)
+            board, players = player.play_turn(board, players, False, move_times, verbose)
             player = players[player_turn]
             label = 'Player %s\'s Turn' % player.number + ', You Rolled: ' + str(total)
             print_screen(screen, board, label, players)
@@ -135,21 +136,72 @@ def main():
             label = 'Player %s\'s Turn' % player.number
             while buttons:
                 print_screen(screen, board, label, players, buttons)
+                picked = time.perf_counter()
                 option = player.pick_option(buttons, board, players)
+                if move_times is not None:
+                    move_times.append((player.number, time.perf_counter() - picked))
                 buttons, label = option['action']()
                 if not buttons and label != 'end':
                     buttons, label = get_buttons()
             player.end_turn()
+        turn_times.append((player.number, time.perf_counter() - start))
         player_turn = (player_turn + 1) % 4
         if player_turn == 0:
             first_turn = False
         winner = get_winner(players)
+    return winner, i, turn_times
+
+def main():
+    parser = argparse.ArgumentParser(description="Catan Game")
+    parser.add_argument('--disable-ports', action='store_true', help="Disable ports in the game")
+    parser.add_argument('--headless', action='store_true', help="Play without a window, pygame is not imported")
+    parser.add_argument('--viewer', action='store_true', help="Draw the game in a window of its own process, the game never waits for it")
+    parser.add_argument('--viewer-fps', type=int, default=VIEWER_FPS, help="Frames per second drawn by the viewer")
+    parser.add_argument('--metrics', default=None, help="Write the agent's search metrics to this file, one JSON line per decision")
+    parser.add_argument('--verbose', action='store_true', help="Print every turn and the agent's options and picks")
+    parser.add_argument('--seed', type=int, default=None, help="Seed the board, dice, deck and players' streams so the game replays exactly")
+    parser.add_argument('--time-budget', type=int, default=None, help="Search for this many milliseconds per decision instead of a fixed number of iterations")
+    args = parser.parse_args()
+
+    global screen
+    ports_enabled = not args.disable_ports
+    if args.viewer:
+        screen = Viewer(ports_enabled, args.viewer_fps)
+    elif not args.headless:
+        import pygame
+        pygame.init()
+        screen = pygame.display.set_mode(size)
+
+    if args.seed is None:
+        # Every draw comes from the global random module
+        board = Board(ports_enabled=ports_enabled)  # Pass the flag to the Board class
+        dice = Dice()
+        search_rng = policy_rng = None
+    else:
+        # Every purpose draws from its own stream of the seed, like the self-play games
+        streams = Streams(args.seed)
+        board = Board(ports_enabled=ports_enabled, rng=streams.board, deck_rng=streams.deck)
+        dice = streams.dice
+        search_rng, policy_rng = streams.search, streams.policy
+    on_search = JsonLines(args.metrics) if args.metrics else None
+    if args.time_budget is None:
+        agent = Agent(1, rng=search_rng, on_search=on_search)
+    else:
+        agent = Agent(1, iterations=None, time_budget=args.time_budget, rng=search_rng, on_search=on_search)
+    if screen is not None and not args.viewer:
+        # Search in a worker process so the window stays live while the agent thinks
+        agent.background = BackgroundSearch(agent, screen)
+    players = [ agent ] + [ ComputerPlayer(i, rng=policy_rng) for i in range(2,5) ]
+    try:
+        pick_settlements(players, board)
+        winner, turns, turn_times = play_game(board, players, dice, verbose=args.verbose)
+    finally:
+        # Closed before waiting on the window, which exits the process when it is closed
+        if on_search is not None:
+            on_search.close()
     print_screen(screen, board, 'Player ' + str(winner.number) + ' Wins!', players)
     print('Player ' + str(winner.number) + ' Wins!')
-    while True:
-        event = pygame.event.wait()
-        if event.type == pygame.QUIT:
-            sys.exit()
+    wait_for_quit(screen)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,155 @@
+# Incremental longest road tracking.
+# Each player's roads are kept as connected components (two roads are connected when
+# they share a vertex that is not blocked by another player's settlement). Placing or
+# removing a road or a settlement only recomputes the components it touches, and the
+# longest road of every player is always available in LongestRoad.lengths.
+
+import topology
+from topology import NUM_VERTICES, NUM_EDGES
+
+class LongestRoad(object):
+    """
+    Longest road length per player index (player.number - 1), updated as pieces are
+    added and removed. Removals must undo earlier additions.
+    """
+
+    def __init__(self, num_players=4):
+        # Owners as player numbers, 0 if empty
+        self.vertex_owner = bytearray(NUM_VERTICES)
+        self.edge_owner = bytearray(NUM_EDGES)
+        # Component id of every owned edge, the edges and longest road of every component
+        self.component_of = [-1] * NUM_EDGES
+        self.components = {}
+        self.component_length = {}
+        # Component ids per player and the player's longest road over them
+        self.player_components = [set() for _ in range(num_players)]
+        self.lengths = [0] * num_players
+        self.next_id = 0
+
+    @classmethod
+    def from_owners(cls, vertex_owner, edge_owner, num_players=4):
+        """
+        Build a tracker for a board given vertex and edge owners as player numbers.
+        """
+        tracker = cls(num_players)
+        for vertex, owner in enumerate(vertex_owner):
+            if owner:
+                tracker.add_settlement(owner - 1, vertex)
+        for edge, owner in enumerate(edge_owner):
+            if owner:
+                tracker.add_road(owner - 1, edge)
+        return tracker
+
+    def leader(self):
+        """
+        Index of the only player with the longest road, if it is at least 5 long, else None.
+        """
+        best = max(self.lengths)
+        if best < 5 or self.lengths.count(best) > 1:
+            return None
+        return self.lengths.index(best)
+
+    def add_road(self, p, edge):
+        self.edge_owner[edge] = p + 1
+        affected = {edge}
+        for vertex in topology.EdgeVertices[edge]:
+            if not self._blocked(p, vertex):
+                affected |= self._take_components(p, topology.VertexEdges[vertex])
+        self._rebuild(p, affected)
+
+    def remove_road(self, p, edge):
+        affected = self._take_components(p, (edge,))
+        affected.discard(edge)
+        self.edge_owner[edge] = 0
+        self._rebuild(p, affected)
+
+    def add_settlement(self, p, vertex):
+        self.vertex_owner[vertex] = p + 1
+        # Another player's road running through the vertex is now cut in two
+        for q in self._players_through(vertex, p):
+            self._rebuild(q, self._take_components(q, topology.VertexEdges[vertex]))
+
+    def remove_settlement(self, p, vertex):
+        self.vertex_owner[vertex] = 0
+        # Roads of other players meeting at the vertex are joined again
+        for q in self._players_through(vertex, p):
+            self._rebuild(q, self._take_components(q, topology.VertexEdges[vertex]))
+
+    # --- Helpers ---
+
+    def _blocked(self, p, vertex):
+        # A road can end at another player's settlement but not continue through it
+        owner = self.vertex_owner[vertex]
+        return owner != 0 and owner != p + 1
+
+    def _players_through(self, vertex, p):
+        # Players other than p with at least two roads at the vertex
+        counts = {}
+        for edge in topology.VertexEdges[vertex]:
+            owner = self.edge_owner[edge]
+            if owner and owner != p + 1:
+                counts[owner] = counts.get(owner, 0) + 1
+        return [owner - 1 for owner, count in counts.items() if count >= 2]
+
+    def _take_components(self, p, edges):
+        # Remove the components of player p containing any of the edges, return their edges
+        taken = set()
+        for edge in edges:
+            cid = self.component_of[edge]
+            if cid >= 0 and self.edge_owner[edge] == p + 1 and cid in self.components:
+                taken |= self.components.pop(cid)
+                del self.component_length[cid]
+                self.player_components[p].discard(cid)
+        for edge in taken:
+            self.component_of[edge] = -1
+        return taken
+
+    def _rebuild(self, p, edges):
+        # Split the edges into connected components and measure each of them
+        remaining = set(edges)
+        while remaining:
+            start = remaining.pop()
+            component = {start}
+            stack = [start]
+            while stack:
+                edge = stack.pop()
+                for vertex in topology.EdgeVertices[edge]:
+                    if self._blocked(p, vertex):
+                        continue
+                    for other in topology.VertexEdges[vertex]:
+                        if other in remaining:
+                            remaining.discard(other)
+                            component.add(other)
+                            stack.append(other)
+            cid = self.next_id
+            self.next_id += 1
+            self.components[cid] = component
+            self.component_length[cid] = self._trail_length(p, component)
+            self.player_components[p].add(cid)
+            for edge in component:
+                self.component_of[edge] = cid
+        self.lengths[p] = max((self.component_length[cid] for cid in self.player_components[p]), default=0)
+
+    def _trail_length(self, p, component):
+        # Longest path through the component that uses every road at most once
+        def dfs(vertex, used):
+            if used and self._blocked(p, vertex):
+                return 0
+            best = 0
+            for edge in topology.VertexEdges[vertex]:
+                if edge in component and edge not in used:
+                    used.add(edge)
+                    length = 1 + dfs(topology.other_end(edge, vertex), used)
+                    used.discard(edge)
+                    if length > best:
+                        best = length
+            return best
+
+        # A longest path starts at a dead end or a junction unless the component is a loop
+        vertices = set(vertex for edge in component for vertex in topology.EdgeVertices[edge])
+        starts = [
+                vertex for vertex in vertices
+                if sum(1 for edge in topology.VertexEdges[vertex] if edge in component) != 2
+                or self._blocked(p, vertex)
+        ]
+        return max(dfs(vertex, set()) for vertex in (starts or vertices))
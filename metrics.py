@@ -0,0 +1,151 @@
+# Search instrumentation.
+# An Agent given an on_search callback records, for every decision, how often each phase
+# of the search ran and how long it took, and the shape of the tree it left, in a
+# SearchMetrics handed to the callback. Without a callback nothing is recorded, and the
+# search only pays for a few `is None` checks per iteration. JsonLines is a callback that
+# writes one JSON line per decision.
+
+import json
+import time
+
+# Phases of an iteration. Select walks down the tree, expansion lists a node's actions
+# and applies the new one, chance draws an outcome at a chance node (sampling the other
+# players' turns included), simulate plays out from the leaf and backpropagate updates
+# the path and walks the search state back to the root.
+SELECT = 'select'
+EXPAND_ACTIONS = 'expand_actions'
+EXPAND_TRANSITION = 'expand_transition'
+CHANCE = 'chance'
+SIMULATE = 'simulate'
+BACKPROPAGATE = 'backpropagate'
+PHASES = (SELECT, EXPAND_ACTIONS, EXPAND_TRANSITION, CHANCE, SIMULATE, BACKPROPAGATE)
+# Phases that run inside select, and are taken out of its time
+_NESTED = (EXPAND_ACTIONS, EXPAND_TRANSITION, CHANCE)
+
+class SearchMetrics(object):
+    """
+    Phase counts and cumulative seconds of one decision of player `player`, and the
+    size, depth and branching factor of the tree searched. A root-parallel decision adds
+    up its workers' metrics.
+    """
+
+    def __init__(self, player):
+        self.player = player
+        self.counts = dict.fromkeys(PHASES, 0)
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+        self.started = time.perf_counter()
+        self.elapsed = None
+        self.action = None
+        # Nodes of the subtree reused from the last decision, and of the tree searched
+        self.reused = 0
+        self.nodes = 0
+        self.depth = 0
+        # Decision nodes with children, and their children
+        self.expanded = 0
+        self.edges = 0
+
+    def add(self, phase, since, count=1):
+        """
+        Count `count` runs of `phase` that started at `since` (a time.perf_counter()
+        value). Returns the current time, where the next phase starts.
+        """
+        now = time.perf_counter()
+        self.counts[phase] += count
+        self.seconds[phase] += now - since
+        return now
+
+    def reuse(self, root):
+        """
+        Note the subtree the search starts from (None for a new root).
+        """
+        self.reused = 0 if root is None else tree_shape(root)[0]
+
+    def measure(self, root):
+        """
+        Record the shape of the tree under `root` once the search is done.
+        """
+        self.nodes, self.depth, self.expanded, self.edges = tree_shape(root)
+
+    def merge(self, other):
+        """
+        Add the metrics of another tree searched for the same decision (root parallelism).
+        """
+        for phase in PHASES:
+            self.counts[phase] += other.counts[phase]
+            self.seconds[phase] += other.seconds[phase]
+        self.reused += other.reused
+        self.nodes += other.nodes
+        self.depth = max(self.depth, other.depth)
+        self.expanded += other.expanded
+        self.edges += other.edges
+
+    def finish(self, action):
+        """
+        Close the decision, which picked the action code `action`.
+        """
+        self.elapsed = time.perf_counter() - self.started
+        self.action = action
+
+    def to_dict(self):
+        seconds = dict(self.seconds)
+        # Select's own time, without the expansions and draws it led to
+        seconds[SELECT] -= sum(self.seconds[phase] for phase in _NESTED)
+        return {
+                'player': self.player,
+                'action': self.action,
+                'seconds': self.elapsed,
+                'iterations': self.counts[SIMULATE],
+                'phases': {phase: {'count': self.counts[phase], 'seconds': seconds[phase]} for phase in PHASES},
+                'tree': {
+                    'nodes': self.nodes,
+                    'allocated': self.nodes - self.reused,
+                    'depth': self.depth,
+                    'branching': self.edges / self.expanded if self.expanded else 0.0,
+                },
+        }
+
+def tree_shape(root):
+    """
+    (nodes, depth, expanded decision nodes, their children) of the tree under `root`.
+    """
+    nodes = depth = expanded = edges = 0
+    stack = [(root, 0)]
+    while stack:
+        node, level = stack.pop()
+        nodes += 1
+        depth = max(depth, level)
+        if node.children and not node.chance:
+            expanded += 1
+            edges += len(node.children)
+        stack.extend((child, level + 1) for child in node.children)
+    return nodes, depth, expanded, edges
+
+class JsonLines(object):
+    """
+    An on_search callback writing every decision's metrics to `path` as a JSON line.
+    Close it (or use it in a with block) once the game is over.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        # The file is started over on the first write only, later ones append
+        self.started = False
+
+    def __call__(self, metrics):
+        if self.file is None:
+            self.file = open(self.path, 'a' if self.started else 'w')
+            self.started = True
+        self.file.write(json.dumps(metrics.to_dict()) + '\n')
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
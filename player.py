@@ -2,18 +2,19 @@
 # Any modifications will be noted via comments and commits
 
 import consts
-from draw import print_screen
+import topology
+from view import print_screen, wait_for_click
 import math
-import pygame
 import random
-import sys
 
 # Represents a player in the game 
 class Player(object):
-    def __init__(self, number):
+    def __init__(self, number, rng=None):
         # Player ID and color 
         self.number = number
         self.color = consts.PlayerColors[number]
+        # random.Random for the player's random picks, None for the global random module (see rng.py)
+        self.rng = rng
 
         # Player resources, initialized to zero 
         self.hand = {
@@ -69,8 +70,7 @@ class Player(object):
         if item == 'd_card':
             return len(board.d_cards) > 0
         elif item == 'road':
-            # TODO: and has a place to put it
-            return self.roads_left > 0
+            return self.roads_left > 0 and len(board.frontiers.roads[self.number - 1]) > 0
         elif item == 'city':
             if self.cities_left > 0:
                 for settlement in board.settlements:
@@ -78,11 +78,7 @@ class Player(object):
                         return True
             return False
         elif item == 'settlement':
-            if self.settlements_left > 0:
-                for settlement in consts.SettlementPositions:
-                    if self.can_place_settlement(board, settlement, False):
-                        return True
-            return False
+            return self.settlements_left > 0 and len(board.frontiers.settlements[self.number - 1]) > 0
 
     # Pick and queue a development card 
     def pick_d_card(self, board, player=None):
@@ -99,126 +95,97 @@ class Player(object):
     # UI interaction to place a road on the board 
     def place_road(self, board, settlement=None, position=None):
         while True:
-            event = pygame.event.wait()
-            if event.type == pygame.QUIT:
-                sys.exit()
-            elif event.type == pygame.MOUSEBUTTONUP:
-                for num,pos in consts.RoadMidpoints.items():
-                    dist = math.hypot(pos[0] - event.pos[0], pos[1] - event.pos[1])
-                    if dist < 20:
-                        roads = [(road.start, road.end) for road in board.roads ]
-                        if pos not in roads:
-                            road = Road(self, num)
-                            if settlement:
-                                if road.start == settlement.position or road.end == settlement.position:
-                                    board.roads.append(road)
-                                    self.roads_left -= 1
-                                    if self.roads_left <= 15 - 5:
-                                        board.check_longest_road(self)
-                                    return
-                            else:
-                                roads_owned = [r for r in board.roads if r.color == self.color]
-                                for test_r in roads_owned:
-                                    if road.start == test_r.start or test_r.end == road.end or road.start == test_r.end or road.end == test_r.start:
-                                        board.roads.append(road)
-                                        self.roads_left -= 1
-                                        if self.roads_left <= 15 - 5:
-                                            board.check_longest_road(self)
-                                        return
+            click = wait_for_click()
+            for num,pos in consts.RoadMidpoints.items():
+                dist = math.hypot(pos[0] - click[0], pos[1] - click[1])
+                if dist < 20:
+                    if num in self.road_choices(board, settlement):
+                        board.add_road(Road(self, num))
+                        self.roads_left -= 1
+                        if self.roads_left <= 15 - 5:
+                            board.check_longest_road(self)
+                        return
+
+    # Road numbers the player can build on: free edges touching one of their roads,
+    # or touching the settlement they just placed during the draft
+    def road_choices(self, board, settlement=None):
+        if settlement:
+            return [edge for edge in topology.VertexEdges[settlement.number] if not board.frontiers.edge_owner[edge]]
+        return sorted(board.frontiers.roads[self.number - 1])
+
+    # Settlement numbers the player can build on: open spots at the end of one of their roads,
+    # or any open spot during the draft
+    def settlement_choices(self, board, first):
+        if first:
+            return sorted(board.frontiers.open_vertices)
+        return sorted(board.frontiers.settlements[self.number - 1])
 
     # UI Interaction to place a city on the board
     def place_city(self, board, settlement=None):
         while True:
-            event = pygame.event.wait()
-            if event.type == pygame.QUIT:
-                sys.exit()
-            elif event.type == pygame.MOUSEBUTTONUP:
-                for settlement in board.settlements:
-                    if settlement.player == self:
-                        pos = settlement.position
-                        dist = math.hypot(pos[0] - event.pos[0], pos[1] - event.pos[1])
-                        if dist < 10:
-                            settlement.make_city()
-                            return
+            click = wait_for_click()
+            for settlement in board.settlements:
+                if settlement.player == self:
+                    pos = settlement.position
+                    dist = math.hypot(pos[0] - click[0], pos[1] - click[1])
+                    if dist < 10:
+                        board.make_city(settlement)
+                        return
 
     # Check if a settlement can be placed on the board
     def can_place_settlement(self, board, settlement_number, first):
-        settlements = [settlement.number for settlement in board.settlements]
-        if settlement_number in settlements:
-            return False
-        numbers = [settlement.number for settlement in board.settlements ]
-        connected_roads = [ road for road in consts.Roads if settlement_number in road ]
-        adj = [ road[0] if road[1] == settlement_number else road[1] for road in connected_roads ]
-        combined = set(adj).intersection(set(numbers))
-        if len(combined) == 0:
-            if first:
-                return True
-            else:
-                pos = consts.SettlementPositions[settlement_number]
-            roads = [ road for road in board.roads if road.player == self ]
-            for road in roads:
-                pos = consts.SettlementPositions[settlement_number]
-                if pos == road.start or pos == road.end:
-                    return True
-        return False
+        # Distance rule: no settlement on or next to the spot (the open vertices), and after
+        # the draft one of the player's roads has to lead to it
+        if first:
+            return settlement_number in board.frontiers.open_vertices
+        return settlement_number in board.frontiers.settlements[self.number - 1]
 
     # UI interaction to place a settlement on the board
     def place_settlement(self, board, first, position=None):
         while True:
-            event = pygame.event.wait()
-            if event.type == pygame.QUIT:
-                sys.exit()
-            elif event.type == pygame.MOUSEBUTTONUP:
-                for num,pos in consts.SettlementPositions.items():
-                    dist = math.hypot(pos[0] - event.pos[0], pos[1] - event.pos[1])
-                    if dist < 10:
-                        if self.can_place_settlement(board, num, first):
-                            settlement = Settlement(self, num)
-                            board.settlements.append(settlement)
-                            self.settlements_left -= 1
-                            self.points += 1
-                            return settlement
+            click = wait_for_click()
+            for num,pos in consts.SettlementPositions.items():
+                dist = math.hypot(pos[0] - click[0], pos[1] - click[1])
+                if dist < 10:
+                    if self.can_place_settlement(board, num, first):
+                        settlement = Settlement(self, num)
+                        board.add_settlement(settlement)
+                        self.settlements_left -= 1
+                        self.points += 1
+                        return settlement
 
     # UI interaction to select an option (e.g. for trading or actions)
     def pick_option(self, options, board=None, players=None, simulate=False):
         while True:
-            event = pygame.event.wait()
-            if event.type == pygame.QUIT:
-                sys.exit()
-            elif event.type == pygame.MOUSEBUTTONUP:
-                for option in options:
-                    if is_inside(event.pos, option['pos']):
-                        return option
+            click = wait_for_click()
+            for option in options:
+                if is_inside(click, option['pos']):
+                    return option
 
     # Select which tyle to block with the robber 
     # Called in game.py 
     def pick_tile_to_block(self, board, tile=None):
         while True:
-            event = pygame.event.wait()
-            if event.type == pygame.QUIT:
-                sys.exit()
-            elif event.type == pygame.MOUSEBUTTONUP:
-                for num, pos in consts.TilePositions.items():
-                    dist = math.hypot(pos[0] - event.pos[0], pos[1] - event.pos[1])
-                    if dist < consts.RESOURCE_RADIUS / 2:
-                        tile = board.tiles[num]
-                        if tile.resource is not None and not tile.blocked:
-                            for other_tile in board.tiles:
-                                other_tile.blocked = False
-                            tile.blocked = True
-                            settlements_blocking = consts.TileSettlementMap[num]
-                            players = []
-                            for settlement in board.settlements:
-                                if settlement.number in settlements_blocking and not settlement.player == self:
-                                    players.append(settlement.player)
-                            players = list(set(players))
-                            return sorted(players, key=lambda player: player.number)
+            click = wait_for_click()
+            for num, pos in consts.TilePositions.items():
+                dist = math.hypot(pos[0] - click[0], pos[1] - click[1])
+                if dist < consts.RESOURCE_RADIUS / 2:
+                    tile = board.tiles[num]
+                    if tile.resource is not None and not tile.blocked:
+                        board.move_robber(num)
+                        settlements_blocking = consts.TileSettlementMap[num]
+                        players = []
+                        for settlement in board.settlements:
+                            if settlement.number in settlements_blocking and not settlement.player == self:
+                                players.append(settlement.player)
+                        players = list(set(players))
+                        return sorted(players, key=lambda player: player.number)
 
     # Steals a random resource from another player (also a function of the robber)
     def give_random_to(self, player):
         cards = [ resource for resource in self.hand for x in range(self.hand[resource]) ]
         if cards:
-            card = random.choice(cards)
+            card = (self.rng or random).choice(cards)
             self.hand[card] -= 1
             player.hand[card] += 1
 
@@ -389,41 +356,27 @@ class Player(object):
 # Makes random decisions for placing settlements, roads, and cities
 class ComputerPlayer(Player):
     def place_settlement(self, board, first, position=None):
-        choices = [num for num,pos in consts.SettlementPositions.items() if self.can_place_settlement(board, num, first)]
-        choice = random.choice(choices)
+        choice = (self.rng or random).choice(self.settlement_choices(board, first))
         settlement = Settlement(self, choice)
-        board.settlements.append(settlement)
+        board.add_settlement(settlement)
         self.settlements_left -= 1
         self.points += 1
         return settlement
 
     # UI interaction to place a road on the board
     def place_road(self, board, settlement=None, position=None):
-        choices = []
-        for num,pos in consts.RoadMidpoints.items():
-            if pos not in [(road.start, road.end) for road in board.roads ]:
-                    road = Road(self, num)
-                    if settlement:
-                        if road.start == settlement.position or road.end == settlement.position:
-                            choices.append(road)
-                    else:
-
-                        roads_owned = [r for r in board.roads if r.color == self.color]
-                        for test_r in roads_owned:
-                            if road.start == test_r.start or test_r.end == road.end or road.start == test_r.end or road.end == test_r.start:
-                                choices.append(road)
-                                break
+        choices = self.road_choices(board, settlement)
 
         # Randomly select a road from the available choices
-        road = random.choice(choices)
-        board.roads.append(road)
+        road = Road(self, (self.rng or random).choice(choices))
+        board.add_road(road)
         self.roads_left -= 1
         if self.roads_left <= 15 - 5:
             board.check_longest_road(self)
 
     # Picks a random move to take 
     def pick_option(self, options, board=None, players=None, simulate=False):
-        return random.choice(options)
+        return (self.rng or random).choice(options)
 
     # Randomly blocks tiles when the robber is rolled 
     def pick_tile_to_block(self, board, tile=None):
@@ -431,12 +384,10 @@ class ComputerPlayer(Player):
         for num, pos in consts.TilePositions.items():
             tile = board.tiles[num]
             if tile.resource is not None and not tile.blocked:
-                choices.append(tile)
+                choices.append(num)
 
-        tile = random.choice(choices)
-        for other_tile in board.tiles:
-            other_tile.blocked = False
-        tile.blocked = True
+        num = (self.rng or random).choice(choices)
+        board.move_robber(num)
         settlements_blocking = consts.TileSettlementMap[num]
         players = []
         for settlement in board.settlements:
@@ -448,8 +399,8 @@ class ComputerPlayer(Player):
     # Randomly places cities 
     def place_city(self, board, settlement=None):
         choices = [settlement for settlement in board.settlements if settlement.player == self and settlement.city == False]
-        settlement = random.choice(choices)
-        settlement.make_city()
+        settlement = (self.rng or random).choice(choices)
+        board.make_city(settlement)
 
 def is_inside(pos, box):
     if pos[0] < box[0]:
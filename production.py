@@ -0,0 +1,108 @@
+# Dice production index.
+# For every dice total, the resources a roll hands out as (owner, resource, amount)
+# entries, merged per owner and resource. Only the totals of tiles next to a changed
+# settlement, city or robber are rebuilt, so producing a roll is a single list walk.
+
+import consts
+import topology
+from dice import Dice
+from topology import NUM_VERTICES
+
+TOTALS = range(2, 13)
+# (total, probability) of every dice total
+DICE_ODDS = tuple(sorted(Dice().odds.items()))
+
+class Production(object):
+    """
+    Resources produced by each dice total. Owners are opaque keys chosen by the caller
+    (Player objects on the Board, player indexes in the engine).
+    """
+
+    def __init__(self, tiles, robber=-1):
+        # (resource, chit) per tile and the index of the blocked tile
+        self.tiles = tiles
+        self.robber = robber
+        self.owners = [None] * NUM_VERTICES
+        self.cities = bytearray(NUM_VERTICES)
+        # Producing tiles per chit and the merged entries per total
+        self.chit_tiles = [[] for _ in range(13)]
+        for tile, (resource, chit) in enumerate(tiles):
+            if resource is not None and chit is not None:
+                self.chit_tiles[chit].append(tile)
+        self.entries = [() for _ in range(13)]
+        for total in TOTALS:
+            self._rebuild(total)
+
+    @classmethod
+    def from_owners(cls, tiles, robber, vertex_owner, vertex_city):
+        """
+        Build an index keyed by player index given vertex owners as player numbers.
+        """
+        production = cls(tiles, robber)
+        for vertex, owner in enumerate(vertex_owner):
+            if owner:
+                production.owners[vertex] = owner - 1
+                production.cities[vertex] = 1 if vertex_city[vertex] else 0
+        for total in TOTALS:
+            production._rebuild(total)
+        return production
+
+    def yields(self, total):
+        """
+        The (owner, resource, amount) entries handed out when the dice show `total`.
+        """
+        return self.entries[total]
+
+    def expected_yields(self, odds=DICE_ODDS):
+        """
+        Expected resources per roll for every owner over all 11 totals, as a dict of
+        owner -> list of amounts indexed by resource. `odds` are the (total, probability)
+        pairs of the dice, those of two six-sided dice by default.
+        """
+        expected = {}
+        for total, probability in odds:
+            for owner, resource, amount in self.entries[total]:
+                if owner not in expected:
+                    expected[owner] = [0.0] * len(consts.ResourceMap)
+                expected[owner][resource] += probability * amount
+        return expected
+
+    def add_settlement(self, owner, vertex):
+        self.owners[vertex] = owner
+        self.cities[vertex] = 0
+        self._rebuild_vertex(vertex)
+
+    def remove_settlement(self, vertex):
+        self.owners[vertex] = None
+        self.cities[vertex] = 0
+        self._rebuild_vertex(vertex)
+
+    def set_city(self, vertex, city=True):
+        self.cities[vertex] = 1 if city else 0
+        self._rebuild_vertex(vertex)
+
+    def move_robber(self, tile):
+        previous, self.robber = self.robber, tile
+        for changed in set((previous, tile)):
+            if changed >= 0 and self.tiles[changed][1] is not None:
+                self._rebuild(self.tiles[changed][1])
+
+    # --- Helpers ---
+
+    def _rebuild_vertex(self, vertex):
+        for chit in set(self.tiles[tile][1] for tile in topology.VertexTiles[vertex]):
+            if chit is not None:
+                self._rebuild(chit)
+
+    def _rebuild(self, total):
+        amounts = {}
+        for tile in self.chit_tiles[total]:
+            if tile == self.robber:
+                continue
+            resource = self.tiles[tile][0]
+            for vertex in topology.TileVertices[tile]:
+                owner = self.owners[vertex]
+                if owner is not None:
+                    key = (owner, resource)
+                    amounts[key] = amounts.get(key, 0) + (2 if self.cities[vertex] else 1)
+        self.entries[total] = tuple((owner, resource, amount) for (owner, resource), amount in amounts.items())
@@ -0,0 +1,155 @@
+# Random number streams.
+# Every random draw of a game comes from a stream named after what it is for: the board
+# layout, the dice, the development card deck, the computer players' choices and the
+# agent's search (its tree, playouts and parallel workers). All streams of a game derive
+# from one seed, so a game replays exactly from its seed, and one purpose drawing more or
+# less (a longer search, say) does not shift the numbers any other purpose sees. Objects
+# given no stream keep drawing from the global `random` module.
+#
+# The batched streams pre-draw large blocks from NumPy generators (the `batch` extra in
+# pyproject.toml) and hand them out one by one, which is cheaper per call than the
+# Mersenne Twister behind `random` in the rollout loops. NumPy is only imported for them.
+
+import random
+from dice import Dice
+
+PURPOSES = ('board', 'dice', 'deck', 'policy', 'search')
+
+# Numbers pre-drawn per block by the batched streams
+BLOCK = 4096
+
+class Streams(object):
+    """
+    The independent random streams of one game, seeded from `seed` (a non-negative int).
+    `board`, `deck`, `policy` and `search` are random.Random-like generators and `dice`
+    is a Dice rolling from its own stream. With `batched`, they are BlockRandom and
+    BlockDice drawing from NumPy generators spawned from the seed.
+    """
+
+    def __init__(self, seed, batched=False, block=BLOCK):
+        self.seed = seed
+        self.batched = batched
+        self.block = block
+        self.board = self.stream('board')
+        self.deck = self.stream('deck')
+        self.policy = self.stream('policy')
+        self.search = self.stream('search')
+        if batched:
+            self.dice = BlockDice(self._generator('dice'), block=block)
+        else:
+            self.dice = Dice(rng=self.stream('dice'))
+
+    def stream(self, purpose):
+        """
+        A new generator for one of PURPOSES. The same seed and purpose always give the
+        same numbers.
+        """
+        if self.batched:
+            return BlockRandom(self._generator(purpose), block=self.block)
+        # A str seed is hashed with SHA-512, so it does not depend on PYTHONHASHSEED
+        return random.Random('%d/%s' % (self.seed, purpose))
+
+    def _generator(self, purpose):
+        import numpy as np
+        # Spawn keys make the purposes' sequences independent of each other
+        sequence = np.random.SeedSequence(self.seed, spawn_key=(PURPOSES.index(purpose),))
+        return np.random.Generator(np.random.PCG64(sequence))
+
+class BlockRandom(random.Random):
+    """
+    A random.Random drawing its floats in blocks from a NumPy Generator. random(),
+    choice(), randrange() and randint() hand out pre-drawn numbers; everything else
+    (choices, shuffle, ...) is built on random() by the base class, except
+    getrandbits(), which comes from a Mersenne Twister seeded from the generator.
+    """
+
+    def __init__(self, generator, block=BLOCK):
+        self.generator = generator
+        self.block = block
+        self._values = []
+        self._draw = iter(self._values).__next__
+        super().__init__(int(generator.integers(2 ** 63)))
+
+    def __reduce__(self):
+        # random.Random pickles as a call with no arguments, ours need the generator. The
+        # call seeds the twister from the copied generator, so the generator's state goes
+        # along too and is put back after it, with the rest of the current block: the copy
+        # draws what this one would, across blocks.
+        return self.__class__, (self.generator, self.block), (self.getstate(), self.generator.bit_generator.state, self._rest())
+
+    def __setstate__(self, state):
+        twister, generator, self._values = state
+        self._draw = iter(self._values).__next__
+        self.setstate(twister)
+        self.generator.bit_generator.state = generator
+
+    def _rest(self):
+        # Numbers left in the current block. The iterator cannot be pickled on its own,
+        # but reduces to its position, so this copies the rest without consuming it.
+        position = self._draw.__self__.__reduce__()
+        if len(position) < 3:
+            return []
+        return self._values[position[2]:]
+
+    def _refill(self):
+        self._values = self.generator.random(self.block).tolist()
+        self._draw = iter(self._values).__next__
+        return self._draw()
+
+    def random(self):
+        try:
+            return self._draw()
+        except StopIteration:
+            return self._refill()
+
+    def choice(self, seq):
+        if not seq:
+            raise IndexError('Cannot choose from an empty sequence')
+        try:
+            return seq[int(self._draw() * len(seq))]
+        except StopIteration:
+            return seq[int(self._refill() * len(seq))]
+
+    def randrange(self, start, stop=None, step=1):
+        if step != 1:
+            return super().randrange(start, stop, step)
+        if stop is None:
+            start, stop = 0, start
+        if stop <= start:
+            raise ValueError('empty range in randrange(%d, %d)' % (start, stop))
+        try:
+            return start + int(self._draw() * (stop - start))
+        except StopIteration:
+            return start + int(self._refill() * (stop - start))
+
+    def randint(self, a, b):
+        return self.randrange(a, b + 1)
+
+class BlockDice(Dice):
+    """
+    Dice whose rolls are pre-drawn in blocks from a NumPy Generator.
+    """
+
+    def __init__(self, generator, number=2, sides=6, block=BLOCK):
+        super().__init__(number, sides)
+        self.generator = generator
+        self.block = block
+        self._rolls = []
+        self._next = 0
+
+    def roll(self):
+        if self._next == len(self._rolls):
+            self._rolls = self.generator.integers(1, self.sides + 1, size=(self.block, self.number)).tolist()
+            self._next = 0
+        roll = self._rolls[self._next]
+        self._next += 1
+        return roll
+
+def dice_for(rng):
+    """
+    Dice rolling from `rng` (None for the global `random` module), in blocks if it is a
+    BlockRandom.
+    """
+    if isinstance(rng, BlockRandom):
+        return BlockDice(rng.generator, block=rng.block)
+    return Dice(rng=rng)
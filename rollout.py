@@ -0,0 +1,208 @@
+# Rollout policies for the MCTS search.
+# When the agent ends its turn the search samples what the other players do until its
+# next roll. The players are ComputerPlayers, whose turn in the game is a loop of random
+# button picks (game.play_game). A policy plays the same turns straight on the Engine:
+# no buttons, closures, Player copies or drawing, just the choices and the engine calls.
+
+import random
+import consts
+from rng import dice_for
+from state import NUM_PLAYERS, NUM_RESOURCES, NUM_D_CARDS, PLAYED_D_CARD
+from topology import NUM_TILES, EdgeNeighbors, TileVertices
+
+# Cards a ComputerPlayer can play (a Point is never played)
+PLAYABLE = (consts.DCard.KNIGHT, consts.DCard.MONOPOLY, consts.DCard.ROAD_BUILDER, consts.DCard.YEAR_OF_PLENTY)
+
+# Choices of the turn menu
+END_TURN = 'end_turn'
+PURCHASE = 'purchase'
+EXCHANGE = 'exchange'
+PLAY_D_CARD = 'play_d_card'
+
+class RandomPolicy(object):
+    """
+    The ComputerPlayer's turn as engine calls, with the same distribution of play: after
+    the roll the player picks uniformly among End Turn, Make Purchase (if anything can be
+    bought) and Play D Card (if a card can be played), every sub-menu pick is uniform with
+    a cancel option, and every placement is uniform over the legal spots. A road with no
+    free edge to go on is skipped, where ComputerPlayer.place_road would fail.
+
+    The game's Exchange button is switched off (game.get_buttons), so a ComputerPlayer
+    never trades. With `exchanges`, Exchange (if a 4:1 trade is possible) joins the menu,
+    for opponents that do.
+
+    Subclasses can change any of the choose_* methods to play differently. Every draw,
+    rolls included, comes from `rng` (a random.Random, or the global random module).
+    """
+
+    def __init__(self, rng=None, exchanges=False):
+        self.exchanges = exchanges
+        self.set_rng(rng)
+
+    def set_rng(self, rng):
+        self.rng = rng
+        self.dice = dice_for(rng)
+
+    def play_others(self, engine, roll=True):
+        """
+        End the turn of the player holding it and play everybody else's turn until it comes
+        back or somebody wins (what follows Agent's end_turn). With `roll`, the returning
+        player's dice are rolled too.
+        """
+        start = engine.state.turn
+        engine.end_turn()
+        while engine.state.turn != start:
+            self.play_turn(engine)
+            if engine.state.winner() is not None:
+                return
+        if roll:
+            engine.roll(self.roll())
+
+    def play_turn(self, engine):
+        """
+        Roll the dice, pick from the turn menu until End Turn, and end the turn.
+        """
+        engine.roll(self.roll())
+        while self.step(engine):
+            pass
+        engine.end_turn()
+
+    def roll(self):
+        return sum(self.dice.roll())
+
+    def step(self, engine):
+        """
+        Make one pick from the turn menu and carry it out. Returns False on End Turn.
+        """
+        state = engine.state
+        p = state.turn
+        items = self.purchasable(engine, p)
+        exchanges = [r for r in range(NUM_RESOURCES) if state.hands[p * NUM_RESOURCES + r] >= 4] if self.exchanges else []
+        cards = [] if state.flags[p] & PLAYED_D_CARD else [
+                card for card in PLAYABLE for _ in range(state.d_cards[p * NUM_D_CARDS + card])
+        ]
+        menu = [END_TURN]
+        if items:
+            menu.append(PURCHASE)
+        if exchanges:
+            menu.append(EXCHANGE)
+        if cards:
+            menu.append(PLAY_D_CARD)
+
+        choice = self.choose_menu(engine, menu)
+        if choice == END_TURN:
+            return False
+        if choice == PURCHASE:
+            item = self.choose_item(engine, items)
+            if item is not None:
+                self.buy(engine, p, item)
+        elif choice == EXCHANGE:
+            given = self.choose_exchange(engine, exchanges)
+            if given is not None:
+                engine.exchange(given, -4, self.choose_resource(engine), 1)
+        else:
+            card = self.choose_card(engine, cards)
+            if card is not None:
+                self.play(engine, p, card)
+        return True
+
+    def purchasable(self, engine, p):
+        """
+        Items the player can afford and has a piece and a place for (Player.can_buy).
+        """
+        state = engine.state
+        items = []
+        for item in consts.Costs:
+            if not engine.can_afford(p, item):
+                continue
+            if item == 'road':
+                ok = state.roads_left[p] > 0 and len(engine.frontiers.roads[p]) > 0
+            elif item == 'settlement':
+                ok = state.settlements_left[p] > 0 and len(engine.frontiers.settlements[p]) > 0
+            elif item == 'city':
+                ok = state.cities_left[p] > 0 and len(self.city_spots(engine, p)) > 0
+            else:
+                ok = any(state.deck)
+            if ok:
+                items.append(item)
+        return items
+
+    def city_spots(self, engine, p):
+        state = engine.state
+        return [v for v, owner in enumerate(state.vertex_owner) if owner == p + 1 and not state.vertex_city[v]]
+
+    def buy(self, engine, p, item):
+        if item == 'road':
+            engine.place_road(self.choose_road(engine, engine.road_frontier(p)))
+        elif item == 'settlement':
+            engine.place_settlement(self.choose_vertex(engine, sorted(engine.frontiers.settlements[p])))
+        elif item == 'city':
+            engine.place_city(self.choose_vertex(engine, self.city_spots(engine, p)))
+        else:
+            engine.buy_dcard()
+
+    def play(self, engine, p, card):
+        state = engine.state
+        if card == consts.DCard.KNIGHT:
+            tiles = [tile for tile in range(NUM_TILES) if state.tiles[tile][0] is not None and tile != state.robber]
+            tile = self.choose_tile(engine, tiles)
+            owners = set(state.vertex_owner[v] for v in TileVertices[tile])
+            victims = [other for other in range(NUM_PLAYERS) if other != p and other + 1 in owners]
+            victim = self.choose_victim(engine, victims) if victims else None
+            hand = None if victim is None else state.hands[victim * NUM_RESOURCES:(victim + 1) * NUM_RESOURCES]
+            if hand is None or not any(hand):
+                engine.play_knight(tile)
+            else:
+                # A random card of the victim's hand
+                engine.play_knight(tile, victim, (self.rng or random).choices(range(NUM_RESOURCES), weights=hand, k=1)[0])
+        elif card == consts.DCard.MONOPOLY:
+            engine.play_monopoly(self.choose_resource(engine))
+        elif card == consts.DCard.YEAR_OF_PLENTY:
+            engine.play_yop(self.choose_resource(engine), self.choose_resource(engine))
+        else:
+            # Two free roads, placed one after the other
+            first = self.free_road(engine, p, ())
+            second = self.free_road(engine, p, () if first is None else (first,))
+            engine.play_roadbuilder(first, second)
+
+    def free_road(self, engine, p, placed):
+        # A road builder road, or None without a piece or a free edge for it
+        if engine.state.roads_left[p] <= len(placed):
+            return None
+        frontier = set(engine.frontiers.roads[p])
+        for edge in placed:
+            # The first road is only placed once the card is played, add the edges it opens
+            frontier.discard(edge)
+            frontier.update(other for other in EdgeNeighbors[edge] if not engine.state.edge_owner[other] and other not in placed)
+        return self.choose_road(engine, sorted(frontier)) if frontier else None
+
+    # --- Choices, uniform like ComputerPlayer.pick_option ---
+
+    def choose_menu(self, engine, menu):
+        return (self.rng or random).choice(menu)
+
+    def choose_item(self, engine, items):
+        # None is the cancel button
+        return (self.rng or random).choice(items + [None])
+
+    def choose_exchange(self, engine, resources):
+        return (self.rng or random).choice(resources + [None])
+
+    def choose_card(self, engine, cards):
+        # One button per card held, so a card type is picked in proportion to its count
+        return (self.rng or random).choice(cards + [None])
+
+    def choose_resource(self, engine):
+        return (self.rng or random).randrange(NUM_RESOURCES)
+
+    def choose_road(self, engine, edges):
+        return (self.rng or random).choice(edges)
+
+    def choose_vertex(self, engine, vertices):
+        return (self.rng or random).choice(vertices)
+
+    def choose_tile(self, engine, tiles):
+        return (self.rng or random).choice(tiles)
+
+    def choose_victim(self, engine, victims):
+        return (self.rng or random).choice(victims)
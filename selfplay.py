@@ -0,0 +1,114 @@
+# Headless self-play runner.
+# Plays many complete games across a process pool and streams one JSON line per game as
+# games finish, e.g.
+#   python selfplay.py --games 10000 --seats ACCC --workers 32 --out results.jsonl
+# Seats are given per player number: A is the MCTS Agent, C a ComputerPlayer.
+
+import argparse
+import json
+import sys
+import time
+from multiprocessing import Pool
+
+import game
+from agent import Agent
+from board import Board
+from player import ComputerPlayer
+from rng import Streams
+
+SEAT_TYPES = {
+        'A': Agent,
+        'C': ComputerPlayer,
+}
+
+def make_players(seats, streams=None):
+    """
+    Players for a seat string such as 'ACCC', numbered from 1 in seat order. With the
+    game's streams, Agents search with the search stream and ComputerPlayers pick with
+    the policy stream.
+    """
+    players = []
+    for number, seat in enumerate(seats, 1):
+        if streams is None:
+            players.append(SEAT_TYPES[seat](number))
+        else:
+            players.append(SEAT_TYPES[seat](number, rng=streams.search if seat == 'A' else streams.policy))
+    return players
+
+def play_one(job):
+    """
+    Play one seeded game from the draft to the end and return its result, with the time
+    of every decision as (player number, seconds) in 'move_times'.
+    """
+    index, seed, seats, ports_enabled, max_turns, batched = job
+    # Every game draws from its own streams, so a result only depends on its seed
+    streams = Streams(seed, batched)
+    start = time.perf_counter()
+    board = Board(ports_enabled=ports_enabled, rng=streams.board, deck_rng=streams.deck)
+    players = make_players(seats, streams)
+    game.pick_settlements(players, board)
+    move_times = []
+    winner, turns, _ = game.play_game(board, players, streams.dice, max_turns, move_times)
+    return {
+            'game': index,
+            'seed': seed,
+            'seats': seats,
+            'winner': winner.number if winner is not None else None,
+            'turns': turns,
+            'points': [
+                player.points + len([card for card in player.d_cards if card.label == 'Point'])
+                for player in players
+            ],
+            'seconds': time.perf_counter() - start,
+            'move_times': move_times,
+    }
+
+def run(games, seats='ACCC', workers=None, seed=0, ports_enabled=True, max_turns=None, batched=False):
+    """
+    Play `games` games across a pool of `workers` processes (one per core by default),
+    yielding every result as soon as its game finishes. Game i is seeded with seed + i,
+    and with `batched` draws from NumPy blocks (see rng.py).
+    """
+    jobs = [(i, seed + i, seats, ports_enabled, max_turns, batched) for i in range(games)]
+    with Pool(workers) as pool:
+        for result in pool.imap_unordered(play_one, jobs):
+            yield result
+
+def main():
+    parser = argparse.ArgumentParser(description="Catan headless self-play")
+    parser.add_argument('--games', type=int, default=100, help="Number of games to play")
+    parser.add_argument('--seats', default='ACCC', help="Player type per seat, A (Agent) or C (ComputerPlayer)")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: one per core)")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the first game, game i uses seed + i")
+    parser.add_argument('--max-turns', type=int, default=None, help="Stop a game without a winner after this many turns")
+    parser.add_argument('--disable-ports', action='store_true', help="Disable ports in the game")
+    parser.add_argument('--batched-rng', action='store_true', help="Draw random numbers in NumPy blocks (needs numpy)")
+    parser.add_argument('--out', default=None, help="Write results to this file instead of stdout")
+    args = parser.parse_args()
+
+    if len(args.seats) != 4 or any(seat not in SEAT_TYPES for seat in args.seats):
+        parser.error("--seats needs one of %s for each of the 4 seats" % ''.join(SEAT_TYPES))
+
+    out = open(args.out, 'w') if args.out else sys.stdout
+    wins = [0] * len(args.seats)
+    turns = 0
+    played = 0
+    start = time.perf_counter()
+    for result in run(args.games, args.seats, args.workers, args.seed, not args.disable_ports, args.max_turns,
+                      args.batched_rng):
+        out.write(json.dumps(result) + '\n')
+        out.flush()
+        played += 1
+        turns += result['turns']
+        if result['winner'] is not None:
+            wins[result['winner'] - 1] += 1
+    if out is not sys.stdout:
+        out.close()
+
+    elapsed = time.perf_counter() - start
+    print('%d games in %.1fs, mean %.1f turns' % (played, elapsed, turns / max(played, 1)), file=sys.stderr)
+    for number, (seat, won) in enumerate(zip(args.seats, wins), 1):
+        print('Player %d (%s): %d wins (%.1f%%)' % (number, seat, won, 100.0 * won / max(played, 1)), file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+# Compact, array-backed game state used by the MCTS search.
+# Board and Player objects point at each other through Settlement and Road, so
+# copying them means copying the whole object graph. GameState keeps the same
+# information in a few fixed-size arrays that can be cloned for a few hundred bytes.
+
+from array import array
+import random
+import consts
+from player import Settlement, Road
+from topology import NUM_VERTICES, NUM_EDGES
+
+NUM_PLAYERS = 4
+NUM_RESOURCES = len(consts.ResourceMap)
+NUM_D_CARDS = len(consts.DCardMap)
+
+# Bits stored per player in GameState.flags
+LONGEST_ROAD = 1
+LARGEST_ARMY = 2
+PLAYED_D_CARD = 4
+
+class GameState(object):
+    """
+    Snapshot of a game: who owns which vertex and edge, every player's hand, cards,
+    pieces and points, and the development card deck as counts per card type.
+
+    Players are referred to by index (player.number - 1). Per player data is stored
+    row-major, e.g. the ore held by player p is hands[p * NUM_RESOURCES + Resource.ORE].
+    """
+    __slots__ = ("tiles", "robber", "turn",
+                 "vertex_owner", "vertex_city", "edge_owner",
+                 "hands", "d_cards", "d_card_queue", "deck",
+                 "points", "settlements_left", "roads_left", "cities_left",
+                 "knights", "flags")
+
+    def __init__(self, tiles, robber=-1):
+        # (resource, chit) of every tile, never modified so clones share it
+        self.tiles = tiles
+        # Index of the blocked tile, -1 if no tile is blocked
+        self.robber = robber
+        # Index of the player whose turn it is
+        self.turn = 0
+
+        # Board: owner of each vertex and edge as a player number, 0 if empty
+        self.vertex_owner = bytearray(NUM_VERTICES)
+        self.vertex_city = bytearray(NUM_VERTICES)
+        self.edge_owner = bytearray(NUM_EDGES)
+
+        # Cards: resources and development cards per player, remaining deck per card type
+        self.hands = array('i', [0]) * (NUM_PLAYERS * NUM_RESOURCES)
+        self.d_cards = bytearray(NUM_PLAYERS * NUM_D_CARDS)
+        self.d_card_queue = bytearray(NUM_PLAYERS * NUM_D_CARDS)
+        self.deck = bytearray(NUM_D_CARDS)
+
+        # Per player counters
+        self.points = bytearray(NUM_PLAYERS)
+        self.settlements_left = array('b', [5] * NUM_PLAYERS)
+        self.roads_left = array('b', [15] * NUM_PLAYERS)
+        self.cities_left = array('b', [4] * NUM_PLAYERS)
+        self.knights = bytearray(NUM_PLAYERS)
+        self.flags = bytearray(NUM_PLAYERS)
+
+    def clone(self):
+        """
+        Return an independent copy of this state (the static tile layout is shared).
+        """
+        other = GameState.__new__(GameState)
+        other.tiles = self.tiles
+        other.robber = self.robber
+        other.turn = self.turn
+        other.vertex_owner = self.vertex_owner[:]
+        other.vertex_city = self.vertex_city[:]
+        other.edge_owner = self.edge_owner[:]
+        other.hands = self.hands[:]
+        other.d_cards = self.d_cards[:]
+        other.d_card_queue = self.d_card_queue[:]
+        other.deck = self.deck[:]
+        other.points = self.points[:]
+        other.settlements_left = self.settlements_left[:]
+        other.roads_left = self.roads_left[:]
+        other.cities_left = self.cities_left[:]
+        other.knights = self.knights[:]
+        other.flags = self.flags[:]
+        return other
+
+    def __eq__(self, other):
+        if not isinstance(other, GameState):
+            return NotImplemented
+        return all(getattr(self, slot) == getattr(other, slot) for slot in GameState.__slots__)
+
+    __hash__ = None
+
+    def victory_points(self, p):
+        """
+        Points of player p including the point cards in their hand (same rule as utils.get_winner).
+        """
+        return self.points[p] + self.d_cards[p * NUM_D_CARDS + consts.DCard.POINT]
+
+    def winner(self):
+        """
+        Index of the first player with at least 10 victory points, None if nobody has won yet.
+        """
+        for p in range(NUM_PLAYERS):
+            if self.victory_points(p) >= 10:
+                return p
+        return None
+
+    @classmethod
+    def from_game(cls, board, players, turn=0):
+        """
+        Build a GameState from a Board and its list of Player objects.
+        """
+        tiles = tuple((tile.resource, tile.chit) for tile in board.tiles)
+        robber = next((i for i, tile in enumerate(board.tiles) if tile.blocked), -1)
+        state = cls(tiles, robber)
+        state.turn = turn
+
+        for settlement in board.settlements:
+            state.vertex_owner[settlement.number] = settlement.player.number
+            state.vertex_city[settlement.number] = 1 if settlement.city else 0
+        for road in board.roads:
+            state.edge_owner[road.number] = road.player.number
+
+        for card in board.d_cards:
+            state.deck[consts.DCardMap.index(card.label)] += 1
+
+        for player in players:
+            p = player.number - 1
+            for resource in range(NUM_RESOURCES):
+                state.hands[p * NUM_RESOURCES + resource] = player.hand.get(resource, 0)
+            for card in player.d_cards:
+                state.d_cards[p * NUM_D_CARDS + consts.DCardMap.index(card.label)] += 1
+            for card in player.d_card_queue:
+                state.d_card_queue[p * NUM_D_CARDS + consts.DCardMap.index(card.label)] += 1
+            state.points[p] = player.points
+            state.settlements_left[p] = player.settlements_left
+            state.roads_left[p] = player.roads_left
+            state.cities_left[p] = player.cities_left
+            state.knights[p] = player.knights
+            state.flags[p] = (
+                    (LONGEST_ROAD if player.longest_road else 0)
+                    | (LARGEST_ARMY if player.largest_army else 0)
+                    | (PLAYED_D_CARD if player.played_d_card else 0)
+            )
+        return state
+
+    def restore(self, board, players):
+        """
+        Write this state back into an existing Board and its Player objects, replacing
+        their settlements, roads, cards and counters. The deck order is not part of the
+        state, so the rebuilt deck is shuffled (with the board's deck stream).
+        """
+        # Imported here because board imports agent, which imports this module
+        from board import DCards
+
+        by_number = {player.number: player for player in players}
+
+        for i, tile in enumerate(board.tiles):
+            tile.blocked = i == self.robber
+
+        board.settlements = []
+        for vertex, owner in enumerate(self.vertex_owner):
+            if owner:
+                settlement = Settlement(by_number[owner], vertex)
+                settlement.city = bool(self.vertex_city[vertex])
+                board.settlements.append(settlement)
+        board.roads = [
+                Road(by_number[owner], edge)
+                for edge, owner in enumerate(self.edge_owner) if owner
+        ]
+        board.rebuild_indexes()
+
+        board.d_cards = [DCards[c] for c in range(NUM_D_CARDS) for _ in range(self.deck[c])]
+        (board.deck_rng or random).shuffle(board.d_cards)
+
+        for player in players:
+            p = player.number - 1
+            for resource in range(NUM_RESOURCES):
+                player.hand[resource] = self.hands[p * NUM_RESOURCES + resource]
+            row = p * NUM_D_CARDS
+            player.d_cards = [DCards[c] for c in range(NUM_D_CARDS) for _ in range(self.d_cards[row + c])]
+            player.d_card_queue = [DCards[c] for c in range(NUM_D_CARDS) for _ in range(self.d_card_queue[row + c])]
+            player.points = self.points[p]
+            player.settlements_left = self.settlements_left[p]
+            player.roads_left = self.roads_left[p]
+            player.cities_left = self.cities_left[p]
+            player.knights = self.knights[p]
+            player.longest_road = bool(self.flags[p] & LONGEST_ROAD)
+            player.largest_army = bool(self.flags[p] & LARGEST_ARMY)
+            player.played_d_card = bool(self.flags[p] & PLAYED_D_CARD)
@@ -0,0 +1,344 @@
+# Engine regression checks, headless: python testEngine.py (or pytest testEngine.py).
+# Random action sequences are applied through an Engine and undone again. Every undo
+# must bring back the same state and Zobrist hash, and longest road, production and
+# frontier indexes equal to the ones rebuilt from scratch. A settlement cutting the
+# longest road must move the award, on the Engine and on a Board. Expected yields must
+# match the yields of every total weighted by its odds. Copies of a searched Agent leave
+# its reused subtree behind. Action codes, build frontiers and Road Builder pairs are
+# checked against brute force, chance nodes against the exact odds, and a self-play game
+# must replay from its seed.
+
+import collections
+import copy
+import importlib.util
+import pickle
+import random
+
+import actions
+import consts
+import game
+import selfplay
+import topology
+import zobrist
+from agent import Agent, Node, CARD, DICE
+from board import Board
+from dice import Dice
+from engine import Action, Engine
+from frontier import Frontiers
+from longest_road import LongestRoad
+from player import ComputerPlayer, Road, Settlement
+from production import Production
+from rng import Streams
+from rollout import RandomPolicy
+from state import GameState, LONGEST_ROAD, NUM_D_CARDS, NUM_EDGES, NUM_RESOURCES
+from transposition import Stats, TranspositionTable
+
+SEEDS = range(10)
+MAX_STEPS = 1500
+
+def drafted(seed):
+    # Engine on a seeded game right after the settlement draft
+    streams = Streams(seed)
+    board = Board(ports_enabled=True, rng=streams.board, deck_rng=streams.deck)
+    players = [ComputerPlayer(number, rng=streams.policy) for number in range(1, 5)]
+    game.pick_settlements(players, board)
+    return Engine(GameState.from_game(board, players), streams.search), streams
+
+def check_indexes(engine):
+    state = engine.state
+    assert engine.hash == zobrist.hash_state(state)
+    assert engine.roads.lengths == LongestRoad.from_owners(state.vertex_owner, state.edge_owner).lengths
+    production = Production.from_owners(state.tiles, state.robber, state.vertex_owner, state.vertex_city)
+    assert engine.production.entries == production.entries
+    frontiers = Frontiers.from_owners(state.vertex_owner, state.edge_owner)
+    assert engine.frontiers.roads == frontiers.roads
+    assert engine.frontiers.settlements == frontiers.settlements
+    assert engine.frontiers.open_vertices == frontiers.open_vertices
+
+def test_apply_undo_restores():
+    for seed in SEEDS:
+        engine, streams = drafted(seed)
+        rng = random.Random(seed)
+        policy = RandomPolicy(rng)
+        # State and engine depth after every step
+        snapshots = [(engine.state.clone(), engine.depth())]
+        for _ in range(MAX_STEPS):
+            if engine.state.winner() is not None:
+                break
+            draw = rng.random()
+            if draw < 0.1:
+                policy.play_turn(engine)
+            elif draw < 0.3:
+                engine.roll(sum(streams.dice.roll()))
+            else:
+                engine.apply(rng.choice(engine.legal_actions()))
+            snapshots.append((engine.state.clone(), engine.depth()))
+            assert engine.hash == zobrist.hash_state(engine.state), seed
+            if rng.random() < 0.1:
+                back = rng.randint(1, min(5, len(snapshots) - 1))
+                del snapshots[-back:]
+                engine.undo_to(snapshots[-1][1])
+                assert engine.state == snapshots[-1][0], seed
+                check_indexes(engine)
+        engine.undo_to(0)
+        assert engine.state == snapshots[0][0], seed
+        assert engine.hash == engine.root_hash, seed
+        check_indexes(engine)
+
+def path(length, avoid=()):
+    # (vertices, edges) of a simple path of `length` edges that keeps clear of `avoid`
+    def extend(vertices, edges):
+        if len(edges) == length:
+            return vertices, edges
+        for edge in topology.VertexEdges[vertices[-1]]:
+            vertex = topology.other_end(edge, vertices[-1])
+            if vertex not in vertices and vertex not in avoid:
+                found = extend(vertices + [vertex], edges + [edge])
+                if found:
+                    return found
+        return None
+    for start in range(topology.NUM_VERTICES):
+        if start not in avoid:
+            found = extend([start], [])
+            if found:
+                return found
+    raise ValueError("No path of %d edges" % length)
+
+def cut_road_layout():
+    # Player 2 holds the longest road with 6 roads, player 1 has 5 roads elsewhere
+    long_vertices, long_edges = path(6)
+    near = set(long_vertices)
+    for vertex in long_vertices:
+        near.update(topology.VertexNeighbors[vertex])
+    short_vertices, short_edges = path(5, near)
+    return long_vertices, long_edges, short_edges
+
+def test_settlement_cut_moves_longest_road_engine():
+    long_vertices, long_edges, short_edges = cut_road_layout()
+    state = GameState.from_game(Board(), [])
+    for edge in long_edges:
+        state.edge_owner[edge] = 2
+    for edge in short_edges:
+        state.edge_owner[edge] = 1
+    state.roads_left[1] -= len(long_edges)
+    state.roads_left[0] -= len(short_edges)
+    state.flags[1] = LONGEST_ROAD
+    state.points[1] = 2
+    for resource, amount in consts.Costs['settlement'].items():
+        state.hands[resource] = amount
+    engine = Engine(state)
+    before, hash_before = state.clone(), engine.hash
+
+    # Player 1 settles in the middle of player 2's road, leaving it two roads of 3
+    engine.place_settlement(long_vertices[3])
+    assert engine.road_length(1) == 3
+    assert state.flags[0] & LONGEST_ROAD and not state.flags[1] & LONGEST_ROAD
+    assert (state.points[0], state.points[1]) == (3, 0)
+    assert engine.hash == zobrist.hash_state(state)
+
+    engine.undo()
+    assert state == before
+    assert engine.hash == hash_before
+    check_indexes(engine)
+
+def test_settlement_cut_moves_longest_road_board():
+    long_vertices, long_edges, short_edges = cut_road_layout()
+    board = Board()
+    players = [ComputerPlayer(number) for number in range(1, 5)]
+    for edge in long_edges:
+        board.add_road(Road(players[1], edge))
+    for edge in short_edges:
+        board.add_road(Road(players[0], edge))
+    board.check_longest_road(players[1])
+    assert players[1].longest_road and players[1].points == 2
+
+    board.add_settlement(Settlement(players[0], long_vertices[3]))
+    assert board.check_road_length(players[1]) == 3
+    assert players[0].longest_road and not players[1].longest_road
+    assert (players[0].points, players[1].points) == (2, 0)
+
+def test_expected_yields():
+    odds = Dice().odds
+    for seed in SEEDS:
+        engine, _ = drafted(seed)
+        production = engine.production
+        expected = {}
+        for total in range(2, 13):
+            for owner, resource, amount in production.yields(total):
+                expected.setdefault(owner, [0.0] * len(consts.ResourceMap))
+                expected[owner][resource] += odds[total] * amount
+        found = production.expected_yields()
+        assert found.keys() == expected.keys(), seed
+        for owner, amounts in expected.items():
+            assert all(abs(a - b) < 1e-12 for a, b in zip(found[owner], amounts)), seed
+
+def test_agent_copy_leaves_tree():
+    streams = Streams(0)
+    board = Board(ports_enabled=True, rng=streams.board, deck_rng=streams.deck)
+    agent = Agent(1, iterations=300, time_budget=None, workers=1, rng=streams.search)
+    players = [agent] + [ComputerPlayer(number, rng=streams.policy) for number in range(2, 5)]
+    game.pick_settlements(players, board)
+    size = len(pickle.dumps(agent))
+    agent.mcts(board, players)
+    assert agent.tree is not None
+    # The copy made by get_buttons for every turn must not grow with the search
+    copied = copy.deepcopy(players)[0]
+    assert copied.tree is None
+    assert agent.tree is not None
+    assert len(pickle.dumps(agent)) < 2 * size
+
+def walk(seed, steps=400):
+    # Engine after every step of a seeded random game, rolling often so pieces get built
+    engine, streams = drafted(seed)
+    rng = random.Random(seed)
+    for _ in range(steps):
+        if engine.state.winner() is not None:
+            return
+        if rng.random() < 0.3:
+            engine.roll(sum(streams.dice.roll()))
+        else:
+            engine.apply(rng.choice(engine.legal_actions()))
+        yield engine
+
+def road_edges(edge_owner, number):
+    # Free edges next to one of the player's roads
+    return set(edge for edge in range(NUM_EDGES)
+               if not edge_owner[edge] and any(edge_owner[other] == number for other in topology.EdgeNeighbors[edge]))
+
+def open_vertex(vertex_owner, vertex):
+    return not vertex_owner[vertex] and not any(vertex_owner[other] for other in topology.VertexNeighbors[vertex])
+
+def code_of(action):
+    # The action code an Action decoded by Action.from_code was made from
+    args = action.args
+    if action.name == 'end_turn':
+        return actions.END_TURN
+    if action.name == 'buy_dcard':
+        return actions.BUY_D_CARD
+    if action.name == 'place_road':
+        return actions.PLACE_ROAD + args['position']
+    if action.name == 'place_settlement':
+        return actions.PLACE_SETTLEMENT + args['position']
+    if action.name == 'place_city':
+        return actions.PLACE_CITY + args['settlement']
+    if action.name == 'make_exchange':
+        assert (args['amt1'], args['amt2']) == (-actions.EXCHANGE_RATE, 1)
+        return actions.EXCHANGE + args['r1'] * NUM_RESOURCES + args['r2']
+    if action.name == 'play_monopoly':
+        return actions.MONOPOLY + args['resourceType']
+    if action.name == 'play_yop':
+        return actions.YEAR_OF_PLENTY + args['resource1'] * NUM_RESOURCES + args['resource2']
+    assert action.name == 'play_roadbuilder'
+    return actions.ROAD_BUILDER + args['pos1'] * NUM_EDGES + args['pos2']
+
+def test_action_codes_round_trip():
+    for code in range(actions.NUM_ACTIONS):
+        assert code_of(Action.from_code(code)) == code, code
+    try:
+        actions.decode(actions.NUM_ACTIONS)
+    except ValueError:
+        return
+    raise AssertionError(actions.NUM_ACTIONS)
+
+def test_frontiers_brute_force():
+    for seed in SEEDS:
+        for engine in walk(seed):
+            state = engine.state
+            frontiers = engine.frontiers
+            open_vertices = set(vertex for vertex in range(topology.NUM_VERTICES) if open_vertex(state.vertex_owner, vertex))
+            assert frontiers.open_vertices == open_vertices, seed
+            for p in range(4):
+                assert frontiers.roads[p] == road_edges(state.edge_owner, p + 1), seed
+                settlements = set(vertex for vertex in open_vertices
+                                  if any(state.edge_owner[edge] == p + 1 for edge in topology.VertexEdges[vertex]))
+                assert frontiers.settlements[p] == settlements, seed
+
+def test_road_builder_pairs_brute_force():
+    for seed in SEEDS:
+        for step, engine in enumerate(walk(seed)):
+            if step % 10:
+                continue
+            edge_owner = engine.state.edge_owner
+            for p in range(4):
+                # Every set of two roads reachable one after the other, in any order
+                expected = set()
+                for first in road_edges(edge_owner, p + 1):
+                    after = bytearray(edge_owner)
+                    after[first] = p + 1
+                    for second in road_edges(after, p + 1):
+                        expected.add(frozenset((first, second)))
+                pairs = engine.road_builder_pairs(p)
+                assert len(pairs) == len(expected), seed
+                assert set(frozenset(pair) for pair in pairs) == expected, seed
+                for first, second in pairs:
+                    assert engine.can_place_road(p, first), seed
+
+def test_chance_node_odds():
+    draws = 6000
+    engine, _ = drafted(0)
+    agent = Agent(1, rng=random.Random(0))
+    root = Node(engine, table=TranspositionTable())
+
+    # Dice: every total is drawn and weighted with its probability
+    odds = Dice().odds
+    node = Node(engine, root, chance=DICE)
+    counts = collections.Counter()
+    depth = engine.depth()
+    for _ in range(draws):
+        child, _ = node.descend(engine, agent)
+        counts[engine.history[-1][1]] += 1
+        engine.undo_to(depth)
+    assert set(node.outcomes) == set(odds)
+    for total, (child, weight, outcome) in node.outcomes.items():
+        assert outcome == total and weight == odds[total]
+        assert abs(counts[total] / draws - odds[total]) < 0.02, total
+
+    # The node's value weights its outcomes' means by their probabilities
+    for i, (child, weight, _) in enumerate(node.outcomes.values()):
+        child.stats = Stats()
+        child.stats.visits, child.stats.value = i + 1, float(i)
+    expected = sum(weight * i / (i + 1) for i, (_, weight, _) in enumerate(node.outcomes.values()))
+    assert abs(node.mean() - expected / sum(odds.values())) < 1e-12
+
+    # Cards: drawn in proportion to the cards left in the deck
+    state = engine.state
+    for resource, amount in consts.Costs['d_card'].items():
+        state.hands[state.turn * NUM_RESOURCES + resource] += amount
+    engine = Engine(state)
+    deck = list(state.deck)
+    node = Node(engine, Node(engine, table=TranspositionTable()), actions.BUY_D_CARD, chance=CARD)
+    counts = collections.Counter()
+    depth = engine.depth()
+    for _ in range(draws):
+        node.descend(engine, agent)
+        for card in range(NUM_D_CARDS):
+            if state.deck[card] != deck[card]:
+                counts[card] += 1
+        engine.undo_to(depth)
+        assert list(state.deck) == deck
+    assert set(node.outcomes) == set(card for card, count in enumerate(deck) if count)
+    for card, (child, weight, outcome) in node.outcomes.items():
+        assert weight == deck[card] / sum(deck)
+        assert abs(counts[card] / draws - weight) < 0.02, card
+
+def test_selfplay_replays_from_seed():
+    modes = [False]
+    if importlib.util.find_spec('numpy') is not None:
+        modes.append(True)
+    for batched in modes:
+        for seed in range(2):
+            job = (0, seed, 'ACCC', True, 100, batched)
+            results = []
+            for _ in range(2):
+                result = selfplay.play_one(job)
+                # Timings differ between runs, the (player, decision) sequence does not
+                result['move_times'] = [number for number, _ in result.pop('move_times')]
+                del result['seconds']
+                results.append(result)
+            assert results[0] == results[1], (seed, batched)
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print('ok', name)
@@ -0,0 +1,45 @@
+# Board topology as integer lookup tables, built once at import from consts.
+# Vertices are settlement numbers (keys of consts.SettlementPositions), edges are road
+# numbers (indexes into consts.Roads) and tiles are indexes into Board.tiles.
+# Legality checks use these instead of comparing screen coordinates.
+
+import consts
+
+NUM_VERTICES = len(consts.SettlementPositions)
+NUM_EDGES = len(consts.Roads)
+NUM_TILES = len(consts.TilePositions)
+
+# The two vertices at the ends of each edge
+EdgeVertices = tuple(tuple(road) for road in consts.Roads)
+
+# Edges touching each vertex
+VertexEdges = tuple(
+        tuple(edge for edge, ends in enumerate(EdgeVertices) if vertex in ends)
+        for vertex in range(NUM_VERTICES)
+)
+
+# Vertices one edge away from each vertex
+VertexNeighbors = tuple(
+        tuple(EdgeVertices[edge][1] if EdgeVertices[edge][0] == vertex else EdgeVertices[edge][0] for edge in edges)
+        for vertex, edges in enumerate(VertexEdges)
+)
+
+# Edges sharing a vertex with each edge
+EdgeNeighbors = tuple(
+        tuple(other for vertex in ends for other in VertexEdges[vertex] if other != edge)
+        for edge, ends in enumerate(EdgeVertices)
+)
+
+# Vertices around each tile and tiles around each vertex (in consts.TileSettlementMap order)
+TileVertices = tuple(tuple(consts.TileSettlementMap[tile]) for tile in range(NUM_TILES))
+VertexTiles = tuple(
+        tuple(tile for tile in consts.TileSettlementMap if vertex in consts.TileSettlementMap[tile])
+        for vertex in range(NUM_VERTICES)
+)
+
+def other_end(edge, vertex):
+    """
+    The vertex at the other end of an edge.
+    """
+    a, b = EdgeVertices[edge]
+    return b if a == vertex else a
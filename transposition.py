@@ -0,0 +1,55 @@
+# Transposition table for the MCTS search.
+# Nodes reached by different move orders (two roads in either order, the same exchange
+# made at different times) stand for the same GameState. They find one shared Stats
+# entry through the state's Zobrist hash (Engine.hash), so their visits add up.
+
+class Stats(object):
+    """
+    Visit count and cumulative reward of a search state.
+    """
+    __slots__ = ("visits", "value")
+
+    def __init__(self):
+        self.visits = 0
+        self.value = 0.0
+
+class TranspositionTable(object):
+    """
+    Bounded map from Zobrist hash to Stats. Each of the 2**bits buckets holds two entries:
+    the first keeps the most visited state seen in the bucket, the second is replaced by
+    every new state. An entry pushed out of the table lives on in the nodes holding it,
+    it is just no longer shared.
+    """
+
+    def __init__(self, bits=16):
+        self.mask = (1 << bits) - 1
+        # bucket index -> [key, stats, key, stats]
+        self.buckets = {}
+        self.hits = 0
+
+    def __len__(self):
+        return sum(1 if bucket[2] is None else 2 for bucket in self.buckets.values())
+
+    def lookup(self, key):
+        """
+        Stats of the state with the given hash, added to the table if it is new.
+        """
+        index = key & self.mask
+        bucket = self.buckets.get(index)
+        if bucket is None:
+            stats = Stats()
+            self.buckets[index] = [key, stats, None, None]
+            return stats
+        if bucket[0] == key:
+            self.hits += 1
+            return bucket[1]
+        if bucket[2] == key:
+            self.hits += 1
+            return bucket[3]
+
+        # Keep the more visited of the two entries in the first slot, replace the second
+        if bucket[3] is not None and bucket[3].visits > bucket[1].visits:
+            bucket[0], bucket[1] = bucket[2], bucket[3]
+        stats = Stats()
+        bucket[2], bucket[3] = key, stats
+        return stats
@@ -1,4 +1,4 @@
-from draw import print_screen
+from view import print_screen
 import consts
 
 def end_section():
@@ -41,14 +41,9 @@ def get_possible_purchases(player, board, players, screen=None, cancel=True):
     return can_afford
 
 def give_resources(board, total):
-    for num, tile in enumerate(board.tiles):
-        if tile.resource is not None and not tile.blocked and tile.chit == total:
-            for settlement_number in consts.TileSettlementMap[num]:
-                for settlement in board.settlements:
-                    if settlement.number == settlement_number:
-                        settlement.player.take_resource(tile.resource)
-                        if settlement.city:
-                            settlement.player.take_resource(tile.resource)
+    for player, resource, amount in board.production.yields(total):
+        for _ in range(amount):
+            player.take_resource(resource)
 
 def get_winner(players):
     for player in players:
@@ -0,0 +1,62 @@
+# Optional rendering and mouse input for the game logic.
+# Board, players, agent and utils go through these functions instead of draw and pygame.
+# With no screen (headless games and search simulations) pygame is never imported. The
+# screen can also be a viewer.Viewer, which draws in a process of its own.
+
+import sys
+
+def print_screen(screen, board, text, players, buttons=[]):
+    """
+    Draw the game with draw.print_screen, or do nothing when there is no screen.
+    """
+    if screen is None:
+        return
+    from viewer import Viewer
+    if isinstance(screen, Viewer):
+        screen.print_screen(board, text, players, buttons)
+        return
+    import draw
+    draw.print_screen(screen, board, text, players, buttons)
+
+def wait_for_click():
+    """
+    Wait for a mouse click and return its position. Exits when the window is closed.
+    """
+    import pygame
+    while True:
+        event = pygame.event.wait()
+        if event.type == pygame.QUIT:
+            sys.exit()
+        elif event.type == pygame.MOUSEBUTTONUP:
+            return event.pos
+
+def handle_events(screen):
+    """
+    Drain pending window events, exiting when the window is closed. Does nothing without a screen
+    (or with a Viewer, which handles the events of its window).
+    """
+    if screen is None:
+        return
+    from viewer import Viewer
+    if isinstance(screen, Viewer):
+        return
+    import pygame
+    for event in pygame.event.get():
+        if event.type == pygame.QUIT:
+            sys.exit()
+
+def wait_for_quit(screen):
+    """
+    Keep the window open until it is closed. Returns at once without a screen.
+    """
+    if screen is None:
+        return
+    from viewer import Viewer
+    if isinstance(screen, Viewer):
+        screen.wait_for_quit()
+        return
+    import pygame
+    while True:
+        event = pygame.event.wait()
+        if event.type == pygame.QUIT:
+            sys.exit()
@@ -0,0 +1,126 @@
+# Game window in a process of its own.
+# A Viewer stands in for the pygame screen of the view functions. A print_screen sends a
+# compact snapshot (the GameState, the dialog text and the button labels) through a queue
+# with room for a single frame and returns at once. While the viewer process has not taken
+# the last frame yet, the game is ahead of the window and the frame is skipped before any
+# snapshot is taken. The viewer draws at most `fps` times a second, so a fast game between
+# computer players never waits for the window. Nothing can be clicked in it, it only
+# shows the game.
+
+import multiprocessing
+import queue
+import consts
+
+VIEWER_FPS = 30
+
+# Sent to the viewer process to close the window
+_CLOSE = 'close'
+
+class Viewer(object):
+    """
+    A window drawing snapshots of a game in a separate process.
+    """
+
+    def __init__(self, ports_enabled=True, fps=VIEWER_FPS):
+        self.snapshots = multiprocessing.Queue(maxsize=1)
+        # (board, text, players, labels) of the last skipped frame, sent on close if no
+        # later frame got through, so the window ends on the final position
+        self.skipped = None
+        self.process = multiprocessing.Process(target=_run, args=(self.snapshots, ports_enabled, fps), daemon=True)
+        self.process.start()
+
+    def print_screen(self, board, text, players, buttons=[]):
+        labels = [button['label'] for button in buttons]
+        # Once the window is closed the game goes on without it
+        if not self.process.is_alive():
+            return
+        if self.snapshots.full():
+            self.skipped = (board, text, players, labels)
+            return
+        self.skipped = None
+        self.snapshots.put_nowait(self._snapshot(board, text, players, labels))
+
+    def _snapshot(self, board, text, players, labels):
+        # Imported here because board imports agent, which imports the state module
+        from state import GameState
+        return GameState.from_game(board, players), text, labels
+
+    def _flush(self):
+        # Send the skipped frame if no later one got through
+        if self.skipped is not None:
+            self._send(self._snapshot(*self.skipped))
+            self.skipped = None
+
+    def _send(self, item):
+        # Wait for the frame slot, unless the window gets closed in the meantime
+        while self.process.is_alive():
+            try:
+                self.snapshots.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def wait_for_quit(self):
+        """
+        Wait until the window is closed, showing the last frame.
+        """
+        self._flush()
+        self.process.join()
+
+    def close(self):
+        """
+        Close the window once the snapshots sent so far are drawn.
+        """
+        self._flush()
+        self._send(_CLOSE)
+        self.process.join()
+
+def _run(snapshots, ports_enabled, fps):
+    # The viewer process: draw the newest snapshot every frame until the window is closed
+    import pygame
+    import draw
+    from player import Player
+    from state import NUM_PLAYERS
+
+    pygame.init()
+    screen = pygame.display.set_mode(consts.SCREEN_SIZE)
+    clock = pygame.time.Clock()
+    players = [Player(number) for number in range(1, NUM_PLAYERS + 1)]
+    board = layout = None
+    closing = False
+    while not closing:
+        snapshot = None
+        while True:
+            try:
+                item = snapshots.get_nowait()
+            except queue.Empty:
+                break
+            if item == _CLOSE:
+                closing = True
+            else:
+                snapshot = item
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                return
+        if snapshot is not None:
+            state, text, labels = snapshot
+            if state.tiles != layout:
+                board = _board(state.tiles, ports_enabled)
+                layout = state.tiles
+            state.restore(board, players)
+            draw.print_screen(screen, board, text, players, [{'label': label} for label in labels])
+        clock.tick(fps)
+    pygame.quit()
+
+def _board(tiles, ports_enabled):
+    # A Board with the layout of a snapshot's tiles, the pieces are filled in by restore
+    from board import Board, ResourceTile, DesertTile
+    board = Board(ports_enabled=ports_enabled)
+    board.tiles = []
+    for i, (resource, chit) in enumerate(tiles):
+        tile = DesertTile() if resource is None else ResourceTile(resource)
+        tile.set_location(i)
+        if chit is not None:
+            tile.set_chit(chit)
+        board.tiles.append(tile)
+    return board
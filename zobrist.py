@@ -0,0 +1,54 @@
+# Zobrist hashing of GameState.
+# Every (cell, value) pair of the hashed arrays has a random 64-bit key and the hash of a
+# state is the XOR of the keys of its current values, so changing one cell updates the
+# hash with two XORs. The Engine keeps Engine.hash up to date this way.
+
+import random
+from state import NUM_PLAYERS, NUM_RESOURCES, NUM_D_CARDS
+from topology import NUM_VERTICES, NUM_EDGES, NUM_TILES
+
+# Counts (cards, points, knights) are hashed modulo MAX_COUNT
+MAX_COUNT = 256
+COUNT_MASK = MAX_COUNT - 1
+
+# A private generator so the keys are the same in every process and drawing them does
+# not move the game's random module
+_rng = random.Random(0x2A7B)
+
+def _keys(cells, values):
+    return tuple(tuple(_rng.getrandbits(64) for _ in range(values)) for _ in range(cells))
+
+VERTEX_OWNER = _keys(NUM_VERTICES, NUM_PLAYERS + 1)
+VERTEX_CITY = _keys(NUM_VERTICES, 2)
+EDGE_OWNER = _keys(NUM_EDGES, NUM_PLAYERS + 1)
+HANDS = _keys(NUM_PLAYERS * NUM_RESOURCES, MAX_COUNT)
+D_CARDS = _keys(NUM_PLAYERS * NUM_D_CARDS, MAX_COUNT)
+D_CARD_QUEUE = _keys(NUM_PLAYERS * NUM_D_CARDS, MAX_COUNT)
+DECK = _keys(NUM_D_CARDS, MAX_COUNT)
+POINTS = _keys(NUM_PLAYERS, MAX_COUNT)
+KNIGHTS = _keys(NUM_PLAYERS, MAX_COUNT)
+FLAGS = _keys(NUM_PLAYERS, 8)
+TURN = _keys(1, NUM_PLAYERS)
+# Indexed by robber + 1, since the robber is -1 when no tile is blocked
+ROBBER = _keys(1, NUM_TILES + 1)
+
+def hash_state(state):
+    """
+    Zobrist hash of a GameState, computed from scratch.
+    """
+    h = TURN[0][state.turn] ^ ROBBER[0][state.robber + 1]
+    for table, cells, mask in (
+            (VERTEX_OWNER, state.vertex_owner, None),
+            (VERTEX_CITY, state.vertex_city, None),
+            (EDGE_OWNER, state.edge_owner, None),
+            (FLAGS, state.flags, None),
+            (HANDS, state.hands, COUNT_MASK),
+            (D_CARDS, state.d_cards, COUNT_MASK),
+            (D_CARD_QUEUE, state.d_card_queue, COUNT_MASK),
+            (DECK, state.deck, COUNT_MASK),
+            (POINTS, state.points, COUNT_MASK),
+            (KNIGHTS, state.knights, COUNT_MASK),
+    ):
+        for index, value in enumerate(cells):
+            h ^= table[index][value if mask is None else value & mask]
+    return h